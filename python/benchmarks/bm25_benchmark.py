@@ -0,0 +1,98 @@
+"""
+Benchmark BM25 chunk ranking: `rank_bm25.BM25Plus` vs the CSR `BM25Matrix`.
+
+Builds a synthetic corpus with a Zipf-like term distribution and times
+ranking the top 5 chunks for a set of queries.
+
+Usage (from the `python` directory):
+
+    python -m benchmarks.bm25_benchmark --sizes 10000 100000 1000000
+
+`rank_bm25` keeps a dict of term frequencies per chunk, so at 1M chunks it
+needs several GB of memory; pass `--skip-baseline` to only time the matrix.
+"""
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+from rank_bm25 import BM25Plus
+from sidecar.references.index import BM25Index, BM25Matrix, make_doc_id
+
+VOCABULARY_SIZE = 50_000
+NUM_QUERIES = 20
+
+
+def make_corpus(
+    num_chunks: int, tokens_per_chunk: int, seed: int = 0
+) -> list[list[str]]:
+    rng = np.random.default_rng(seed)
+    term_ids = rng.zipf(1.2, size=(num_chunks, tokens_per_chunk)) % VOCABULARY_SIZE
+    return [[f"t{i}" for i in row] for row in term_ids]
+
+
+def make_queries(seed: int = 1) -> list[list[str]]:
+    rng = np.random.default_rng(seed)
+    return [
+        [f"t{i}" for i in rng.integers(0, 2_000, size=rng.integers(2, 8))]
+        for _ in range(NUM_QUERIES)
+    ]
+
+
+def build_index(corpus: list[list[str]]) -> BM25Index:
+    # fill the postings directly: creating a Reference per chunk would
+    # dominate the setup time at 1M chunks
+    index = BM25Index("bm25_index.json")
+    for i, tokens in enumerate(corpus):
+        doc_id = make_doc_id(f"ref{i}", 0)
+        index.doc_lengths[doc_id] = len(tokens)
+        index.total_length += len(tokens)
+        for term in tokens:
+            postings = index.postings.setdefault(term, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+    return index
+
+
+def time_queries(rank, queries: list[list[str]]) -> float:
+    """
+    Returns the mean time in milliseconds to rank a query.
+    """
+    start = time.perf_counter()
+    for query in queries:
+        rank(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def run(num_chunks: int, tokens_per_chunk: int, skip_baseline: bool) -> None:
+    corpus = make_corpus(num_chunks, tokens_per_chunk)
+    queries = make_queries()
+
+    start = time.perf_counter()
+    matrix = BM25Matrix(build_index(corpus))
+    build_s = time.perf_counter() - start
+
+    matrix_ms = time_queries(lambda q: matrix.get_top_n(q, n=5), queries)
+
+    if skip_baseline:
+        baseline = "skipped"
+        speedup = ""
+    else:
+        bm25 = BM25Plus(corpus)
+        baseline_ms = time_queries(lambda q: bm25.get_top_n(q, corpus, n=5), queries)
+        baseline = f"{baseline_ms:10.2f} ms"
+        speedup = f"{baseline_ms / matrix_ms:8.1f}x"
+
+    print(
+        f"{num_chunks:>10,} chunks | build {build_s:6.1f} s | "
+        f"BM25Plus {baseline} | BM25Matrix {matrix_ms:8.2f} ms | {speedup}"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--tokens-per-chunk", type=int, default=150)
+    parser.add_argument("--skip-baseline", action="store_true")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.tokens_per_chunk, args.skip_baseline)
@@ -0,0 +1,102 @@
+"""
+Benchmark chat retrieval latency for each retrieval mode (bm25, vector, hybrid).
+
+Builds a synthetic library with a Zipf-like term distribution and times
+`Chat.get_relevant_documents` (top `CHAT_CONTEXT_CANDIDATES` chunks) for a
+set of queries, over the whole library or, with `--subset`, over that many
+selected references.
+
+Usage (from the `python` directory):
+
+    python -m benchmarks.retrieval_benchmark --sizes 10000 100000 --subset 10
+"""
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+from sidecar.ai.chat import Chat
+from sidecar.ai.ranker import create_ranker
+from sidecar.ai.schemas import RetrievalMode
+from sidecar.references.schemas import Chunk, IngestStatus, Reference
+from sidecar.references.storage import JsonStorage
+
+VOCABULARY_SIZE = 50_000
+NUM_QUERIES = 20
+CHUNKS_PER_REFERENCE = 20
+
+
+def make_storage(dirpath: str, num_chunks: int, tokens_per_chunk: int) -> JsonStorage:
+    rng = np.random.default_rng(0)
+    references = []
+    for i in range(0, num_chunks, CHUNKS_PER_REFERENCE):
+        size = min(CHUNKS_PER_REFERENCE, num_chunks - i)
+        term_ids = rng.zipf(1.2, size=(size, tokens_per_chunk)) % VOCABULARY_SIZE
+        chunks = [Chunk(text=" ".join(f"t{t}" for t in row)) for row in term_ids]
+        references.append(
+            Reference(id=f"ref{i}", status=IngestStatus.COMPLETE, chunks=chunks)
+        )
+
+    # references are only kept in memory: the indexes are built from them
+    storage = JsonStorage(Path(dirpath).joinpath("references.json"))
+    storage.references = references
+    storage.create_corpus()
+    return storage
+
+
+def make_queries(seed: int = 1) -> list[str]:
+    rng = np.random.default_rng(seed)
+    return [
+        " ".join(f"t{i}" for i in rng.integers(0, 2_000, size=rng.integers(2, 8)))
+        for _ in range(NUM_QUERIES)
+    ]
+
+
+def run(num_chunks: int, tokens_per_chunk: int, subset: int = None) -> None:
+    queries = make_queries()
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        storage = make_storage(dirpath, num_chunks, tokens_per_chunk)
+
+        start = time.perf_counter()
+        _ = storage.bm25_index.matrix
+        _ = storage.vector_index
+        build_s = time.perf_counter() - start
+
+        reference_ids = None
+        if subset:
+            rng = np.random.default_rng(2)
+            selected = rng.choice(len(storage.references), size=subset, replace=False)
+            reference_ids = [storage.references[i].id for i in selected]
+
+        timings = []
+        for mode in RetrievalMode:
+            ranker = create_ranker(storage, mode, reference_ids=reference_ids)
+            chats = [
+                Chat(input_text=q, storage=storage, ranker=ranker) for q in queries
+            ]
+
+            chats[0].get_relevant_documents()  # warm up
+            start = time.perf_counter()
+            for chat in chats:
+                chat.get_relevant_documents()
+            elapsed_ms = (time.perf_counter() - start) / len(chats) * 1000
+            timings.append(f"{mode} {elapsed_ms:7.2f} ms")
+
+    scope = f"{subset} references" if subset else "all references"
+    print(
+        f"{num_chunks:>10,} chunks | {scope} | build {build_s:6.1f} s | "
+        + " | ".join(timings)
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--tokens-per-chunk", type=int, default=150)
+    parser.add_argument("--subset", type=int, default=None)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.tokens_per_chunk, args.subset)
@@ -0,0 +1,95 @@
+"""
+Benchmark sidecar start-up: import-time profile and time to first status.
+
+Prints the slowest imports of `sidecar.api` (cumulative, from
+`python -X importtime`), then spawns `main.py serve` and times how long
+`GET /api/meta/status` takes to answer after the process is spawned.
+Exits with status 1 if the slowest start exceeds `--budget` seconds.
+
+Usage (from the `python` directory):
+
+    python -m benchmarks.startup_benchmark --runs 5 --budget 1.5
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from argparse import ArgumentParser
+
+
+def profile_imports(top: int) -> None:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import sidecar.api"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        rows.append((int(cumulative), name.rstrip()))
+
+    total_us = next(us for us, name in rows if name.strip() == "sidecar.api")
+    print(f"import sidecar.api: {total_us / 1e6:.2f} s, slowest imports:")
+    for cumulative_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:9.1f} ms  {name}")
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_status(timeout: float = 30) -> float:
+    port = get_free_port()
+    env = {
+        **os.environ,
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "PRELOAD_LAZY_MODULES": "false",
+    }
+    url = f"http://127.0.0.1:{port}/api/meta/status"
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "serve"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"No status response after {timeout} s")
+    finally:
+        process.kill()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    profile_imports(args.top)
+
+    timings = [time_to_status() for _ in range(args.runs)]
+    print(
+        f"time to first status: median {statistics.median(timings):.2f} s | "
+        f"max {max(timings):.2f} s | budget {args.budget:.2f} s"
+    )
+    if max(timings) > args.budget:
+        sys.exit(1)
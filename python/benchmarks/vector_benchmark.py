@@ -0,0 +1,95 @@
+"""
+Benchmark chunk vector search: exact vs IVF nearest-neighbour search.
+
+Builds a memory-mapped `VectorIndex` of synthetic clustered unit vectors and
+times retrieving the top 5 chunks for a set of queries, reporting the recall
+of the IVF search against exact search.
+
+Usage (from the `python` directory):
+
+    python -m benchmarks.vector_benchmark --sizes 10000 100000 1000000
+"""
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+from sidecar.config import EMBEDDING_DIM
+from sidecar.references.index import make_doc_id, top_n_indices
+from sidecar.references.vectors import VectorIndex
+
+NUM_QUERIES = 50
+NUM_TOPICS = 2_000
+
+
+def make_vectors(num_rows: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((NUM_TOPICS, EMBEDDING_DIM), dtype=np.float32)
+    vectors = np.empty((num_rows, EMBEDDING_DIM), dtype=np.float32)
+    for start in range(0, num_rows, 100_000):
+        end = min(start + 100_000, num_rows)
+        labels = rng.integers(0, NUM_TOPICS, size=end - start)
+        noise = rng.standard_normal((end - start, EMBEDDING_DIM), dtype=np.float32)
+        batch = topics[labels] + 0.5 * noise
+        vectors[start:end] = batch / np.linalg.norm(batch, axis=1, keepdims=True)
+    return vectors
+
+
+def build_index(dirpath: str, vectors: np.ndarray) -> VectorIndex:
+    # fill the index directly: embedding text would dominate the setup time
+    index = VectorIndex(dirpath, ivf_min_docs=0)
+    index.doc_ids = [make_doc_id(f"ref{i}", 0) for i in range(len(vectors))]
+    index.reference_signatures = {f"ref{i}": "" for i in range(len(vectors))}
+    index.vectors = vectors
+    index.save()
+    index.load()
+    return index
+
+
+def run(num_rows: int, nprobe: int) -> None:
+    # queries are drawn from the same topics as the chunks
+    vectors = make_vectors(num_rows + NUM_QUERIES)
+    queries = vectors[num_rows:].copy()
+    vectors = vectors[:num_rows]
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        start = time.perf_counter()
+        index = build_index(dirpath, vectors)
+        build_s = time.perf_counter() - start
+        del vectors
+        index.nprobe = nprobe
+
+        def search_exact(query):
+            return top_n_indices(np.asarray(index.vectors) @ query, 5)
+
+        def search_ivf(query):
+            rows, _ = index.ivf.search(index.vectors, query, 5, index.nprobe)
+            return rows
+
+        timings = {}
+        results = {}
+        for name, search in [("exact", search_exact), ("ivf", search_ivf)]:
+            search(queries[0])  # warm up the page cache
+            start = time.perf_counter()
+            results[name] = [set(search(query)) for query in queries]
+            timings[name] = (time.perf_counter() - start) / NUM_QUERIES * 1000
+
+        recall = np.mean(
+            [len(a & b) / 5 for a, b in zip(results["exact"], results["ivf"])]
+        )
+
+    print(
+        f"{num_rows:>10,} chunks | build {build_s:6.1f} s | "
+        f"exact {timings['exact']:8.2f} ms | "
+        f"IVF (nprobe={nprobe}) {timings['ivf']:6.2f} ms | recall@5 {recall:.2f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--nprobe", type=int, default=16)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.nprobe)
@@ -1,5 +1,6 @@
 import inspect
 import json
+import multiprocessing
 from argparse import ArgumentParser
 
 from sidecar import config
@@ -28,6 +29,10 @@ def get_arg_parser():
 
 
 if __name__ == "__main__":
+    # PDF text extraction uses `spawn` worker processes, which need this
+    # when running as a frozen (pyinstaller) executable
+    multiprocessing.freeze_support()
+
     parser = get_arg_parser()
     args = parser.parse_args()
 
@@ -1,18 +1,23 @@
+from __future__ import annotations
+
+import time
 from typing import AsyncGenerator
 
-import litellm
-import openai
-from openai.error import AuthenticationError
+from fastapi.concurrency import run_in_threadpool
 from requests.exceptions import ConnectionError
+from sidecar.ai.context import pack_context
 from sidecar.ai.prompts import create_prompt_for_chat, prepare_chunks_for_prompt
-from sidecar.ai.ranker import BM25Ranker
+from sidecar.ai.ranker import BM25Ranker, HybridRanker, VectorRanker, create_ranker
 from sidecar.ai.schemas import ChatRequest, ChatResponse, ChatResponseChoice
-from sidecar.config import logger
+from sidecar.config import CHAT_CONTEXT_CANDIDATES, CHAT_CONTEXT_MAX_TOKENS, logger
 from sidecar.references.storage import JsonStorage, get_references_json_storage
 from sidecar.settings.schemas import FlatSettingsSchema, ModelProvider
 from sidecar.typing import ResponseStatus
 from tenacity import retry, stop_after_attempt, wait_fixed
 
+# `litellm` and `openai` are imported where they are used, as loading them
+# takes most of the sidecar's start-up time (see `benchmarks/startup_benchmark.py`)
+
 
 def get_missing_references_message() -> str:
     return (
@@ -79,6 +84,9 @@ async def yield_response(
     This is a generator function that yields responses from the chat API.
     Only used for streaming responses to the client.
     """
+    import openai
+    from openai.error import AuthenticationError
+
     input_text = request.text
     temperature = request.temperature
 
@@ -90,14 +98,21 @@ async def yield_response(
     storage = get_references_json_storage(user_id="user1", project_id=project_id)
     logger.info(f"Loaded {len(storage.chunks)} documents from storage")
 
-    if not storage.chunks:
+    reference_ids = request.reference_ids or None
+    if not storage.count_chunks(reference_ids):
         # no reference chunks available for chat
         return yield_error_message(get_missing_references_message)
 
     if user_settings.model_provider == ModelProvider.OPENAI and not openai.api_key:
         return yield_error_message(get_missing_api_key_error_message)
 
-    ranker = BM25Ranker(storage=storage)
+    ranker = create_ranker(
+        storage=storage,
+        mode=request.retrieval_mode,
+        reference_ids=reference_ids,
+        fusion=request.fusion,
+        vector_weight=request.vector_weight,
+    )
     chat = Chat(
         input_text=input_text,
         storage=storage,
@@ -128,6 +143,9 @@ async def ask_question(
     project_id: str = None,
     user_settings: FlatSettingsSchema = None,
 ) -> ChatResponse:
+    import openai
+    from openai.error import AuthenticationError
+
     input_text = request.text
     n_choices = request.n_choices
     temperature = request.temperature
@@ -141,7 +159,8 @@ async def ask_question(
     logger.info(f"Loaded {len(storage.chunks)} documents from storage")
 
     # no reference chunks available for chatQ
-    if not storage.chunks:
+    reference_ids = request.reference_ids or None
+    if not storage.count_chunks(reference_ids):
         response = create_chat_response(
             status=ResponseStatus.ERROR,
             message=get_missing_references_message(),
@@ -158,7 +177,13 @@ async def ask_question(
         )
         return response
 
-    ranker = BM25Ranker(storage=storage)
+    ranker = create_ranker(
+        storage=storage,
+        mode=request.retrieval_mode,
+        reference_ids=reference_ids,
+        fusion=request.fusion,
+        vector_weight=request.vector_weight,
+    )
     chat = Chat(
         input_text=input_text,
         storage=storage,
@@ -208,18 +233,50 @@ class Chat:
         self,
         input_text: str,
         storage: JsonStorage,
-        ranker: BM25Ranker,
+        ranker: BM25Ranker | VectorRanker | HybridRanker,
         model_provider: ModelProvider = ModelProvider.OPENAI,
         model: str = "gpt-3.5-turbo",
+        context_max_tokens: int = CHAT_CONTEXT_MAX_TOKENS,
     ):
         self.input_text = input_text
         self.ranker = ranker
         self.storage = storage
         self.model_provider = model_provider
         self.model = model
+        self.context_max_tokens = context_max_tokens
+
+    def get_context(self) -> str:
+        """
+        Returns the most relevant passages of the references, formatted for
+        the prompt. Retrieval and token counting are CPU-bound (and loading
+        the tokenizer may download it), so callers on the event loop run
+        this in a thread.
+        """
+        logger.info(
+            f"Fetching {CHAT_CONTEXT_CANDIDATES} most relevant document chunks "
+            "from storage"
+        )
+        docs = self.get_relevant_documents()
+
+        passages, num_tokens = pack_context(
+            docs, max_tokens=self.context_max_tokens, model=self.model
+        )
+        logger.info(
+            f"Packed {len(docs)} document chunks into {len(passages)} passages "
+            f"of {num_tokens} tokens (budget {self.context_max_tokens})"
+        )
+        return prepare_chunks_for_prompt(chunks=passages)
 
     def get_relevant_documents(self):
-        docs = self.ranker.get_top_n(query=self.input_text, limit=5)
+        start = time.perf_counter()
+        docs = self.ranker.get_top_n(
+            query=self.input_text, limit=CHAT_CONTEXT_CANDIDATES
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(
+            f"Retrieved {len(docs)} document chunks with "
+            f"{type(self.ranker).__name__} in {elapsed_ms:.1f} ms"
+        )
         return docs
 
     @retry(stop=stop_after_attempt(3), wait=wait_fixed(1), reraise=True)
@@ -246,6 +303,8 @@ class Chat:
             params["api_base"] = "http://localhost:11434"
             params["custom_llm_provider"] = "ollama"
 
+        import litellm
+
         response = await litellm.acompletion(**params)
         logger.info(f"Received response from chat API: {response}")
         return response
@@ -265,13 +324,9 @@ class Chat:
     async def ask_question(
         self, n_choices: int = 1, temperature: float = 0.7, stream: bool = False
     ) -> dict:
-        logger.info("Fetching 5 most relevant document chunks from storage")
-
-        docs = self.get_relevant_documents()
+        context_str = await run_in_threadpool(self.get_context)
 
         logger.info("Creating input prompt for chat API")
-
-        context_str = prepare_chunks_for_prompt(chunks=docs)
         prompt = create_prompt_for_chat(query=self.input_text, context=context_str)
         messages = self.prepare_messages_for_chat(text=prompt)
 
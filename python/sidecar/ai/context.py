@@ -0,0 +1,146 @@
+"""
+Packing of retrieved chunks into the context of a chat prompt.
+
+Chunks are taken best ranked first for as long as they fit in a budget of
+prompt tokens, counted with the model's tokenizer. Chunks of the same page
+overlap (see `shared.chunk_reference`), so the chunks of a page that are
+next to each other are merged into a single passage and their shared text
+is only included (and counted) once.
+"""
+from __future__ import annotations
+
+import math
+from functools import lru_cache
+
+from sidecar.ai.prompts import format_chunk_for_prompt
+from sidecar.config import CHAT_CONTEXT_MAX_TOKENS, logger
+from sidecar.references.schemas import Chunk
+
+logger = logger.getChild(__name__)
+
+# used to estimate token counts when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """
+    Returns the tiktoken encoding for a model (`cl100k_base` for models that
+    tiktoken does not know), or None if it cannot be loaded: tiktoken
+    downloads its encodings on first use.
+    """
+    try:
+        # imported on first use, as loading an encoding is slow
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Unable to load a tokenizer, token counts are estimated: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def merge_chunk_texts(first: str, second: str, overlap: int = 200) -> str | None:
+    """
+    Returns the text of two chunks of a page without their overlapping text,
+    or None if the chunks are not next to each other.
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    if overlap > 0 and first[-overlap:] == second[:overlap]:
+        return first + second[overlap:]
+    if overlap > 0 and second[-overlap:] == first[:overlap]:
+        return second + first[overlap:]
+    return None
+
+
+def get_page(chunk: Chunk) -> tuple:
+    return chunk.metadata.get("source_filename"), chunk.metadata.get("page_num")
+
+
+def add_to_passages(
+    passages: list[Chunk], chunk: Chunk, overlap: int = 200
+) -> list[Chunk]:
+    """
+    Returns the passages with a chunk added, merged with every passage of
+    the same page that it is next to. The merged passage takes the place of
+    the first passage it was merged with.
+    """
+    text = chunk.text
+    merged = []
+    for i, passage in enumerate(passages):
+        if get_page(passage) != get_page(chunk):
+            continue
+        merged_text = merge_chunk_texts(passage.text, text, overlap)
+        if merged_text is not None:
+            text = merged_text
+            merged.append(i)
+
+    if not merged:
+        return passages + [chunk]
+
+    position = merged[0]
+    passage = passages[position].copy(update={"text": text})
+    return [
+        passage if i == position else p
+        for i, p in enumerate(passages)
+        if i == position or i not in merged
+    ]
+
+
+def pack_context(
+    chunks: list[Chunk],
+    max_tokens: int = CHAT_CONTEXT_MAX_TOKENS,
+    model: str = "gpt-3.5-turbo",
+    overlap: int = 200,
+) -> tuple[list[Chunk], int]:
+    """
+    Selects the passages to include in a chat prompt's context.
+
+    Parameters
+    ----------
+    chunks : list[Chunk]
+        Retrieved chunks, best ranked first
+    max_tokens : int
+        Maximum number of tokens of the context, as formatted for the prompt
+    model : str
+        Model whose tokenizer counts the tokens
+    overlap : int, default 200
+        Number of characters that consecutive chunks of a page share
+
+    Returns
+    -------
+    list[Chunk]
+        Passages, in the order of their best ranked chunk. A chunk that does
+        not fit in the remaining budget is skipped, but later (shorter or
+        overlapping) chunks may still be included.
+    int
+        Number of tokens of the passages, as formatted for the prompt
+    """
+    token_counts: dict[str, int] = {}
+
+    def count_passage_tokens(passage: Chunk) -> int:
+        text = format_chunk_for_prompt(passage)
+        if text not in token_counts:
+            token_counts[text] = count_tokens(text, model)
+        return token_counts[text]
+
+    passages: list[Chunk] = []
+    num_tokens = 0
+    for chunk in chunks:
+        candidate = add_to_passages(passages, chunk, overlap)
+        candidate_tokens = sum(count_passage_tokens(p) for p in candidate)
+        if candidate_tokens <= max_tokens:
+            passages, num_tokens = candidate, candidate_tokens
+    return passages, num_tokens
@@ -26,12 +26,13 @@ def create_prompt_for_text_completion(request: TextCompletionRequest) -> str:
     return prompt
 
 
+def format_chunk_for_prompt(chunk: Chunk) -> str:
+    source_str = f"\nSource: {chunk.metadata['source_filename']}, p{chunk.metadata['page_num']}"  # noqa: E501
+    return f"{source_str} - {chunk.text}\n"
+
+
 def prepare_chunks_for_prompt(chunks: list[Chunk]) -> str:
-    text = ""
-    for chunk in chunks:
-        source_str = f"\nSource: {chunk.metadata['source_filename']}, p{chunk.metadata['page_num']}"  # noqa: E501
-        text += f"{source_str} - {chunk.text}\n"
-    return text
+    return "".join(format_chunk_for_prompt(chunk) for chunk in chunks)
 
 
 def create_prompt_for_chat(query: str, context: str) -> str:
@@ -1,12 +1,28 @@
-from rank_bm25 import BM25Plus
+from concurrent.futures import ThreadPoolExecutor
+
+from sidecar.ai.schemas import FusionMethod, RetrievalMode
+from sidecar.references.index import parse_doc_id, tokenize
 from sidecar.references.schemas import Chunk
 from sidecar.references.storage import JsonStorage
 
+# candidate generation for hybrid retrieval: the vector search runs here
+# while the BM25 search runs on the calling thread (both release the GIL
+# for most of their time in numpy)
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ranker")
+
+
+def get_chunks(storage: JsonStorage, doc_ids: list[str]) -> list[Chunk]:
+    """
+    Returns the chunks for a list of index doc ids, in order.
+    """
+    return [storage.get_chunk(*parse_doc_id(doc_id)) for doc_id in doc_ids]
+
 
 class BM25Ranker:
-    def __init__(self, storage: JsonStorage):
+    def __init__(self, storage: JsonStorage, reference_ids: list[str] = None):
         self.storage = storage
-        self.ranker = BM25Plus(self.storage.tokenized_corpus)
+        # only rank the chunks of these references, if given
+        self.reference_ids = reference_ids
 
     def get_top_n(self, query: str, limit: int = 5) -> list[Chunk]:
         """
@@ -23,6 +39,180 @@ class BM25Ranker:
         -------
         docs : list[Chunk]
         """
-        tokenized_query = query.lower().split()
-        docs = self.ranker.get_top_n(tokenized_query, self.storage.chunks, n=limit)
-        return docs
+        with self.storage.lock:
+            doc_ids = [doc_id for doc_id, _ in self.get_top_n_with_scores(query, limit)]
+            return get_chunks(self.storage, doc_ids)
+
+    def get_top_n_with_scores(
+        self, query: str, limit: int = 5
+    ) -> list[tuple[str, float]]:
+        tokenized_query = tokenize(query)
+        return self.storage.bm25_index.get_top_n_with_scores(
+            tokenized_query, n=limit, reference_ids=self.reference_ids
+        )
+
+
+class VectorRanker:
+    def __init__(
+        self, storage: JsonStorage, exact: bool = None, reference_ids: list[str] = None
+    ):
+        self.storage = storage
+        self.exact = exact
+        # only rank the chunks of these references, if given
+        self.reference_ids = reference_ids
+
+    def get_top_n(self, query: str, limit: int = 5) -> list[Chunk]:
+        """
+        Rank documents by the similarity of their embeddings to the input text
+
+        Parameters
+        ----------
+        query : str
+            Input text to be used as query
+        limit : int, default 5
+            Number of documents to return
+
+        Returns
+        -------
+        docs : list[Chunk]
+        """
+        with self.storage.lock:
+            doc_ids = [doc_id for doc_id, _ in self.get_top_n_with_scores(query, limit)]
+            return get_chunks(self.storage, doc_ids)
+
+    def get_top_n_with_scores(
+        self, query: str, limit: int = 5
+    ) -> list[tuple[str, float]]:
+        return self.storage.vector_index.search_with_scores(
+            query, n=limit, exact=self.exact, reference_ids=self.reference_ids
+        )
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[str]], weights: list[float], k: int = 60
+) -> list[str]:
+    """
+    Merges rankings of doc ids by reciprocal rank fusion: each doc scores
+    `weight / (k + rank)` in every ranking it appears in.
+    Ties keep the order in which docs were first seen.
+    """
+    scores: dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def weighted_score_fusion(
+    scored_rankings: list[list[tuple[str, float]]], weights: list[float]
+) -> list[str]:
+    """
+    Merges scored rankings of doc ids by a weighted sum of their scores,
+    min-max normalized per ranking (BM25 and cosine scores are on different
+    scales). Docs missing from a ranking score 0 for it.
+    Ties keep the order in which docs were first seen.
+    """
+    scores: dict[str, float] = {}
+    for ranking, weight in zip(scored_rankings, weights):
+        if not ranking:
+            continue
+        values = [score for _, score in ranking]
+        low, high = min(values), max(values)
+        for doc_id, score in ranking:
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight * normalized
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRanker:
+    """
+    Combines the BM25 and vector rankings of the top `candidates` chunks of
+    each retriever. Both candidate lists are generated concurrently.
+    """
+
+    def __init__(
+        self,
+        storage: JsonStorage,
+        fusion: FusionMethod = FusionMethod.RRF,
+        vector_weight: float = 0.5,
+        candidates: int = 50,
+        reference_ids: list[str] = None,
+    ):
+        self.storage = storage
+        self.fusion = fusion
+        self.vector_weight = vector_weight
+        self.candidates = candidates
+        self.bm25 = BM25Ranker(storage, reference_ids=reference_ids)
+        self.vector = VectorRanker(storage, reference_ids=reference_ids)
+
+    def get_top_n(self, query: str, limit: int = 5) -> list[Chunk]:
+        """
+        Rank documents by fusing their BM25 and vector rankings
+
+        Parameters
+        ----------
+        query : str
+            Input text to be used as query
+        limit : int, default 5
+            Number of documents to return
+
+        Returns
+        -------
+        docs : list[Chunk]
+        """
+        with self.storage.lock:
+            return get_chunks(self.storage, self.get_top_n_ids(query, limit))
+
+    def get_top_n_ids(self, query: str, limit: int = 5) -> list[str]:
+        num_candidates = max(limit, self.candidates)
+
+        with self.storage.lock:
+            # load the vector index here: if the caller holds the storage lock,
+            # the executor thread would block on it in the lazy loader
+            self.storage.vector_index
+            future = _executor.submit(
+                self.vector.get_top_n_with_scores, query, num_candidates
+            )
+            bm25_ranking = self.bm25.get_top_n_with_scores(query, num_candidates)
+            vector_ranking = future.result()
+
+        # BM25 pads its ranking with chunks that match no query term
+        bm25_ranking = [(doc_id, score) for doc_id, score in bm25_ranking if score]
+
+        weights = [1 - self.vector_weight, self.vector_weight]
+        if self.fusion == FusionMethod.WEIGHTED:
+            doc_ids = weighted_score_fusion([bm25_ranking, vector_ranking], weights)
+        else:
+            doc_ids = reciprocal_rank_fusion(
+                [
+                    [doc_id for doc_id, _ in bm25_ranking],
+                    [doc_id for doc_id, _ in vector_ranking],
+                ],
+                weights,
+            )
+        return doc_ids[:limit]
+
+
+def create_ranker(
+    storage: JsonStorage,
+    mode: RetrievalMode = RetrievalMode.BM25,
+    reference_ids: list[str] = None,
+    fusion: FusionMethod = FusionMethod.RRF,
+    vector_weight: float = 0.5,
+):
+    """
+    Returns the ranker for a retrieval mode, restricted to the chunks of
+    `reference_ids` if any are given. `fusion` and `vector_weight` configure
+    how hybrid retrieval combines its rankings (see `HybridRanker`).
+    """
+    reference_ids = reference_ids or None
+    if mode == RetrievalMode.VECTOR:
+        return VectorRanker(storage=storage, reference_ids=reference_ids)
+    if mode == RetrievalMode.HYBRID:
+        return HybridRanker(
+            storage=storage,
+            fusion=fusion,
+            vector_weight=vector_weight,
+            reference_ids=reference_ids,
+        )
+    return BM25Ranker(storage=storage, reference_ids=reference_ids)
@@ -1,7 +1,5 @@
 import re
 
-import litellm
-import openai
 from sidecar.ai.prompts import (
     create_prompt_for_rewrite,
     create_prompt_for_text_completion,
@@ -20,6 +18,9 @@ from sidecar.settings.schemas import FlatSettingsSchema, ModelProvider
 from sidecar.typing import ResponseStatus
 from tenacity import retry, stop_after_attempt, wait_fixed
 
+# `litellm` and `openai` are imported where they are used, as loading them
+# takes most of the sidecar's start-up time (see `benchmarks/startup_benchmark.py`)
+
 
 def trim_completion_prefix_from_choices(
     prefix: str, choices: list[TextCompletionChoice]
@@ -77,6 +78,8 @@ async def rewrite(arg: RewriteRequest, user_settings: FlatSettingsSchema = None)
     temperature = arg.temperature
 
     if user_settings.model_provider == ModelProvider.OPENAI:
+        import openai
+
         openai.api_key = user_settings.api_key
 
     # there are 1.33 tokens per word on average
@@ -120,6 +123,8 @@ async def complete_text(
     request: TextCompletionRequest, user_settings: FlatSettingsSchema = None
 ):
     if user_settings.model_provider == ModelProvider.OPENAI:
+        import openai
+
         openai.api_key = user_settings.api_key
 
     logger.info(
@@ -234,6 +239,8 @@ class Rewriter:
             params["api_base"] = "http://localhost:11434"
             params["custom_llm_provider"] = "ollama"
 
+        import litellm
+
         response = await litellm.acompletion(**params)
 
         if self.model_provider == ModelProvider.OLLAMA:
@@ -1,3 +1,5 @@
+from pydantic import confloat, validator
+from sidecar import config
 from sidecar.typing import RefStudioModel, ResponseStatus
 
 try:
@@ -57,10 +59,35 @@ class TextCompletionResponse(RefStudioModel):
     choices: list[TextCompletionChoice]
 
 
+class RetrievalMode(StrEnum):
+    BM25 = "bm25"
+    VECTOR = "vector"
+    HYBRID = "hybrid"
+
+
+class FusionMethod(StrEnum):
+    RRF = "rrf"
+    WEIGHTED = "weighted"
+
+
 class ChatRequest(RefStudioModel):
     text: str
     n_choices: int = 1
     temperature: float = 0.7
+    retrieval_mode: RetrievalMode = RetrievalMode.BM25
+    # hybrid retrieval only: how the BM25 and vector rankings are combined,
+    # and the weight of the vector ranking
+    fusion: FusionMethod = FusionMethod.RRF
+    vector_weight: confloat(ge=0, le=1) = 0.5
+    reference_ids: list[str] = None
+
+    @validator("retrieval_mode")
+    def check_retrieval_mode(cls, value: RetrievalMode) -> RetrievalMode:
+        if value != RetrievalMode.BM25 and not config.CHAT_VECTOR_RETRIEVAL:
+            raise ValueError(
+                f"{value} retrieval is disabled (see CHAT_VECTOR_RETRIEVAL)"
+            )
+        return value
 
 
 class ChatResponseChoice(TextSuggestionChoice):
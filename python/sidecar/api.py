@@ -1,11 +1,18 @@
+import importlib
+import threading
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sidecar import config
 from sidecar.ai import router as ai_router
+from sidecar.ai.context import get_encoding
 from sidecar.filesystem import router as filesystem_route
 from sidecar.meta import router as meta_router
 from sidecar.projects import router as projects_router
 from sidecar.references import router as references_router
+from sidecar.references.fetch import pdf_fetcher
+from sidecar.references.storage import storage_cache
 from sidecar.search import router as search_router
 from sidecar.settings import router as settings_router
 
@@ -31,6 +38,41 @@ api.include_router(projects_router.router, prefix="/api")
 api.include_router(search_router.router, prefix="/api")
 api.include_router(settings_router.router, prefix="/api")
 
+# Slow-to-load dependencies are imported on first use rather than at start-up,
+# so that `/meta/status` answers quickly after the sidecar is spawned
+# (see `benchmarks/startup_benchmark.py`). Once the server is up, they are
+# loaded in the background so that their first use does not pay for it either.
+LAZY_MODULES = ["litellm", "openai", "semanticscholar", "httpx", "tiktoken"]
+
+
+def preload_lazy_modules() -> None:
+    for name in LAZY_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            config.logger.warning(f"Unable to preload {name}: {e}")
+
+    # tiktoken downloads the chat model's encoding on first use
+    get_encoding("gpt-3.5-turbo")
+
+
+@api.on_event("startup")
+def start_preloading_lazy_modules() -> None:
+    if config.PRELOAD_LAZY_MODULES:
+        threading.Thread(
+            target=preload_lazy_modules, name="preload", daemon=True
+        ).start()
+
+
+@api.on_event("shutdown")
+async def close_pdf_fetcher() -> None:
+    await pdf_fetcher.aclose()
+
+
+@api.on_event("shutdown")
+def flush_reference_indexes() -> None:
+    storage_cache.flush()
+
 
 def serve(host: str, port: int):
     uvicorn.run(api, host=host, port=port, reload=False)
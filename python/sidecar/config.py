@@ -1,5 +1,6 @@
 import logging
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -15,6 +16,92 @@ PROJECT_DIR = Path(os.environ.get("PROJECT_DIR", "/tmp/project-x"))
 UPLOADS_DIR = Path(os.path.join(PROJECT_DIR, "uploads"))
 REFERENCES_JSON_PATH = Path(os.path.join(PROJECT_DIR, ".storage", "references.json"))
 
+# Grobid PDF parsing: max concurrent requests, per-file timeout (seconds)
+# and attempts per file (timeouts and busy responses are retried with backoff)
+GROBID_CONCURRENCY = int(os.environ.get("GROBID_CONCURRENCY", 4))
+GROBID_TIMEOUT = float(os.environ.get("GROBID_TIMEOUT", 60))
+GROBID_MAX_ATTEMPTS = int(os.environ.get("GROBID_MAX_ATTEMPTS", 3))
+
+# Per-page PDF text artifacts, keyed by content hash, shared across projects.
+# The least recently used artifacts are deleted once they take up more than
+# `PDF_TEXT_CACHE_MAX_BYTES`
+PDF_TEXT_CACHE_DIR = Path(
+    os.environ.get(
+        "PDF_TEXT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "refstudio-pdf-text")
+    )
+)
+PDF_TEXT_CACHE_MAX_BYTES = int(
+    os.environ.get("PDF_TEXT_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+)
+
+# Adding references by URL: per-request timeout (seconds), max PDF size (bytes),
+# and max open connections, overall and per host
+PDF_FETCH_TIMEOUT = float(os.environ.get("PDF_FETCH_TIMEOUT", 30))
+PDF_FETCH_MAX_BYTES = int(os.environ.get("PDF_FETCH_MAX_BYTES", 100 * 1024 * 1024))
+PDF_FETCH_MAX_CONNECTIONS = int(os.environ.get("PDF_FETCH_MAX_CONNECTIONS", 16))
+PDF_FETCH_MAX_CONNECTIONS_PER_HOST = int(
+    os.environ.get("PDF_FETCH_MAX_CONNECTIONS_PER_HOST", 4)
+)
+
+# Background ingestion jobs: finished jobs can be looked up until more than
+# `INGEST_JOB_RETENTION` others have finished after them
+INGEST_JOB_RETENTION = int(os.environ.get("INGEST_JOB_RETENTION", 100))
+
+# Semantic Scholar searches are cached for `S2_CACHE_TTL` seconds, keeping up to
+# `S2_CACHE_MAX_ENTRIES` queries, and persisted to `S2_CACHE_PATH` (set it to an
+# empty string to keep the cache in memory only)
+S2_CACHE_MAX_ENTRIES = int(os.environ.get("S2_CACHE_MAX_ENTRIES", 256))
+S2_CACHE_TTL = float(os.environ.get("S2_CACHE_TTL", 24 * 60 * 60))
+S2_CACHE_PATH = os.environ.get(
+    "S2_CACHE_PATH", os.path.join(tempfile.gettempdir(), "refstudio-s2-cache.json")
+)
+
+# PDF text extraction during ingestion: worker processes and max seconds per PDF
+PDF_EXTRACTION_WORKERS = int(
+    os.environ.get("PDF_EXTRACTION_WORKERS", min(4, os.cpu_count() or 1))
+)
+PDF_EXTRACTION_TIMEOUT = float(os.environ.get("PDF_EXTRACTION_TIMEOUT", 120))
+
+# Upper bound (in bytes of `references.json`) for loaded projects kept in memory
+STORAGE_CACHE_MAX_BYTES = int(
+    os.environ.get("STORAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+)
+
+# Load slow-to-import dependencies in the background once the server is up
+PRELOAD_LAZY_MODULES = os.environ.get("PRELOAD_LAZY_MODULES", "true").lower() == "true"
+
+# Edits to `references.json` are appended to a log that is fsynced at most every
+# `REFERENCES_LOG_FSYNC_INTERVAL` seconds, and folded into `references.json`
+# once larger than both `REFERENCES_LOG_COMPACT_BYTES` and
+# `REFERENCES_LOG_COMPACT_RATIO` times the size of `references.json`
+REFERENCES_LOG_FSYNC_INTERVAL = float(
+    os.environ.get("REFERENCES_LOG_FSYNC_INTERVAL", 0.05)
+)
+REFERENCES_LOG_COMPACT_BYTES = int(
+    os.environ.get("REFERENCES_LOG_COMPACT_BYTES", 4 * 1024 * 1024)
+)
+REFERENCES_LOG_COMPACT_RATIO = float(
+    os.environ.get("REFERENCES_LOG_COMPACT_RATIO", 0.5)
+)
+
+# Local chunk embeddings: vector dimension, and the number of chunks above which
+# nearest-neighbour search uses the approximate (IVF) index, probing
+# `VECTOR_IVF_NPROBE` clusters per query
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", 384))
+VECTOR_IVF_MIN_DOCS = int(os.environ.get("VECTOR_IVF_MIN_DOCS", 20_000))
+VECTOR_IVF_NPROBE = int(os.environ.get("VECTOR_IVF_NPROBE", 16))
+
+# Vector and hybrid chat retrieval. The bundled embedder hashes words, so its
+# rankings only repeat BM25's: enable them once a semantic embedder is used
+CHAT_VECTOR_RETRIEVAL = (
+    os.environ.get("CHAT_VECTOR_RETRIEVAL", "false").lower() == "true"
+)
+
+# Chat context: the top `CHAT_CONTEXT_CANDIDATES` chunks are retrieved, and as
+# many of them as fit in `CHAT_CONTEXT_MAX_TOKENS` prompt tokens are included
+CHAT_CONTEXT_CANDIDATES = int(os.environ.get("CHAT_CONTEXT_CANDIDATES", 10))
+CHAT_CONTEXT_MAX_TOKENS = int(os.environ.get("CHAT_CONTEXT_MAX_TOKENS", 1500))
+
 logging.root.setLevel(logging.NOTSET)
 
 logger = logging.getLogger()
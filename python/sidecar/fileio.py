@@ -0,0 +1,133 @@
+"""
+Crash-safe writes and cached reads of the sidecar's JSON files.
+
+Files are never written in place: the new contents go to a temporary file in
+the same directory, which is fsynced and then renamed over the original, so
+readers (and a restarted sidecar) see either the old or the new file, never a
+truncated one. Writers to the same file are serialized by a per-file lock,
+which callers also hold around read-modify-write cycles.
+
+Parsed contents are cached in-process and revalidated by the file's
+(mtime, size) signature.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Generic, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_locks: dict[str, threading.RLock] = {}
+_locks_lock = threading.Lock()
+
+
+def file_lock(filepath: str | Path) -> threading.RLock:
+    """
+    Returns the (re-entrant) lock that serializes writes to a file within
+    this process.
+    """
+    key = os.path.abspath(filepath)
+    with _locks_lock:
+        if key not in _locks:
+            _locks[key] = threading.RLock()
+        return _locks[key]
+
+
+def get_file_signature(filepath: str | Path) -> tuple[int, int] | None:
+    """
+    Returns a (mtime, size) signature for a file, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def atomic_open(filepath: str | Path, mode: str = "w") -> Iterator[IO]:
+    """
+    Opens a temporary file for the new contents of a file, which replaces the
+    file atomically when the block exits without an error.
+    """
+    filepath = Path(filepath)
+
+    with file_lock(filepath):
+        fd, tmp_filepath = tempfile.mkstemp(
+            dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, mode) as f:
+                yield f
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_filepath, filepath)
+        except BaseException:
+            try:
+                os.remove(tmp_filepath)
+            except OSError:
+                pass
+            raise
+        _fsync_directory(filepath.parent)
+
+
+def atomic_write(filepath: str | Path, data: str | bytes) -> None:
+    """
+    Replaces the contents of a file atomically.
+    """
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with atomic_open(filepath, mode) as f:
+        f.write(data)
+
+
+def atomic_write_json(filepath: str | Path, obj, **kwargs) -> None:
+    """
+    Serializes `obj` as JSON (`kwargs` are passed to `json.dumps`) and
+    replaces the contents of a file with it atomically.
+    """
+    atomic_write(filepath, json.dumps(obj, **kwargs))
+
+
+def _fsync_directory(dirpath: Path) -> None:
+    # persists the rename itself; directories cannot be opened on Windows
+    if os.name != "posix":
+        return
+    fd = os.open(dirpath, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ParsedFileCache(Generic[T]):
+    """
+    In-process cache of objects parsed from files, by path.
+
+    An entry is reused for as long as its file's (mtime, size) signature is
+    unchanged, so a lookup costs a `stat` rather than reading and parsing
+    the file. Writers replace the entry with what they have just written.
+    Cached objects are shared and must not be modified.
+    """
+
+    def __init__(self):
+        self._entries: dict[Path, tuple[tuple[int, int], T]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, filepath: Path, signature: tuple[int, int]) -> T | None:
+        entry = self._entries.get(Path(filepath))
+        if entry is None or entry[0] != signature:
+            return None
+        return entry[1]
+
+    def put(self, filepath: Path, signature: tuple[int, int], obj: T) -> None:
+        with self._lock:
+            self._entries[Path(filepath)] = (signature, obj)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -4,6 +4,7 @@ from pathlib import Path
 
 from fastapi import APIRouter, File, HTTPException, UploadFile
 from fastapi.responses import FileResponse
+from sidecar.projects.generations import project_generations
 from sidecar.projects.service import get_project_path
 from sidecar.typing import ResponseStatus, StatusResponse
 
@@ -33,6 +34,8 @@ async def create_file(
         )
         file.file.close()
         return response
+    finally:
+        project_generations.bump(project_id)
 
     response = StatusResponse(status=ResponseStatus.OK)
     file.file.close()
@@ -68,4 +71,5 @@ async def delete_file(project_id: str, filepath: Path) -> StatusResponse:
         return StatusResponse(
             status=ResponseStatus.ERROR, message=f"Error deleting file: {e}"
         )
+    project_generations.bump(project_id)
     return StatusResponse(status=ResponseStatus.OK)
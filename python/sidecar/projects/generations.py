@@ -0,0 +1,56 @@
+"""
+Per-project content generations.
+
+Every write this process makes to a project's references or files bumps the
+project's generation, so clients polling a project can be answered with
+`304 Not Modified` from memory as long as their `ETag` is still current.
+"""
+from __future__ import annotations
+
+import threading
+from uuid import uuid4
+
+
+class ProjectGenerations:
+    def __init__(self):
+        # generations restart at 0 with every process: tag them with the
+        # process so that tags issued before a restart never match
+        self.epoch = uuid4().hex[:8]
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, project_id: str) -> int:
+        return self._generations.get(project_id, 0)
+
+    def bump(self, project_id: str) -> int:
+        with self._lock:
+            generation = self._generations.get(project_id, 0) + 1
+            self._generations[project_id] = generation
+            return generation
+
+    def etag(self, project_id: str, variant: str = "") -> str:
+        """
+        Returns a weak ETag for the project's current generation.
+        `variant` distinguishes the representations of a resource, e.g.
+        different pages of a listing.
+        """
+        tag = f"{self.epoch}-{self.get(project_id)}"
+        if variant:
+            tag = f"{tag}-{variant}"
+        return f'W/"{tag}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Checks an `If-None-Match` request header against an ETag, using the weak
+    comparison required for `GET` requests.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+
+project_generations = ProjectGenerations()
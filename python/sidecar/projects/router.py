@@ -1,7 +1,8 @@
 from uuid import uuid4
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
 from sidecar.projects import service
+from sidecar.projects.generations import etag_matches, project_generations
 from sidecar.projects.schemas import (
     ProjectBase,
     ProjectCreateRequest,
@@ -65,7 +66,24 @@ async def delete_project(project_id: str) -> StatusResponse:
     return StatusResponse(status=ResponseStatus.OK)
 
 
-@router.get("/{project_id}/files")
-async def get_project_files(project_id: str) -> ProjectFileTreeResponse:
+@router.get(
+    "/{project_id}/files",
+    responses={304: {"description": "The files have not changed (see `ETag`)."}},
+)
+async def get_project_files(
+    project_id: str, request: Request, response: Response
+) -> ProjectFileTreeResponse:
+    """
+    Returns the project's files as a tree.
+
+    Responses carry an `ETag`: if it is sent back in `If-None-Match` and the
+    project's files have not changed since, the response is an empty
+    `304 Not Modified`.
+    """
     user_id = "user1"
+    etag = project_generations.etag(project_id)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
     return service.get_project_files(user_id, project_id)
@@ -1,15 +1,28 @@
+from __future__ import annotations
+
 import json
 import shutil
 from pathlib import Path
 
 from sidecar.config import WEB_STORAGE_URL
+from sidecar.fileio import (
+    ParsedFileCache,
+    atomic_write_json,
+    file_lock,
+    get_file_signature,
+)
 from sidecar.filesystem.service import traverse_directory
+from sidecar.projects.generations import project_generations
 from sidecar.projects.schemas import Project, ProjectFileTreeResponse, ProjectStore
 
 # Ensure that the server's path storage directory exists.
 Path(WEB_STORAGE_URL).mkdir(parents=True, exist_ok=True)
 
 
+# parsed `projects.json` files, by path
+project_registry: ParsedFileCache[ProjectStore] = ParsedFileCache()
+
+
 def make_projects_json_path(user_id: str) -> Path:
     """
     Returns the path to the JSON file that stores the mapping of project ids to
@@ -34,8 +47,7 @@ def initialize_projects_json_storage(user_id: str) -> None:
     """
     filepath = make_projects_json_path(user_id)
     filepath.parent.mkdir(parents=True, exist_ok=True)
-    with open(filepath, "w") as f:
-        json.dump({}, f)
+    atomic_write_json(filepath, {})
 
 
 def read_project_storage(user_id: str) -> ProjectStore:
@@ -49,12 +61,32 @@ def read_project_storage(user_id: str) -> ProjectStore:
     """
     filepath = make_projects_json_path(user_id)
 
-    if not filepath.exists():
+    signature = get_file_signature(filepath)
+    if signature is None:
         initialize_projects_json_storage(user_id)
+        signature = get_file_signature(filepath)
+
+    project_store = project_registry.get(filepath, signature)
+    if project_store is not None:
+        return project_store
 
     with open(filepath, "r") as f:
         data = json.load(f)
-    return ProjectStore(projects=data)
+    project_store = ProjectStore(projects=data)
+    project_registry.put(filepath, signature, project_store)
+    return project_store
+
+
+def _write_project_storage(user_id: str, data: dict) -> ProjectStore:
+    """
+    Writes `projects.json` and refreshes its registry entry.
+    """
+    filepath = make_projects_json_path(user_id)
+    atomic_write_json(filepath, data)
+
+    project_store = ProjectStore(projects=data)
+    project_registry.put(filepath, get_file_signature(filepath), project_store)
+    return project_store
 
 
 def get_projects_for_user(user_id: str) -> list[Project]:
@@ -74,21 +106,18 @@ def update_project_storage(
     """
     filepath = make_projects_json_path(user_id)
 
-    if not filepath.exists():
-        initialize_projects_json_storage(user_id)
-
-    stored_projects = read_project_storage(user_id)
-    data = stored_projects.dict().get("projects")
+    with file_lock(filepath):
+        if not filepath.exists():
+            initialize_projects_json_storage(user_id)
 
-    with open(filepath, "w") as f:
+        stored_projects = read_project_storage(user_id)
+        data = stored_projects.dict().get("projects")
         data[project_id] = {
             "id": project_id,
             "name": project_name,
             "path": str(project_path),
         }
-        json.dump(data, f)
-
-    return read_project_storage(user_id)
+        return _write_project_storage(user_id, data)
 
 
 def get_project(user_id: str, project_id: str) -> Project:
@@ -149,6 +178,7 @@ def create_project(
         server_path.mkdir(parents=True, exist_ok=True)
 
     update_project_storage(user_id, project_id, project_name, project_path=server_path)
+    project_generations.bump(project_id)
     return Project(
         id=project_id,
         name=project_name,
@@ -158,21 +188,23 @@ def create_project(
 
 def delete_project(user_id: str, project_id: str) -> None:
     filepath = make_projects_json_path(user_id)
-    project_store = read_project_storage(user_id)
-    data = project_store.dict().get("projects", {})
 
-    if project_id not in data:
-        raise KeyError(f"Project {project_id} does not exist")
+    with file_lock(filepath):
+        project_store = read_project_storage(user_id)
+        data = project_store.dict().get("projects", {})
+
+        if project_id not in data:
+            raise KeyError(f"Project {project_id} does not exist")
 
-    with open(filepath, "w") as f:
         del data[project_id]
-        json.dump(data, f)
+        _write_project_storage(user_id, data)
 
     project_path = make_project_path(user_id, project_id)
     try:
         shutil.rmtree(project_path)
     except FileNotFoundError:
         pass
+    project_generations.bump(project_id)
 
 
 def get_project_files(user_id: str, project_id: str) -> ProjectFileTreeResponse:
@@ -0,0 +1,205 @@
+"""
+Allocation of unique citation keys.
+
+A citation key is a base key derived from a Reference's first author and
+published year (see `shared.create_citation_key`), followed by a suffix that
+distinguishes References sharing the same base key: the first gets no suffix,
+the following get `a`, `b`, ..., `z`, `aa`, ... (or `1`, `2`, ... for the
+`untitled` base key).
+
+`CitationKeyIndex` records the suffixes allocated for each base key, so that
+a new key is allocated without recomputing the keys of the whole library, and
+keys stay the same when a Reference's authors or date are later edited.
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from sidecar import shared
+from sidecar.config import logger
+from sidecar.fileio import atomic_write_json
+from sidecar.references.schemas import Reference
+
+logger = logger.getChild(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+UNTITLED = "untitled"
+
+
+def format_citation_key(base: str, ordinal: int) -> str:
+    """
+    Returns the citation key for the `ordinal`-th Reference with a base key.
+    """
+    if ordinal == 0:
+        return base
+    if base == UNTITLED:
+        return f"{base}{ordinal}"
+
+    suffix = ""
+    while ordinal > 0:
+        ordinal, remainder = divmod(ordinal - 1, 26)
+        suffix = chr(97 + remainder) + suffix
+    return f"{base}{suffix}"
+
+
+def parse_citation_key(key: str, base: str) -> int | None:
+    """
+    Returns the ordinal of a citation key for a base key, or None if the key
+    was not derived from the base key.
+    """
+    if not key.startswith(base):
+        return None
+
+    suffix = key[len(base) :]
+    if not suffix:
+        return 0
+    if base == UNTITLED:
+        return int(suffix) if suffix.isdigit() else None
+    if not (suffix.isascii() and suffix.isalpha() and suffix.islower()):
+        return None
+
+    ordinal = 0
+    for char in suffix:
+        ordinal = ordinal * 26 + ord(char) - 96
+    return ordinal
+
+
+class CitationKeyIndex:
+    """
+    Persistent index of the citation keys allocated in a project.
+
+    The index is stored as JSON next to `references.json`, as a mapping of
+    base key -> allocated ordinal -> Reference id, and is updated as
+    References are added, re-keyed and deleted.
+
+    Keys set by hand, or that do not match their Reference's base key (e.g.
+    after its authors were edited), are recorded as their own base key so
+    that they are never allocated again.
+    """
+
+    def __init__(self, filepath: str = None):
+        # an index without a filepath is only kept in memory
+        self.filepath = Path(filepath) if filepath else None
+        self.allocations: dict[str, dict[int, str]] = {}
+        # derived from `allocations`
+        self.keys: dict[str, str] = {}
+        self._by_reference: dict[str, tuple[str, int]] = {}
+        self._next: dict[str, int] = {}
+
+    def load(self) -> None:
+        with open(self.filepath, "r") as f:
+            data = json.load(f)
+
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index version in {self.filepath}")
+
+        self._clear()
+        for base, ordinals in data["allocations"].items():
+            for ordinal, reference_id in ordinals.items():
+                self._record(base, int(ordinal), reference_id)
+
+    def save(self) -> None:
+        """
+        Save the index to the index file as JSON.
+        """
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        contents = {
+            "version": INDEX_FORMAT_VERSION,
+            "allocations": self.allocations,
+        }
+        atomic_write_json(self.filepath, contents)
+
+    def build(self, references: list[Reference]) -> None:
+        """
+        Rebuilds the index from scratch from the keys of a list of References.
+        """
+        self._clear()
+        for ref in references:
+            self.add_reference(ref)
+
+    def is_stale(self, references: list[Reference]) -> bool:
+        """
+        Checks whether the index is out of sync with a list of References,
+        e.g. because `references.json` was written without updating the index.
+        """
+        keys: dict[str, str] = {}
+        for ref in references:
+            if ref.citation_key:
+                # like `build`, the first Reference with a key keeps it
+                keys.setdefault(ref.citation_key, ref.id)
+        return keys != self.keys
+
+    def get_key(self, reference_id: str) -> str | None:
+        allocation = self._by_reference.get(reference_id)
+        if allocation is None:
+            return None
+        return format_citation_key(*allocation)
+
+    def allocate(self, reference: Reference) -> str:
+        """
+        Allocates the next free citation key for a Reference's base key,
+        replacing any key it was allocated before.
+        """
+        self.remove_reference(reference)
+
+        base = shared.create_citation_key(reference)
+        ordinal = self._next.get(base, 0)
+        while format_citation_key(base, ordinal) in self.keys:
+            ordinal += 1
+
+        self._record(base, ordinal, reference.id)
+        return format_citation_key(base, ordinal)
+
+    def add_reference(self, reference: Reference) -> None:
+        """
+        Records the citation key of a Reference, e.g. one allocated with
+        `allocate` or set by hand.
+        """
+        key = reference.citation_key
+        if self.get_key(reference.id) == key:
+            return
+
+        self.remove_reference(reference)
+        if not key:
+            return
+
+        base = shared.create_citation_key(reference)
+        ordinal = parse_citation_key(key, base)
+        if ordinal is None:
+            base, ordinal = key, 0
+
+        if key in self.keys:
+            logger.warning(f"Citation key {key} is used by more than one Reference")
+            return
+        self._record(base, ordinal, reference.id)
+
+    def remove_reference(self, reference: Reference) -> None:
+        """
+        Frees the citation key of a Reference. Freed keys are not allocated
+        again while the index is loaded, so that citations of a deleted
+        Reference do not silently point to the next one added.
+        """
+        allocation = self._by_reference.pop(reference.id, None)
+        if allocation is None:
+            return
+
+        base, ordinal = allocation
+        del self.allocations[base][ordinal]
+        if not self.allocations[base]:
+            del self.allocations[base]
+
+        del self.keys[format_citation_key(base, ordinal)]
+
+    def _record(self, base: str, ordinal: int, reference_id: str) -> None:
+        self.allocations.setdefault(base, {})[ordinal] = reference_id
+        self.keys[format_citation_key(base, ordinal)] = reference_id
+        self._by_reference[reference_id] = (base, ordinal)
+        self._next[base] = max(self._next.get(base, 0), ordinal + 1)
+
+    def _clear(self) -> None:
+        self.allocations = {}
+        self.keys = {}
+        self._by_reference = {}
+        self._next = {}
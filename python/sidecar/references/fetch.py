@@ -0,0 +1,182 @@
+"""
+Async client for fetching PDFs from URLs.
+
+A URL is first probed with a `HEAD` request (or a single-byte ranged `GET`
+for servers that do not answer `HEAD`) to check that it points to a PDF no
+larger than `max_bytes`. The PDF is then streamed straight to disk in a
+single download, which is abandoned as soon as it exceeds `max_bytes`.
+
+Connections are pooled across fetches in a client shared per event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from sidecar.config import (
+    PDF_FETCH_MAX_BYTES,
+    PDF_FETCH_MAX_CONNECTIONS,
+    PDF_FETCH_TIMEOUT,
+    logger,
+)
+
+if TYPE_CHECKING:
+    # imported on first use, as it is slow to load
+    import httpx
+
+logger = logger.getChild(__name__)
+
+# servers that do not implement `HEAD` answer with one of these
+HEAD_NOT_SUPPORTED_STATUS_CODES = {403, 405, 501}
+
+
+class PdfTooLargeError(Exception):
+    pass
+
+
+class AsyncPdfFetcher:
+    def __init__(
+        self,
+        timeout: float = PDF_FETCH_TIMEOUT,
+        max_bytes: int = PDF_FETCH_MAX_BYTES,
+        max_connections: int = PDF_FETCH_MAX_CONNECTIONS,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_connections = max_connections
+        self.transport = transport
+        self._client = None
+        self._loop = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        """
+        Returns the client for the running event loop, creating it on first use.
+        """
+        import httpx
+
+        # pooled connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                follow_redirects=True,
+                transport=self.transport,
+            )
+            self._loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    def _check_response(self, url: str, response: httpx.Response) -> tuple[bool, str]:
+        if not response.is_success:
+            return False, f"Unable to fetch {url}, status code {response.status_code}"
+
+        if "application/pdf" not in response.headers.get("content-type", ""):
+            return False, f"Unable to fetch {url}, content-type is not PDF"
+
+        size = get_content_length(response)
+        if size is not None and size > self.max_bytes:
+            return False, f"Unable to fetch {url}, PDF is larger than the size limit"
+
+        return True, ""
+
+    async def probe(self, url: str) -> tuple[bool, str]:
+        """
+        Determines if a URL points to a PDF that can be fetched, without
+        downloading it.
+
+        Returns
+        -------
+        bool
+            Whether the URL points to a PDF that can be fetched.
+        str
+            The reason why the PDF could not be fetched.
+        """
+        import httpx
+
+        client = self.get_client()
+        try:
+            response = await client.head(url)
+            if response.status_code in HEAD_NOT_SUPPORTED_STATUS_CODES:
+                headers = {"Range": "bytes=0-0"}
+                async with client.stream("GET", url, headers=headers) as response:
+                    pass
+        except httpx.HTTPError:
+            reason = f"Unable to fetch {url}, request exception"
+            logger.info(reason)
+            return False, reason
+
+        is_pdf, reason = self._check_response(url, response)
+        if not is_pdf:
+            logger.info(reason)
+        return is_pdf, reason
+
+    async def download(self, url: str, filepath: Path) -> tuple[bool, str]:
+        """
+        Streams a PDF to `filepath`. Nothing is left at `filepath` if the
+        download fails.
+
+        Returns
+        -------
+        bool
+            Whether the PDF was downloaded.
+        str
+            The reason why the PDF could not be downloaded.
+        """
+        import httpx
+
+        client = self.get_client()
+        try:
+            async with client.stream("GET", url) as response:
+                is_pdf, reason = self._check_response(url, response)
+                if not is_pdf:
+                    logger.info(reason)
+                    return False, reason
+
+                size = 0
+                with open(filepath, "wb") as f:
+                    async for data in response.aiter_bytes():
+                        size += len(data)
+                        if size > self.max_bytes:
+                            raise PdfTooLargeError()
+                        f.write(data)
+        except (httpx.HTTPError, PdfTooLargeError) as e:
+            filepath.unlink(missing_ok=True)
+            if isinstance(e, PdfTooLargeError):
+                reason = f"Unable to fetch {url}, PDF is larger than the size limit"
+            else:
+                reason = f"Unable to fetch {url}, request exception"
+            logger.info(reason)
+            return False, reason
+        except BaseException:
+            filepath.unlink(missing_ok=True)
+            raise
+
+        logger.info(f"Downloaded {size} bytes from {url}")
+        return True, ""
+
+
+def get_content_length(response: httpx.Response) -> int | None:
+    """
+    Returns the size of the whole resource, also for partial (ranged) responses.
+    """
+    content_range = response.headers.get("content-range", "")
+    if response.status_code == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+
+    content_length = response.headers.get("content-length", "")
+    return int(content_length) if content_length.isdigit() else None
+
+
+pdf_fetcher = AsyncPdfFetcher()
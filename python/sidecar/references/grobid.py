@@ -0,0 +1,178 @@
+"""
+Async client for parsing PDFs with a Grobid server.
+
+PDFs are submitted concurrently (bounded by `concurrency`), each with its own
+timeout and retries with exponential backoff. Output files are written as
+soon as each PDF finishes, using the same layout as `grobid_client`:
+
+- `{filename}.tei.xml` for PDFs Grobid was able to parse
+- `{filename}_{status_code}.txt` for PDFs it was not
+"""
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from sidecar.config import logger
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+if TYPE_CHECKING:
+    # imported on first use, as it is slow to load
+    import httpx
+
+logger = logger.getChild(__name__)
+
+# Grobid responds with 503 when all of its workers are busy
+RETRYABLE_STATUS_CODES = {429, 503}
+
+
+class RetryableGrobidError(Exception):
+    def __init__(self, status_code: int, message: str = ""):
+        super().__init__(message or f"Grobid responded with {status_code}")
+        self.status_code = status_code
+
+
+class AsyncGrobidClient:
+    def __init__(
+        self,
+        server_url: str,
+        concurrency: int = 4,
+        timeout: float = 60,
+        max_attempts: int = 3,
+        backoff: float = 1,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.server_url = server_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.transport = transport
+
+    def get_server_url(self, service: str) -> str:
+        return f"{self.server_url}/api/{service}"
+
+    async def _post_pdf(
+        self, client: httpx.AsyncClient, service: str, pdf_path: Path
+    ) -> tuple[int, str]:
+        with open(pdf_path, "rb") as f:
+            files = {"input": (pdf_path.name, f, "application/pdf")}
+            response = await client.post(
+                self.get_server_url(service),
+                files=files,
+                data={"consolidateHeader": "1"},
+                headers={"Accept": "text/plain"},
+            )
+
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise RetryableGrobidError(response.status_code)
+        return response.status_code, response.text
+
+    async def process_pdf(
+        self, client: httpx.AsyncClient, service: str, pdf_path: Path
+    ) -> tuple[int, str]:
+        """
+        Submits a single PDF to Grobid, retrying with exponential backoff on
+        timeouts, connection errors and busy responses.
+
+        Returns
+        -------
+        tuple[int, str]
+            The HTTP status code and response text. Timeouts are reported
+            as 408 and connection errors as 503 once retries are exhausted.
+        """
+        import httpx
+
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_exponential(multiplier=self.backoff),
+            retry=retry_if_exception_type((RetryableGrobidError, httpx.TransportError)),
+            reraise=True,
+        )
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    n = attempt.retry_state.attempt_number
+                    if n > 1:
+                        logger.info(f"Retrying Grobid for {pdf_path.name} ({n})")
+                    return await self._post_pdf(client, service, pdf_path)
+        except RetryableGrobidError as e:
+            return e.status_code, str(e)
+        except httpx.TimeoutException as e:
+            return 408, str(e)
+        except httpx.TransportError as e:
+            return 503, str(e)
+
+    def _write_output(
+        self, pdf_path: Path, output_dir: Path, status: int, text: str
+    ) -> Path:
+        if status == 200 and text:
+            output_path = output_dir.joinpath(f"{pdf_path.stem}.tei.xml")
+        else:
+            output_path = output_dir.joinpath(f"{pdf_path.stem}_{status}.txt")
+
+        with open(output_path, "w", encoding="utf8") as f:
+            f.write(text or "")
+        return output_path
+
+    async def process(
+        self,
+        service: str,
+        pdf_paths: list[Path],
+        output_dir: Path,
+        on_complete: Callable[[Path, int], None] = None,
+    ) -> dict[str, int]:
+        """
+        Submits PDFs to Grobid with at most `self.concurrency` requests
+        in flight, writing each output file as soon as its PDF finishes.
+
+        Parameters
+        ----------
+        service : str
+            Grobid service to call, e.g. `processHeaderDocument`
+        pdf_paths : list[Path]
+            PDFs to process
+        output_dir : Path
+            Directory where Grobid output files are written
+        on_complete : Callable[[Path, int], None], optional
+            Called with the PDF path and status code as each PDF finishes
+
+        Returns
+        -------
+        dict[str, int]
+            Status code for each PDF, keyed by filename
+        """
+        import httpx
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        statuses = {}
+
+        async def process_one(client: httpx.AsyncClient, pdf_path: Path) -> None:
+            async with semaphore:
+                status, text = await self.process_pdf(client, service, pdf_path)
+
+            self._write_output(pdf_path, output_dir, status, text)
+            statuses[pdf_path.name] = status
+
+            if status == 200:
+                logger.info(f"Grobid successfully parsed file: {pdf_path.name}")
+            else:
+                logger.warning(f"Grobid failed to parse {pdf_path.name}: {status}")
+
+            if on_complete is not None:
+                on_complete(pdf_path, status)
+
+        limits = httpx.Limits(max_connections=self.concurrency)
+        async with httpx.AsyncClient(
+            timeout=self.timeout, limits=limits, transport=self.transport
+        ) as client:
+            await asyncio.gather(*[process_one(client, fp) for fp in pdf_paths])
+
+        return statuses
@@ -0,0 +1,520 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from sidecar.config import logger
+from sidecar.fileio import atomic_write_json
+from sidecar.references.schemas import Reference
+
+logger = logger.getChild(__name__)
+
+INDEX_FORMAT_VERSION = 2
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Tokenizes text for lexical search.
+    This must match the tokenization used to build `JsonStorage.tokenized_corpus`.
+    """
+    return text.lower().split()
+
+
+def make_doc_id(reference_id: str, chunk_idx: int) -> str:
+    """
+    Returns the id of a chunk in the index, e.g. `{reference_id}:{chunk_idx}`
+    """
+    return f"{reference_id}:{chunk_idx}"
+
+
+def parse_doc_id(doc_id: str) -> tuple[str, int]:
+    """
+    Returns the (reference_id, chunk_idx) pair for an index doc id.
+    """
+    reference_id, _, chunk_idx = doc_id.rpartition(":")
+    return reference_id, int(chunk_idx)
+
+
+def get_reference_signature(reference: Reference) -> str:
+    """
+    Returns a digest of a Reference's chunk texts, so that an index can tell
+    when the chunks it holds for a Reference have been changed.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in reference.chunks:
+        digest.update(chunk.text.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def get_reference_offsets(doc_ids: list[str]) -> dict[str, tuple[int, int]]:
+    """
+    Returns the (start, end) range of rows holding each reference's chunks in
+    a list of doc ids. The chunks of a reference are always added and removed
+    together, so they occupy consecutive rows.
+    """
+    offsets = {}
+    for i, doc_id in enumerate(doc_ids):
+        reference_id, _ = parse_doc_id(doc_id)
+        start, _ = offsets.get(reference_id, (i, i))
+        offsets[reference_id] = (start, i + 1)
+    return offsets
+
+
+def get_reference_ranges(
+    offsets: dict[str, tuple[int, int]], reference_ids: list[str]
+) -> list[tuple[int, int]]:
+    """
+    Returns the row ranges of a subset of references, in row order.
+    References that are not in `offsets` are ignored.
+    """
+    return sorted(offsets[r] for r in set(reference_ids) if r in offsets)
+
+
+def get_rows(ranges: list[tuple[int, int]]) -> np.ndarray:
+    """
+    Returns the rows covered by a list of (start, end) ranges.
+    """
+    if not ranges:
+        return np.array([], dtype=np.int64)
+    return np.concatenate([np.arange(start, end) for start, end in ranges])
+
+
+class BM25Index:
+    """
+    Persistent inverted index over reference chunks, scored with BM25+.
+
+    The index is stored as JSON next to `references.json` and is updated
+    incrementally as references are added, updated and deleted, so that
+    ranking does not need to re-tokenize the whole corpus on every chat.
+
+    Rankings match `rank_bm25.BM25Plus` with the same parameters.
+    Queries are scored against a `BM25Matrix` built from the postings, which
+    is cached until the index is next modified.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        k1: float = 1.5,
+        b: float = 0.75,
+        delta: float = 1.0,
+    ):
+        self.filepath = Path(filepath)
+        self.k1 = k1
+        self.b = b
+        self.delta = delta
+
+        # term -> {doc_id: term frequency}
+        self.postings: dict[str, dict[str, int]] = {}
+        # doc_id -> number of tokens in the chunk
+        self.doc_lengths: dict[str, int] = {}
+        # reference_id -> number of chunks indexed for the reference
+        self.reference_chunk_counts: dict[str, int] = {}
+        # reference_id -> digest of the indexed chunk texts
+        self.reference_signatures: dict[str, str] = {}
+        self.total_length = 0
+
+        self._idf: dict[str, float] = {}
+        self._matrix: BM25Matrix | None = None
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def avgdl(self) -> float:
+        if not self.doc_lengths:
+            return 0.0
+        return self.total_length / len(self.doc_lengths)
+
+    def load(self) -> None:
+        with open(self.filepath, "r") as f:
+            data = json.load(f)
+
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index version in {self.filepath}")
+
+        self.postings = data["postings"]
+        self.doc_lengths = data["doc_lengths"]
+        self.reference_chunk_counts = data["reference_chunk_counts"]
+        self.reference_signatures = data["reference_signatures"]
+        self.total_length = sum(self.doc_lengths.values())
+        self._idf = {}
+        self._matrix = None
+
+    def save(self) -> None:
+        """
+        Save the index to the index file as JSON.
+        """
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        contents = {
+            "version": INDEX_FORMAT_VERSION,
+            "reference_chunk_counts": self.reference_chunk_counts,
+            "reference_signatures": self.reference_signatures,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        atomic_write_json(self.filepath, contents)
+
+    def build(self, references: list[Reference]) -> None:
+        """
+        Rebuilds the index from scratch for a list of References.
+        """
+        self.postings = {}
+        self.doc_lengths = {}
+        self.reference_chunk_counts = {}
+        self.reference_signatures = {}
+        self.total_length = 0
+        self._idf = {}
+        self._matrix = None
+
+        for ref in references:
+            self.add_reference(ref)
+
+    def is_stale(self, references: list[Reference]) -> bool:
+        """
+        Checks whether the index is out of sync with a list of References,
+        e.g. because `references.json` was written without updating the index.
+        References are compared by the contents of their chunks, not only by
+        their number.
+        """
+        signatures = {ref.id: get_reference_signature(ref) for ref in references}
+        return signatures != self.reference_signatures
+
+    def add_reference(self, reference: Reference) -> None:
+        """
+        Adds the chunks of a Reference to the index.
+        """
+        if reference.id in self.reference_signatures:
+            self.remove_reference(reference)
+
+        for idx, chunk in enumerate(reference.chunks):
+            doc_id = make_doc_id(reference.id, idx)
+            tokens = tokenize(chunk.text)
+
+            self.doc_lengths[doc_id] = len(tokens)
+            self.total_length += len(tokens)
+
+            for term, freq in Counter(tokens).items():
+                self.postings.setdefault(term, {})[doc_id] = freq
+
+        self.reference_chunk_counts[reference.id] = len(reference.chunks)
+        self.reference_signatures[reference.id] = get_reference_signature(reference)
+        self._idf = {}
+        self._matrix = None
+
+    def remove_reference(self, reference: Reference) -> None:
+        """
+        Removes the chunks of a Reference from the index.
+
+        The Reference's chunks are used to find the postings to remove. If
+        they have changed since the Reference was indexed, every term's
+        postings are scanned instead.
+        """
+        signature = self.reference_signatures.get(reference.id)
+        if signature is None:
+            return
+
+        terms = None
+        if signature == get_reference_signature(reference):
+            terms = {t for chunk in reference.chunks for t in tokenize(chunk.text)}
+        self._remove_references([reference.id], terms)
+
+    def sync(self, references: list[Reference]) -> bool:
+        """
+        Brings the index in line with a list of References: References that
+        are no longer stored, or whose chunks have changed, are removed, and
+        References that are missing are added.
+
+        Returns True if the index was modified.
+        """
+        signatures = {ref.id: get_reference_signature(ref) for ref in references}
+        removed = [
+            reference_id
+            for reference_id, signature in self.reference_signatures.items()
+            if signatures.get(reference_id) != signature
+        ]
+        if removed:
+            # the chunks they were indexed with are unknown
+            self._remove_references(removed)
+
+        missing = [ref for ref in references if ref.id not in self.reference_signatures]
+        for ref in missing:
+            self.add_reference(ref)
+
+        return bool(removed or missing)
+
+    def _remove_references(
+        self, reference_ids: list[str], terms: set[str] | None = None
+    ) -> None:
+        """
+        Removes the chunks of References from the index, looking for their
+        postings under `terms`, or under every term if None.
+        """
+        doc_ids = []
+        for reference_id in reference_ids:
+            num_chunks = self.reference_chunk_counts.pop(reference_id, 0)
+            self.reference_signatures.pop(reference_id, None)
+            doc_ids.extend(make_doc_id(reference_id, idx) for idx in range(num_chunks))
+
+        for doc_id in doc_ids:
+            self.total_length -= self.doc_lengths.pop(doc_id, 0)
+
+        for term in list(self.postings) if terms is None else terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            for doc_id in doc_ids:
+                postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+
+        self._idf = {}
+        self._matrix = None
+
+    def idf(self, term: str) -> float:
+        """
+        Returns the BM25+ inverse document frequency for a term.
+        The IDF table is derived from the postings and cached until the
+        index is next modified.
+        """
+        if term not in self._idf:
+            df = len(self.postings.get(term, {}))
+            if df == 0:
+                return 0.0
+            self._idf[term] = math.log((self.num_docs + 1) / df)
+        return self._idf[term]
+
+    @property
+    def matrix(self) -> BM25Matrix:
+        if self._matrix is None:
+            self._matrix = BM25Matrix(self)
+        return self._matrix
+
+    def get_scores(self, query_tokens: list[str]) -> dict[str, float]:
+        """
+        Scores every chunk containing at least one query term.
+
+        Chunks that contain none of the query terms are omitted. BM25+ adds
+        `delta * idf` for every query term to every chunk, whether or not the
+        chunk contains the term, so that constant is left out of the scores
+        here. This does not change the ranking.
+        """
+        matrix = self.matrix
+        scores = matrix.get_scores(query_tokens)
+        return {matrix.doc_ids[i]: scores[i] for i in np.flatnonzero(scores)}
+
+    def get_top_n(
+        self, query_tokens: list[str], n: int = 5, reference_ids: list[str] = None
+    ) -> list[str]:
+        """
+        Returns the ids of the `n` highest scoring chunks for a query,
+        optionally only among the chunks of `reference_ids`.
+        """
+        return self.matrix.get_top_n(query_tokens, n=n, reference_ids=reference_ids)
+
+    def get_top_n_with_scores(
+        self, query_tokens: list[str], n: int = 5, reference_ids: list[str] = None
+    ) -> list[tuple[str, float]]:
+        """
+        Returns the ids and scores of the `n` highest scoring chunks for a query,
+        optionally only among the chunks of `reference_ids`.
+        """
+        return self.matrix.get_top_n_with_scores(
+            query_tokens, n=n, reference_ids=reference_ids
+        )
+
+
+class BM25Matrix:
+    """
+    BM25+ term weights of a `BM25Index` as a CSR term-document matrix.
+
+    Row `i` holds the (idf-weighted, length-normalized) score contribution of
+    term `i` to each chunk containing it, so scoring a query is a sparse
+    vector-matrix product: the rows of the query terms are summed into a
+    dense score vector. Top-k selection uses `np.argpartition` rather than
+    sorting all scores.
+
+    Queries restricted to a subset of references are scored from the
+    postings of their chunks instead (the same weights, transposed per
+    chunk), located through the per-reference chunk offsets, so that their
+    cost depends on the size of the subset rather than of the whole index.
+    """
+
+    def __init__(self, index: BM25Index):
+        k1, b = index.k1, index.b
+        self.doc_ids = list(index.doc_lengths)
+        self.reference_offsets = get_reference_offsets(self.doc_ids)
+        self.vocabulary: dict[str, int] = {}
+        self._doc_postings = None
+
+        num_docs = len(self.doc_ids)
+        doc_positions = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+
+        indptr = [0]
+        indices = []
+        term_freqs = []
+        for term, postings in index.postings.items():
+            self.vocabulary[term] = len(self.vocabulary)
+            indices.extend(doc_positions[doc_id] for doc_id in postings)
+            term_freqs.extend(postings.values())
+            indptr.append(len(indices))
+
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int32)
+
+        # length normalization, precomputed per chunk
+        doc_lengths = np.fromiter(
+            index.doc_lengths.values(), dtype=np.float64, count=num_docs
+        )
+        avgdl = index.avgdl or 1.0
+        self.norms = k1 * (1 - b + b * doc_lengths / avgdl)
+
+        tf = np.array(term_freqs, dtype=np.float64)
+        df = np.diff(self.indptr)
+        idf = np.log((num_docs + 1) / np.maximum(df, 1))
+        self.data = np.repeat(idf, df) * tf * (k1 + 1) / (self.norms[self.indices] + tf)
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_ids)
+
+    def get_scores(self, query_tokens: list[str]) -> np.ndarray:
+        """
+        Returns the score of every chunk for a query, in `doc_ids` order.
+        Repeated query terms count once per occurrence, as in `rank_bm25`.
+        """
+        counts = Counter(t for t in query_tokens if t in self.vocabulary)
+        if not counts:
+            return np.zeros(self.num_docs)
+
+        indices = []
+        weights = []
+        for term, count in counts.items():
+            row = self.vocabulary[term]
+            start, end = self.indptr[row], self.indptr[row + 1]
+            indices.append(self.indices[start:end])
+            weights.append(self.data[start:end] * count)
+
+        return np.bincount(
+            np.concatenate(indices),
+            weights=np.concatenate(weights),
+            minlength=self.num_docs,
+        )
+
+    @property
+    def doc_postings(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the term weights in CSC (chunk-major) layout, as
+        (indptr, term rows, weights): the postings of chunk `i` are at
+        `indptr[i]:indptr[i + 1]`. Built on first use.
+        """
+        if self._doc_postings is None:
+            order = np.argsort(self.indices, kind="stable")
+            terms = np.repeat(
+                np.arange(len(self.vocabulary), dtype=np.int32), np.diff(self.indptr)
+            )
+            indptr = np.zeros(self.num_docs + 1, dtype=np.int64)
+            np.cumsum(
+                np.bincount(self.indices, minlength=self.num_docs), out=indptr[1:]
+            )
+            self._doc_postings = (indptr, terms[order], self.data[order])
+        return self._doc_postings
+
+    def get_scores_for_references(
+        self, query_tokens: list[str], reference_ids: list[str]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the rows of the chunks of a subset of references, in `doc_ids`
+        order, and their scores for a query. Only the postings of those
+        chunks are read.
+        """
+        ranges = get_reference_ranges(self.reference_offsets, reference_ids)
+        rows = get_rows(ranges)
+
+        counts = Counter(t for t in query_tokens if t in self.vocabulary)
+        if not counts or not len(rows):
+            return rows, np.zeros(len(rows))
+
+        query_terms = sorted((self.vocabulary[t], c) for t, c in counts.items())
+        term_rows = np.array([row for row, _ in query_terms])
+        term_counts = np.array([count for _, count in query_terms], dtype=np.float64)
+
+        # the postings of a reference's chunks are consecutive, too
+        indptr, terms, data = self.doc_postings
+        positions = get_rows([(indptr[start], indptr[end]) for start, end in ranges])
+        chunk_terms = terms[positions]
+
+        # the position of each posting's term among the query terms, if any
+        matches = np.minimum(
+            np.searchsorted(term_rows, chunk_terms), len(term_rows) - 1
+        )
+        weights = np.where(
+            term_rows[matches] == chunk_terms,
+            data[positions] * term_counts[matches],
+            0.0,
+        )
+        chunks = np.repeat(np.arange(len(rows)), indptr[rows + 1] - indptr[rows])
+        return rows, np.bincount(chunks, weights=weights, minlength=len(rows))
+
+    def get_top_n(
+        self, query_tokens: list[str], n: int = 5, reference_ids: list[str] = None
+    ) -> list[str]:
+        """
+        Returns the ids of the `n` highest scoring chunks for a query,
+        optionally only among the chunks of `reference_ids`.
+
+        Ties are broken by index order, and chunks that do not match the
+        query are used as padding, as `rank_bm25` always returns `n` docs.
+        """
+        return [
+            doc_id
+            for doc_id, _ in self.get_top_n_with_scores(query_tokens, n, reference_ids)
+        ]
+
+    def get_top_n_with_scores(
+        self, query_tokens: list[str], n: int = 5, reference_ids: list[str] = None
+    ) -> list[tuple[str, float]]:
+        """
+        Returns the ids and scores of the `n` highest scoring chunks for a query,
+        best first, as in `get_top_n`.
+        """
+        if self.num_docs == 0:
+            return []
+
+        if reference_ids is not None:
+            rows, scores = self.get_scores_for_references(query_tokens, reference_ids)
+            return [
+                (self.doc_ids[rows[i]], float(scores[i]))
+                for i in top_n_indices(scores, n)
+            ]
+
+        scores = self.get_scores(query_tokens)
+        return [(self.doc_ids[i], float(scores[i])) for i in top_n_indices(scores, n)]
+
+
+def top_n_indices(scores: np.ndarray, n: int) -> np.ndarray:
+    """
+    Returns the positions of the `n` highest scores, best first.
+
+    Uses `np.argpartition` rather than sorting all scores. Ties are broken
+    by position, so results are deterministic.
+    """
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.array([], dtype=np.int64)
+
+    top = np.argpartition(-scores, n - 1)[:n]
+
+    # argpartition picks arbitrarily among positions tied with the n-th
+    # score, so take those in order
+    kth = scores[top].min()
+    above = np.flatnonzero(scores > kth)
+    tied = np.flatnonzero(scores == kth)[: n - len(above)]
+    top = np.concatenate([above, tied])
+    return top[np.lexsort((top, -scores[top]))]
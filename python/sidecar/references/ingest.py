@@ -1,15 +1,28 @@
+from __future__ import annotations
+
 import json
 import os
 import shutil
-import sys
+import threading
 from pathlib import Path
 from uuid import uuid4
 
 import grobid_tei_xml
 from dotenv import load_dotenv
-from grobid_client.grobid_client import GrobidClient, ServerUnavailableException
 from sidecar import shared
-from sidecar.config import REFERENCES_JSON_PATH, UPLOADS_DIR, logger
+from sidecar.config import (
+    GROBID_CONCURRENCY,
+    GROBID_MAX_ATTEMPTS,
+    GROBID_TIMEOUT,
+    PROJECT_DIR,
+    REFERENCES_JSON_PATH,
+    UPLOADS_DIR,
+    logger,
+)
+from sidecar.fileio import atomic_write_json
+from sidecar.references import pdf
+from sidecar.references.grobid import AsyncGrobidClient
+from sidecar.references.index import BM25Index
 from sidecar.references.schemas import (
     Author,
     IngestRequest,
@@ -21,8 +34,18 @@ from sidecar.references.schemas import (
 )
 from sidecar.references.service import add_citation_keys_for_references
 from sidecar.references.storage import JsonStorage
+from sidecar.references.vectors import VectorIndex
 from sidecar.typing import ResponseStatus
 
+try:
+    # introduced in Python 3.11 ...
+    from enum import StrEnum
+except ImportError:
+    # ... but had some breaking changes
+    # https://github.com/python/cpython/issues/100458
+    # Python 3.10 and below
+    from strenum import StrEnum
+
 load_dotenv()
 logger = logger.getChild(__name__)
 
@@ -37,7 +60,8 @@ def run_ingest(pdf_directory: Path):
 
 def get_statuses():
     storage = JsonStorage(REFERENCES_JSON_PATH)
-    status_fetcher = IngestStatusFetcher(storage=storage)
+    progress = IngestProgress(PROJECT_DIR.joinpath(".grobid", "progress.json"))
+    status_fetcher = IngestStatusFetcher(storage=storage, progress=progress)
     response = status_fetcher.emit_statuses()
     return response
 
@@ -49,11 +73,26 @@ def get_references(args: IngestRequest):
     return response
 
 
+class IngestCancelled(Exception):
+    pass
+
+
+class IngestStage(StrEnum):
+    """Stages of PDF ingestion, in the order they are run"""
+
+    COPY = "copy"
+    PARSE = "parse"
+    CONVERT = "convert"
+    CHUNK = "chunk"
+    PERSIST = "persist"
+    EMBED = "embed"
+
+
 class PDFIngestion:
-    def __init__(self, input_dir: Path):
+    def __init__(self, input_dir: Path, cancel_event: threading.Event = None):
         self.input_dir = input_dir
+        self.cancel_event = cancel_event
         self.project_name = input_dir.parent.name
-        self.uploaded_files = list(self.input_dir.glob("*.pdf"))
 
         # directories for storing intermediate files
         self.staging_dir = input_dir.parent.joinpath(".staging")
@@ -61,25 +100,162 @@ class PDFIngestion:
         self.storage_dir = input_dir.parent.joinpath(".storage")
         self._create_directories()
 
+        self.progress = IngestProgress(self.grobid_output_dir.joinpath("progress.json"))
+        self.manifest = IngestManifest(self.grobid_output_dir.joinpath("manifest.json"))
+        self._reset()
+
+    def _reset(self) -> None:
+        """
+        Loads uploads and stored References, clearing the state of any
+        previous run.
+        """
+        self.uploaded_files = list(self.input_dir.glob("*.pdf"))
         self.references = self._load_references()
 
-    def run(self):
+        # set by `_get_files_to_ingest`, keyed by upload filename
+        self.upload_signatures: dict[str, tuple[str, int, int]] = {}
+        self.replaced_references: dict[str, Reference] = {}
+        self.duplicate_uploads: dict[str, str] = {}
+        self.ingested_filenames: list[str] = []
+
+        # set by `_create_references`
+        self.new_references: list[Reference] = []
+
+    def run(self) -> IngestResponse:
+        """
+        Ingests new and modified uploads.
+
+        Ingestion runs in stages (see `IngestStage`), checkpointing its state
+        to a manifest after each one. If a previous ingestion was interrupted,
+        it is resumed from its last completed stage before looking for new
+        uploads, so finished work is never redone.
+        """
         logger.info(f"Starting ingestion for project: {self.project_name}")
 
-        self._copy_uploads_to_staging()
-        self._call_grobid_for_staging()
-        self._convert_grobid_xml_to_json()
+        resumed = self.manifest.load()
+        if resumed:
+            logger.info(
+                f"Resuming ingestion for project {self.project_name} "
+                f"after stage: {self.manifest.stage}"
+            )
+            self._restore_from_manifest()
+            self._run_stages()
 
-        self._create_references()
-        self._save_references()
+            # pick up anything uploaded since the interrupted ingestion
+            self._reset()
+
+        files_to_ingest = self._get_files_to_ingest()
+        if not files_to_ingest:
+            if self.upload_signatures:
+                self.references.extend(self._add_duplicate_references())
+                self._save_references()
 
-        response = self.create_ingest_response()
+            if resumed:
+                return self.create_ingest_response()
 
-        for ref in self.references:
-            self._remove_temporary_files_for_reference(ref)
+            message = "All uploaded PDFs have already been processed"
+            logger.info(message)
+            return self.create_ingest_response(message=message)
+
+        logger.info(f"Found {len(files_to_ingest)} new uploads to ingest")
+        self.ingested_filenames = [fp.name for fp in files_to_ingest]
+        self.ingested_filenames.extend(self.duplicate_uploads)
+        self._checkpoint(stage=None)
+
+        self._run_stages()
+        return self.create_ingest_response()
+
+    def _run_stages(self) -> None:
+        """
+        Runs each stage that has not been completed yet, then removes the
+        temporary files created along the way.
+        """
+        stages = {
+            IngestStage.COPY: self._copy_uploads_to_staging,
+            IngestStage.PARSE: self._call_grobid_for_staging,
+            IngestStage.CONVERT: self._convert_staging,
+            IngestStage.CHUNK: self._create_references,
+            IngestStage.PERSIST: self._save_references,
+            IngestStage.EMBED: self._embed_references,
+        }
+        for stage, run_stage in stages.items():
+            if self.manifest.is_complete(stage):
+                continue
+
+            # once References are saved, ingestion is finished regardless
+            if not self.manifest.is_complete(IngestStage.PERSIST):
+                self._check_cancelled()
+            logger.info(f"Running ingestion stage: {stage}")
+            run_stage()
+            self._checkpoint(stage)
+
+        for filename in self.ingested_filenames:
+            self._remove_temporary_files(filename)
+        self.progress.clear()
+        self.manifest.clear()
 
         logger.info(f"Finished ingestion for project: {self.project_name}")
-        return response
+
+    def _checkpoint(self, stage: IngestStage | None) -> None:
+        """
+        Records that `stage` has completed, along with everything needed to
+        resume ingestion from the next stage.
+        """
+        self.manifest.stage = stage
+        self.manifest.data = {
+            "ingested_filenames": self.ingested_filenames,
+            "upload_signatures": self.upload_signatures,
+            "replaced_references": {
+                filename: ref.id for filename, ref in self.replaced_references.items()
+            },
+            "duplicate_uploads": self.duplicate_uploads,
+            "new_references": [ref.dict() for ref in self.new_references],
+        }
+        self.manifest.save()
+
+    def _restore_from_manifest(self) -> None:
+        """
+        Restores the state of an interrupted ingestion from its manifest.
+        """
+        data = self.manifest.data
+        refs_by_id = {ref.id: ref for ref in self.references}
+
+        self.ingested_filenames = data["ingested_filenames"]
+        self.upload_signatures = {
+            filename: tuple(signature)
+            for filename, signature in data["upload_signatures"].items()
+        }
+        self.replaced_references = {
+            filename: refs_by_id[ref_id]
+            for filename, ref_id in data["replaced_references"].items()
+            if ref_id in refs_by_id
+        }
+        self.duplicate_uploads = data["duplicate_uploads"]
+        self.new_references = [Reference(**ref) for ref in data["new_references"]]
+
+        # References are only saved in the persist stage, so References created
+        # before the interruption still need to be added
+        if self.manifest.is_complete(IngestStage.CHUNK) and not (
+            self.manifest.is_complete(IngestStage.PERSIST)
+        ):
+            self._add_new_references()
+
+    def _check_cancelled(self) -> None:
+        """
+        Stops ingestion between stages if it has been cancelled, removing the
+        temporary files of any staged uploads and the manifest, so it is not
+        resumed. References are only saved in the persist stage, so a cancelled
+        ingestion leaves storage untouched.
+        """
+        if self.cancel_event is None or not self.cancel_event.is_set():
+            return
+
+        logger.info(f"Ingestion cancelled for project: {self.project_name}")
+        for filename in self.ingested_filenames:
+            self._remove_temporary_files(filename)
+        self.progress.clear()
+        self.manifest.clear()
+        raise IngestCancelled(f"Ingestion cancelled for {self.project_name}")
 
     def _create_directories(self) -> None:
         if not self.staging_dir.exists():
@@ -136,59 +312,130 @@ class PDFIngestion:
 
     def _get_files_to_ingest(self) -> list[Path]:
         """
-        Determines which files need to be ingested by comparing the list of
-        already processed References against files found in `uploads`.
+        Determines which files need to be ingested by comparing the PDFs found
+        in `uploads` against the file signature stored on each Reference.
+
+        - Unchanged files are skipped: either their size and mtime match
+          (no hashing needed) or their content hash does.
+        - Modified files are re-ingested, keeping their Reference's id.
+        - Byte-identical copies of an ingested (or to-be-ingested) PDF are not
+          parsed again: their Reference is copied from the original.
         """
         if not self._check_for_uploaded_files():
             logger.info("No files have been uploaded")
-            sys.exit()
+            return []
 
-        uploaded_filestems = {fp.stem: fp for fp in self.input_dir.glob("*.pdf")}
-        processed_filestems = {
-            Path(ref.source_filename).stem: ref.source_filename
-            for ref in self.references
+        refs_by_filename = {ref.source_filename: ref for ref in self.references}
+        refs_by_hash = {
+            ref.content_hash: ref for ref in self.references if ref.content_hash
         }
-        needs_ingestion_filestems = set(uploaded_filestems.keys()) - set(
-            processed_filestems.keys()
-        )
+        staged_hashes = set()
+
+        filepaths_to_ingest = []
+        for filepath in sorted(self.input_dir.glob("*.pdf")):
+            stat = filepath.stat()
+            ref = refs_by_filename.get(filepath.name)
+
+            if ref is not None and (ref.file_size, ref.file_mtime_ns) == (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                continue
+
+            content_hash = pdf.hash_file(filepath)
+            self.upload_signatures[filepath.name] = (
+                content_hash,
+                stat.st_size,
+                stat.st_mtime_ns,
+            )
 
-        if not needs_ingestion_filestems:
-            logger.info("All uploaded PDFs have already been processed")
-            sys.exit()
+            if ref is not None:
+                # References ingested before hashes were stored are assumed
+                # to match their file, so only their signature is recorded
+                if ref.content_hash in (None, content_hash):
+                    self._set_file_signature(ref)
+                    continue
+
+                logger.info(f"Upload has changed, re-ingesting: {filepath.name}")
+                self.replaced_references[filepath.name] = ref
+
+            elif content_hash in refs_by_hash or content_hash in staged_hashes:
+                logger.info(f"Upload is a duplicate, not parsing: {filepath.name}")
+                self.duplicate_uploads[filepath.name] = content_hash
+                continue
+
+            staged_hashes.add(content_hash)
+            filepaths_to_ingest.append(filepath)
 
-        filepaths_to_ingest = [
-            uploaded_filestems[stem] for stem in needs_ingestion_filestems
-        ]
         return filepaths_to_ingest
 
+    def _set_file_signature(self, ref: Reference) -> None:
+        """
+        Records the content hash, size and mtime of a Reference's upload.
+        """
+        signature = self.upload_signatures.get(ref.source_filename)
+        if signature is not None:
+            ref.content_hash, ref.file_size, ref.file_mtime_ns = signature
+
+    def _add_duplicate_references(self) -> list[Reference]:
+        """
+        Creates References for uploads that are byte-identical to an already
+        ingested PDF by copying that PDF's Reference.
+        """
+        refs_by_hash = {
+            ref.content_hash: ref for ref in self.references if ref.content_hash
+        }
+
+        duplicates = []
+        for filename, content_hash in self.duplicate_uploads.items():
+            original = refs_by_hash[content_hash]
+            ref = original.copy(
+                deep=True,
+                update={
+                    "id": str(uuid4()),
+                    "source_filename": filename,
+                    "filepath": str(Path("uploads") / filename),
+                    "citation_key": None,
+                },
+            )
+            for chunk in ref.chunks:
+                chunk.metadata["source_filename"] = filename
+            self._set_file_signature(ref)
+            duplicates.append(ref)
+
+        add_citation_keys_for_references(
+            duplicates, existing_references=self.references
+        )
+        return duplicates
+
     def _copy_uploads_to_staging(self) -> None:
         """
         Copies PDF files in need of ingestion from `self.input_dir` to
         `self.staging_dir` so that files in `uploads` are not mutated and are
         only processed once.
         """
-        files_to_ingest = self._get_files_to_ingest()
-        logger.info(f"Found {len(files_to_ingest)} new uploads to ingest")
+        for filename in self.ingested_filenames:
+            if filename in self.duplicate_uploads:
+                continue
 
-        for filepath in files_to_ingest:
-            logger.info(f"Copying {filepath.name} to {self.staging_dir}")
-            shutil.copy(filepath, self.staging_dir)
+            logger.info(f"Copying {filename} to {self.staging_dir}")
+            shutil.copy(self.input_dir.joinpath(filename), self.staging_dir)
 
-    def _remove_temporary_files_for_reference(self, ref: Reference) -> None:
+    def _remove_temporary_files(self, source_filename: str) -> None:
         """
-        Removes a Reference's temporary files that were created during
+        Removes the temporary files created for an uploaded PDF during
         various stages of ingestion.
         """
-        staging_path = self.staging_dir.joinpath(ref.source_filename)
+        staging_path = self.staging_dir.joinpath(source_filename)
         shared.remove_file(staging_path)
 
         # grobid success
-        xml_filename = f"{Path(ref.source_filename).stem}.tei.xml"
+        xml_filename = f"{Path(source_filename).stem}.tei.xml"
         xml_path = self.grobid_output_dir.joinpath(xml_filename)
         shared.remove_file(xml_path)
 
         # grobid failures - there might not be any
-        txt_filename = f"{Path(ref.source_filename).stem}*.txt"
+        txt_filename = f"{Path(source_filename).stem}*.txt"
         matches = list(self.grobid_output_dir.glob(txt_filename))
 
         if matches:
@@ -196,7 +443,7 @@ class PDFIngestion:
             shared.remove_file(txt_path)
 
         # json converted from grobid XML
-        json_filename = f"{Path(ref.source_filename).stem}.json"
+        json_filename = f"{Path(source_filename).stem}.json"
         json_path = self.storage_dir.joinpath(json_filename)
         shared.remove_file(json_path)
 
@@ -208,41 +455,59 @@ class PDFIngestion:
         file being written to `.grobid`. Files that are unable to be parsed
         are also written to `.grobid`, but their file names are structured
         as `{filename}_{errorcode}.txt` (e.g. some-pdf_500.txt)
+
+        Files are sent to Grobid concurrently (see `GROBID_CONCURRENCY`) and
+        each file's progress is recorded as soon as Grobid is done with it.
+        Files that already have Grobid output (from an interrupted ingestion)
+        are not sent again.
         """
         if not self._check_for_staging_files():
             logger.info("No staging files found for Grobid processing")
-            sys.exit()
-
-        num_files = len(list(self.staging_dir.glob("*.pdf")))
-        timeout = 30 * num_files
-
-        logger.info(f"Calling Grobid server for {num_files} files")
-
-        # The Grobid client library we use prints info and error messages to stdout.
-        # This is a problem because the Tauri client <-> sidecar communicate over stdout
-        # So we need to wrap Grobid calls inside of `HiddenPrints` to prevent `print`
-        # messages from ending up in stdout (https://stackoverflow.com/a/45669280).
-        #
-        # Longer-term, we should probably fork the Grobid client and make changes
-        # to better suit our use-case.
-        with shared.HiddenPrints():
-            try:
-                client = GrobidClient(GROBID_SERVER_URL, timeout=timeout)
-            except ServerUnavailableException as e:
-                logger.error(e)
+            return
+
+        statuses = self._get_grobid_output_statuses()
+        staging_files = [
+            filepath
+            for filepath in self.staging_dir.glob("*.pdf")
+            if statuses[filepath.name] == "not_found"
+        ]
+        logger.info(f"Calling Grobid server for {len(staging_files)} files")
 
+        for filepath in staging_files:
+            self.progress.update(filepath.name, IngestStatus.PROCESSING)
+
+        def record_progress(filepath: Path, status_code: int) -> None:
+            # Grobid failures are final: the Reference is created with a
+            # FAILURE status. Successes still need to be converted and chunked.
+            if status_code != 200:
+                self.progress.update(filepath.name, IngestStatus.FAILURE)
+            else:
+                self.progress.update(filepath.name, IngestStatus.PROCESSING)
+
+        client = AsyncGrobidClient(
+            GROBID_SERVER_URL,
+            concurrency=GROBID_CONCURRENCY,
+            timeout=GROBID_TIMEOUT,
+            max_attempts=GROBID_MAX_ATTEMPTS,
+        )
+        shared.run_sync(
             client.process(
                 "processHeaderDocument",
-                input_path=self.staging_dir,
-                output=self.grobid_output_dir,
-                force=True,
+                staging_files,
+                output_dir=self.grobid_output_dir,
+                on_complete=record_progress,
             )
+        )
         logger.info("Finished calling Grobid server")
 
         # statuses aren't needed right now, but calling this method
         # will write a status message for each file in the logs for us
         _ = self._get_grobid_output_statuses()
 
+    def _convert_staging(self) -> None:
+        self._convert_grobid_xml_to_json()
+        self._extract_text_for_staging()
+
     def _get_grobid_output_statuses(self) -> dict[Path, str]:
         """
         Determines the status of Grobid output files.
@@ -285,6 +550,22 @@ class PDFIngestion:
                 doc = grobid_tei_xml.parse_document_xml(xml)
                 json.dump(doc.to_dict(), fout)
 
+    def _extract_text_for_staging(self) -> None:
+        """
+        Extracts the text of staged PDFs on a pool of worker processes
+        (`PDF_EXTRACTION_WORKERS`), so that creating References and chunks
+        reads cached pages instead of parsing PDFs serially.
+        PDFs that take longer than `PDF_EXTRACTION_TIMEOUT` seconds are killed
+        and ingested without text.
+        """
+        staging_files = list(self.staging_dir.glob("*.pdf"))
+        logger.info(f"Extracting text from {len(staging_files)} staged PDFs")
+
+        results = pdf.extract_pages_in_pool(staging_files)
+        for filepath, ok in results.items():
+            if not ok:
+                logger.warning(f"Unable to extract text from {filepath.name}")
+
     def _parse_header(self, document: dict) -> dict:
         """
         Parses the `header` elements of a Grobid document and returns a
@@ -365,14 +646,10 @@ class PDFIngestion:
         Creates new Reference objects, appending them to any we have
         previously loaded.
         """
-        json_files = list(self.storage_dir.glob("*.json"))
-
-        # Remove references.json from the list of files to parse
-        try:
-            fp = self.storage_dir.joinpath("references.json")
-            json_files.remove(fp)
-        except ValueError:
-            pass
+        # only parse JSON converted from staged uploads: `.storage` also holds
+        # references.json and the search indexes
+        staged = {f.stem for f in self.staging_dir.glob("*.pdf")}
+        json_files = [f for f in self.storage_dir.glob("*.json") if f.stem in staged]
 
         logger.info(f"Found {len(json_files)} Grobid JSON files to parse")
 
@@ -414,18 +691,49 @@ class PDFIngestion:
         logger.info(msg)
 
         new_references = successes + failures
+
+        # re-ingested uploads replace their previous Reference, keeping its id
+        # and citation key (documents may already cite it)
+        kept_keys = []
+        new_keys = []
+        for ref in new_references:
+            self._set_file_signature(ref)
+
+            previous = self.replaced_references.get(ref.source_filename)
+            if previous is not None:
+                ref.id = previous.id
+                self.references.remove(previous)
+                if previous.citation_key:
+                    ref.citation_key = previous.citation_key
+                    kept_keys.append(ref)
+                    continue
+            new_keys.append(ref)
+
         add_citation_keys_for_references(
-            new_references, existing_references=self.references
+            new_keys, existing_references=self.references + kept_keys
         )
 
-        # append new references to any we have previously loaded
         for ref in new_references:
             logger.info(f"Creating text chunks for Reference: {ref.source_filename}")
             ref.chunks = shared.chunk_reference(
                 ref, filepath=self.staging_dir.joinpath(ref.source_filename)
             )
 
-            self.references.append(ref)
+        # append new references to any we have previously loaded
+        self.references.extend(new_references)
+        duplicates = self._add_duplicate_references()
+        self.references.extend(duplicates)
+
+        self.new_references = new_references + duplicates
+
+    def _add_new_references(self) -> None:
+        """
+        Adds References created before an interrupted ingestion to those
+        loaded from storage.
+        """
+        for previous in self.replaced_references.values():
+            self.references.remove(previous)
+        self.references.extend(self.new_references)
 
     def _save_references(self) -> None:
         """
@@ -434,11 +742,52 @@ class PDFIngestion:
         filepath = self.storage_dir.joinpath("references.json")
         logger.info(f"Saving references to file: {filepath}")
 
-        contents = [ref.dict() for ref in self.references]
-        with open(filepath, "w") as fout:
-            json.dump(contents, fout, indent=2, default=str)
+        # saving a full snapshot also clears the log of edits made since
+        # the references were loaded
+        jstore = JsonStorage(filepath)
+        jstore.references = self.references
+        jstore.save()
+
+        self._update_bm25_index(jstore.index_filepath)
+
+    def _update_bm25_index(self, filepath: Path) -> None:
+        """
+        Brings the project's BM25 index, if it has been built, in line with
+        the saved References.
+        """
+        index = BM25Index(filepath)
+        try:
+            index.load()
+        except (FileNotFoundError, ValueError):
+            # the index is built on first use
+            return
+
+        # re-ingested uploads keep their Reference id, but not their chunks
+        for ref in self.replaced_references.values():
+            index.remove_reference(ref)
+
+        if index.sync(self.references):
+            index.save()
 
-    def create_ingest_response(self) -> IngestResponse:
+    def _embed_references(self) -> None:
+        """
+        Embeds the chunks of new References into the project's vector index.
+        """
+        index = VectorIndex(self.storage_dir)
+        try:
+            index.load()
+        except (FileNotFoundError, ValueError) as e:
+            logger.info(f"Unable to load vector index, it will be rebuilt: {e}")
+            index.build([])
+
+        # re-ingested uploads keep their Reference id, but not their chunks
+        for ref in self.replaced_references.values():
+            index.remove_reference(ref)
+
+        index.sync(self.references)
+        index.save()
+
+    def create_ingest_response(self, message: str = "") -> IngestResponse:
         """
         Creates a Response object from a list of Reference objects
 
@@ -449,14 +798,96 @@ class PDFIngestion:
         return IngestResponse(
             project_name=self.project_name,
             references=self.references,
+            message=message,
         )
 
 
+class IngestManifest:
+    """
+    Checkpoint of an ingestion in progress: the last completed stage and the
+    state needed to resume from the next one.
+    """
+
+    def __init__(self, filepath: Path):
+        self.filepath = Path(filepath)
+        self.stage: IngestStage | None = None
+        self.data: dict = {}
+
+    def load(self) -> bool:
+        """
+        Loads the manifest, returning False if there is none to resume from.
+        """
+        try:
+            with open(self.filepath, "r") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+        self.stage = manifest["stage"]
+        self.data = manifest["data"]
+        return True
+
+    def save(self) -> None:
+        atomic_write_json(
+            self.filepath, {"stage": self.stage, "data": self.data}, default=str
+        )
+
+    def is_complete(self, stage: IngestStage) -> bool:
+        if self.stage is None:
+            return False
+        stages = list(IngestStage)
+        return stages.index(stage) <= stages.index(IngestStage(self.stage))
+
+    def clear(self) -> None:
+        self.stage = None
+        self.data = {}
+        shared.remove_file(self.filepath)
+
+
+class IngestProgress:
+    """
+    Per-file status of an ingestion that is in progress, keyed by filename.
+
+    Statuses are written to disk as soon as each file finishes a stage, so
+    that they can be reported before the References are saved.
+    """
+
+    def __init__(self, filepath: Path):
+        self.filepath = Path(filepath)
+        self.statuses: dict[str, IngestStatus] = {}
+
+    def load(self) -> dict[str, IngestStatus]:
+        try:
+            with open(self.filepath, "r") as f:
+                self.statuses = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.statuses = {}
+        return self.statuses
+
+    def update(self, filename: str, status: IngestStatus) -> None:
+        self.statuses[filename] = status
+        atomic_write_json(self.filepath, self.statuses)
+
+    def clear(self) -> None:
+        self.statuses = {}
+        shared.remove_file(self.filepath)
+
+
 class IngestStatusFetcher:
-    def __init__(self, storage: JsonStorage):
+    def __init__(self, storage: JsonStorage, progress: IngestProgress = None):
         self.storage = storage
+        self.progress = progress
         self.uploads = list(UPLOADS_DIR.glob("*.pdf"))
 
+    def _get_in_progress_status(self, filename: str) -> IngestStatus:
+        """
+        Returns the status of a file that has not been stored as a Reference
+        yet, according to the ingestion in progress.
+        """
+        if self.progress is None:
+            return IngestStatus.PROCESSING
+        return self.progress.statuses.get(filename, IngestStatus.PROCESSING)
+
     def _emit_ingest_status_response(
         self,
         response_status: ResponseStatus,
@@ -481,7 +912,8 @@ class IngestStatusFetcher:
         for filepath in self.uploads:
             statuses.append(
                 ReferenceStatus(
-                    source_filename=filepath.name, status=IngestStatus.PROCESSING
+                    source_filename=filepath.name,
+                    status=self._get_in_progress_status(filepath.name),
                 )
             )
         return statuses
@@ -505,12 +937,16 @@ class IngestStatusFetcher:
                 )
             else:
                 status = ReferenceStatus(
-                    source_filename=filepath.name, status=IngestStatus.PROCESSING
+                    source_filename=filepath.name,
+                    status=self._get_in_progress_status(filepath.name),
                 )
             statuses.append(status)
         return statuses
 
     def emit_statuses(self):
+        if self.progress is not None:
+            self.progress.load()
+
         try:
             self.storage.load()
         except FileNotFoundError as e:
@@ -0,0 +1,189 @@
+"""
+Background ingestion jobs.
+
+Each project gets a single worker thread, so ingestions (and other writes to
+a project's `references.json` submitted through `run_exclusive`) never run
+concurrently for the same project, while the event loop stays free to serve
+other requests. Worker threads exit once their project has no queued work.
+"""
+from __future__ import annotations
+
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+from uuid import uuid4
+
+from sidecar.config import INGEST_JOB_RETENTION, logger
+from sidecar.projects.generations import project_generations
+from sidecar.projects.service import get_project_uploads_path
+from sidecar.references import ingest
+from sidecar.references.schemas import (
+    IngestJob,
+    IngestJobStatus,
+    IngestResponse,
+    IngestStatus,
+    ReferenceStatus,
+)
+
+logger = logger.getChild(__name__)
+
+
+class IngestJobQueue:
+    def __init__(self, retention: int = INGEST_JOB_RETENTION):
+        self.retention = retention
+        self._executors: dict[str, ThreadPoolExecutor] = {}
+        # number of unfinished tasks submitted to each project's executor
+        self._pending: dict[str, int] = {}
+        self._jobs: dict[str, IngestJob] = {}
+        self._futures: dict[str, Future] = {}
+        self._cancel_events: dict[str, threading.Event] = {}
+        self._ingestions: dict[str, ingest.PDFIngestion] = {}
+        # ids of finished jobs, oldest first
+        self._finished: deque[str] = deque()
+        self._lock = threading.Lock()
+
+    def run_exclusive(self, project_id: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Runs `fn` on the project's worker thread, after any queued ingestion.
+        """
+        with self._lock:
+            executor = self._executors.get(project_id)
+            if executor is None:
+                executor = self._executors[project_id] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"ingest-{project_id}"
+                )
+            self._pending[project_id] = self._pending.get(project_id, 0) + 1
+            future = executor.submit(fn, *args, **kwargs)
+
+        future.add_done_callback(lambda _: self._release_executor(project_id))
+        return future
+
+    def _release_executor(self, project_id: str) -> None:
+        with self._lock:
+            self._pending[project_id] -= 1
+            if self._pending[project_id]:
+                return
+            del self._pending[project_id]
+            executor = self._executors.pop(project_id)
+
+        # nothing is queued for the project: let its worker thread exit
+        executor.shutdown(wait=False)
+
+    def _retire(self, job_id: str) -> None:
+        """
+        Records a finished job, forgetting the oldest finished jobs once more
+        than `retention` are kept.
+        """
+        with self._lock:
+            self._finished.append(job_id)
+            while len(self._finished) > self.retention:
+                expired = self._finished.popleft()
+                self._jobs.pop(expired, None)
+                self._futures.pop(expired, None)
+                self._cancel_events.pop(expired, None)
+
+    def submit(self, user_id: str, project_id: str) -> IngestJob:
+        """
+        Queues an ingestion of the project's uploads.
+        """
+        job = IngestJob(
+            job_id=str(uuid4()),
+            project_id=project_id,
+            status=IngestJobStatus.QUEUED,
+        )
+        self._jobs[job.job_id] = job
+        self._cancel_events[job.job_id] = threading.Event()
+        future = self.run_exclusive(project_id, self._run, user_id, job)
+        self._futures[job.job_id] = future
+        future.add_done_callback(lambda _: self._retire(job.job_id))
+        return job
+
+    def _run(self, user_id: str, job: IngestJob) -> IngestResponse | None:
+        cancel_event = self._cancel_events[job.job_id]
+        if cancel_event.is_set():
+            job.status = IngestJobStatus.CANCELLED
+            return None
+
+        try:
+            uploads_dir = get_project_uploads_path(user_id, job.project_id)
+            ingestion = ingest.PDFIngestion(
+                input_dir=uploads_dir, cancel_event=cancel_event
+            )
+        except Exception as e:
+            job.status = IngestJobStatus.FAILED
+            job.message = str(e)
+            raise
+
+        self._ingestions[job.job_id] = ingestion
+        job.status = IngestJobStatus.RUNNING
+
+        try:
+            response = ingestion.run()
+        except ingest.IngestCancelled as e:
+            job.status = IngestJobStatus.CANCELLED
+            job.message = str(e)
+            return None
+        except Exception as e:
+            logger.error(f"Ingestion job {job.job_id} failed: {e}")
+            job.status = IngestJobStatus.FAILED
+            job.message = str(e)
+            raise
+        finally:
+            job.files = self._get_file_statuses(ingestion)
+            self._ingestions.pop(job.job_id, None)
+            # ingestion writes the project's files and references directly
+            project_generations.bump(job.project_id)
+
+        job.status = IngestJobStatus.COMPLETE
+        job.message = response.message
+        return response
+
+    def _get_file_statuses(
+        self, ingestion: ingest.PDFIngestion
+    ) -> list[ReferenceStatus]:
+        references = {ref.source_filename: ref for ref in ingestion.references}
+        statuses = []
+        for filename in ingestion.ingested_filenames:
+            if filename in references:
+                status = references[filename].status
+            else:
+                status = ingestion.progress.statuses.get(
+                    filename, IngestStatus.PROCESSING
+                )
+            statuses.append(ReferenceStatus(source_filename=filename, status=status))
+        return statuses
+
+    def get(self, project_id: str, job_id: str) -> IngestJob | None:
+        """
+        Returns a job, including the progress of each file being ingested.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.project_id != project_id:
+            return None
+
+        ingestion = self._ingestions.get(job_id)
+        if ingestion is not None:
+            job.files = self._get_file_statuses(ingestion)
+        return job
+
+    def cancel(self, project_id: str, job_id: str) -> IngestJob | None:
+        """
+        Cancels a job. Queued jobs never start; running jobs stop before their
+        next stage, without saving any References.
+        """
+        job = self.get(project_id, job_id)
+        if job is None:
+            return None
+
+        if job.status in (IngestJobStatus.QUEUED, IngestJobStatus.RUNNING):
+            self._cancel_events[job_id].set()
+            if self._futures[job_id].cancel():
+                job.status = IngestJobStatus.CANCELLED
+        return job
+
+    def future(self, job_id: str) -> Future:
+        return self._futures[job_id]
+
+
+ingest_jobs = IngestJobQueue()
@@ -0,0 +1,365 @@
+"""
+Single-pass PDF text extraction.
+
+Each PDF is parsed with pypdf at most once per content hash: the per-page
+text is kept in a small in-memory LRU and persisted as a JSON artifact in
+`PDF_TEXT_CACHE_DIR`, so full-text extraction and chunking of the same file
+(or of an identical copy in another directory) share one parse. Artifacts
+are deleted least recently used first once the cache directory grows past
+`PDF_TEXT_CACHE_MAX_BYTES`.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable
+
+from sidecar.config import (
+    PDF_EXTRACTION_TIMEOUT,
+    PDF_EXTRACTION_WORKERS,
+    PDF_TEXT_CACHE_DIR,
+    PDF_TEXT_CACHE_MAX_BYTES,
+    logger,
+)
+from sidecar.fileio import atomic_write_json
+
+logger = logger.getChild(__name__)
+
+ARTIFACT_VERSION = 1
+
+
+def hash_file(filepath: Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def parse_pages(filepath: Path) -> list[str]:
+    """
+    Parses a PDF with pypdf, returning the extracted text of each page.
+    """
+    # imported here (i.e. in the extraction workers) as it is slow to load
+    import pypdf
+
+    reader = pypdf.PdfReader(str(filepath))
+    return [page.extract_text() for page in reader.pages]
+
+
+class PdfTextCache:
+    """
+    Per-page PDF text keyed by content hash.
+
+    Lookups check the in-memory LRU first, then the on-disk artifact
+    (`{cache_dir}/{sha256}.json`), and only parse the PDF when neither exists.
+    Reading an artifact updates its modification time, which orders the
+    artifacts for eviction once they take up more than `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = PDF_TEXT_CACHE_DIR,
+        max_entries: int = 64,
+        max_bytes: int = PDF_TEXT_CACHE_MAX_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, list[str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def artifact_path(self, content_hash: str) -> Path:
+        return self.cache_dir.joinpath(f"{content_hash}.json")
+
+    def _load_artifact(self, content_hash: str) -> list[str] | None:
+        filepath = self.artifact_path(content_hash)
+        try:
+            with open(filepath, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if data.get("version") != ARTIFACT_VERSION:
+            return None
+
+        try:
+            # marks the artifact as recently used
+            os.utime(filepath)
+        except OSError:
+            pass
+        return data["pages"]
+
+    def _save_artifact(self, content_hash: str, pages: list[str]) -> None:
+        filepath = self.artifact_path(content_hash)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(filepath, {"version": ARTIFACT_VERSION, "pages": pages})
+        except OSError as e:
+            # the artifact is only an optimization, so never fail extraction
+            logger.warning(f"Unable to write PDF text artifact {filepath}: {e}")
+            return
+        self.prune()
+
+    def prune(self) -> None:
+        """
+        Deletes the least recently used artifacts until the cache directory
+        takes up at most `max_bytes`.
+        """
+        artifacts = []
+        for filepath in self.cache_dir.glob("*.json"):
+            try:
+                stat = filepath.stat()
+            except FileNotFoundError:
+                continue
+            artifacts.append((stat.st_mtime_ns, stat.st_size, filepath))
+
+        total = sum(size for _, size, _ in artifacts)
+        for _, size, filepath in sorted(artifacts):
+            if total <= self.max_bytes:
+                break
+            try:
+                filepath.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Unable to delete PDF text artifact {filepath}: {e}")
+                continue
+            total -= size
+
+    def _remember(self, content_hash: str, pages: list[str]) -> None:
+        with self._lock:
+            self._entries[content_hash] = pages
+            self._entries.move_to_end(content_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, content_hash: str) -> list[str] | None:
+        """
+        Returns cached pages for `content_hash`, or None if it was never parsed.
+        """
+        with self._lock:
+            pages = self._entries.get(content_hash)
+            if pages is not None:
+                self._entries.move_to_end(content_hash)
+                return pages
+
+        pages = self._load_artifact(content_hash)
+        if pages is not None:
+            self._remember(content_hash, pages)
+        return pages
+
+    def store(self, content_hash: str, pages: list[str], persist: bool = True):
+        """
+        Caches pages for `content_hash`. Non-persisted entries only live for
+        the lifetime of this process (used for PDFs that failed to parse, so
+        they are retried after a restart).
+        """
+        if persist:
+            self._save_artifact(content_hash, pages)
+        self._remember(content_hash, pages)
+
+    def get_pages(self, filepath: Path) -> list[str]:
+        """
+        Returns the text of each page of the PDF at `filepath`, parsing it
+        only if no artifact exists for its contents yet.
+
+        Raises
+        ------
+        FileNotFoundError
+            If `filepath` does not exist
+        """
+        content_hash = hash_file(filepath)
+
+        pages = self.lookup(content_hash)
+        if pages is None:
+            logger.info(f"Extracting text from PDF: {Path(filepath).name}")
+            pages = parse_pages(filepath)
+            self.store(content_hash, pages)
+        return pages
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+pdf_text_cache = PdfTextCache()
+
+
+def extract_pages(filepath: Path) -> list[str]:
+    """
+    Returns the text of each page of a PDF, using the process-wide cache.
+    """
+    return pdf_text_cache.get_pages(filepath)
+
+
+def _register_worker(worker_pids) -> None:
+    # runs in each worker process as it starts
+    worker_pids.put(os.getpid())
+
+
+def _kill_pool(executor: ProcessPoolExecutor, worker_pids) -> None:
+    """
+    Shuts down a process pool without waiting for running tasks, terminating
+    its worker processes (a stuck pypdf call cannot be cancelled otherwise).
+    The workers' pids are those they registered with `_register_worker`.
+    """
+    executor.shutdown(wait=False, cancel_futures=True)
+    while not worker_pids.empty():
+        try:
+            os.kill(worker_pids.get(), signal.SIGTERM)
+        except OSError:
+            # the worker has exited already
+            pass
+
+
+def extract_pages_in_pool(
+    filepaths: list[Path],
+    max_workers: int = PDF_EXTRACTION_WORKERS,
+    timeout: float = PDF_EXTRACTION_TIMEOUT,
+    cache: PdfTextCache = None,
+    parse: Callable[[Path], list[str]] = parse_pages,
+) -> dict[Path, bool]:
+    """
+    Parses PDFs on a pool of worker processes, filling the PDF text cache so
+    that later `extract_pages` calls for these files are cache hits.
+
+    Each PDF gets at most `timeout` seconds of worker time. When a PDF times
+    out, the pool is killed (taking the stuck worker with it), the PDF is
+    recorded as unparseable and the other in-flight PDFs are resubmitted to a
+    fresh pool. When a worker crashes, every in-flight PDF fails with it, so
+    those PDFs are retried one at a time: a crash is only charged to a PDF
+    that was parsed alone, and PDFs that crash a worker twice are recorded as
+    unparseable too. Unparseable PDFs are cached (in memory only) as having
+    no pages.
+
+    Parameters
+    ----------
+    filepaths : list[Path]
+        PDFs to parse
+    max_workers : int, optional
+        Number of worker processes
+    timeout : float, optional
+        Maximum number of seconds spent parsing a single PDF
+    cache : PdfTextCache, optional
+        Cache to fill, by default the process-wide cache
+    parse : Callable[[Path], list[str]], optional
+        Picklable function returning the text of each page of a PDF
+
+    Returns
+    -------
+    dict[Path, bool]
+        False for PDFs that failed, timed out or crashed, keyed by filepath
+    """
+    cache = cache or pdf_text_cache
+
+    # identical copies of a PDF are only parsed once
+    hash_to_paths: dict[str, list[Path]] = {}
+    for filepath in filepaths:
+        hash_to_paths.setdefault(hash_file(filepath), []).append(filepath)
+
+    results = {}
+    queue = []
+    for content_hash, paths in hash_to_paths.items():
+        if cache.lookup(content_hash) is not None:
+            results.update({filepath: True for filepath in paths})
+        else:
+            queue.append(content_hash)
+
+    def record(content_hash: str, pages: list[str] | None) -> None:
+        if pages is None:
+            cache.store(content_hash, [], persist=False)
+        else:
+            cache.store(content_hash, pages)
+        for filepath in hash_to_paths[content_hash]:
+            results[filepath] = pages is not None
+
+    crashes: dict[str, int] = {}
+    # PDFs that were in flight when a worker crashed, parsed one at a time
+    isolated: list[str] = []
+
+    # `spawn` avoids forking a multi-threaded server process
+    context = multiprocessing.get_context("spawn")
+
+    while queue or isolated:
+        pending = isolated if isolated else queue
+        workers = 1 if isolated else min(max_workers, len(queue))
+        worker_pids = context.SimpleQueue()
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_register_worker,
+            initargs=(worker_pids,),
+        )
+        in_flight: dict[Future, tuple[str, float]] = {}
+        killed = False
+        crashed = False
+
+        while (pending or in_flight) and not killed:
+            # only submit as many PDFs as there are workers, so that the
+            # submission time approximates when a PDF starts being parsed
+            while pending and len(in_flight) < workers:
+                content_hash = pending.pop(0)
+                future = executor.submit(parse, hash_to_paths[content_hash][0])
+                in_flight[future] = (content_hash, time.monotonic())
+
+            next_deadline = min(started for _, started in in_flight.values())
+            remaining = max(0.0, next_deadline + timeout - time.monotonic())
+            done, _ = wait(in_flight, timeout=remaining, return_when=FIRST_COMPLETED)
+            num_in_flight = len(in_flight)
+
+            for future in done:
+                content_hash, _ = in_flight.pop(future)
+                filename = hash_to_paths[content_hash][0].name
+                try:
+                    record(content_hash, future.result())
+                except BrokenProcessPool:
+                    killed = True
+                    if num_in_flight > 1:
+                        # any of the in-flight PDFs may have crashed the worker
+                        crashed = True
+                        isolated.append(content_hash)
+                        continue
+                    crashes[content_hash] = crashes.get(content_hash, 0) + 1
+                    if crashes[content_hash] >= 2:
+                        logger.error(f"PDF text extraction crashed for {filename}")
+                        record(content_hash, None)
+                    else:
+                        pending.append(content_hash)
+                except Exception as e:
+                    logger.error(f"PDF text extraction failed for {filename}: {e}")
+                    record(content_hash, None)
+
+            now = time.monotonic()
+            for future, (content_hash, started) in list(in_flight.items()):
+                if now - started >= timeout and not future.done():
+                    filename = hash_to_paths[content_hash][0].name
+                    logger.error(f"PDF text extraction timed out for {filename}")
+                    record(content_hash, None)
+                    del in_flight[future]
+                    killed = True
+
+        if killed:
+            # resubmit PDFs that were running alongside the killed worker
+            running = [content_hash for content_hash, _ in in_flight.values()]
+            if crashed:
+                isolated.extend(running)
+            else:
+                pending[:0] = running
+            _kill_pool(executor, worker_pids)
+        else:
+            executor.shutdown()
+
+    return results
@@ -1,11 +1,19 @@
+import asyncio
+import zlib
 from typing import Union
 
-from fastapi import APIRouter
-from sidecar.projects.service import get_project_uploads_path
-from sidecar.references import ingest, storage
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from sidecar.projects.generations import etag_matches, project_generations
+from sidecar.references import pdf, storage
+from sidecar.references.jobs import ingest_jobs
 from sidecar.references.schemas import (
     DeleteRequest,
     DeleteStatusResponse,
+    IngestBatchItemStatus,
+    IngestBatchRequest,
+    IngestBatchResult,
+    IngestJob,
     IngestMetadataRequest,
     IngestRequestType,
     IngestResponse,
@@ -14,7 +22,17 @@ from sidecar.references.schemas import (
     ReferencePatch,
     UpdateStatusResponse,
 )
-from sidecar.references.service import create_reference
+from sidecar.references.service import (
+    create_reference,
+    create_references,
+    delete_references,
+    fetch_pdf,
+    fetch_pdfs,
+    paginate_references,
+    parse_reference_fields,
+    serialize_reference,
+    update_reference,
+)
 
 IngestibleRequest = Union[IngestMetadataRequest, IngestUploadsRequest]
 
@@ -24,17 +42,90 @@ router = APIRouter(
 )
 
 
-@router.get("/{project_id}")
-async def list_references(project_id: str) -> list[Reference]:
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+@router.get(
+    "/{project_id}",
+    # the response is serialized by hand, with only the requested fields
+    response_model=None,
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/Reference"},
+                    }
+                },
+                NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}},
+            },
+            "description": (
+                "References, as a JSON array or, if requested with "
+                f"`Accept: {NDJSON_MEDIA_TYPE}`, streamed one per line. "
+                "Only the requested `fields` of each reference are included. "
+                "The `X-Next-Cursor` header is set if there are more pages."
+            ),
+        },
+        304: {"description": "The references have not changed (see `ETag`)."},
+    },
+)
+async def list_references(
+    project_id: str,
+    request: Request,
+    limit: int = Query(None, ge=1),
+    cursor: str = None,
+    fields: str = None,
+) -> Response:
     """
-    Returns a list of references for the current user
+    Returns a list of references for the current user.
+
+    References are returned in pages of up to `limit` references: pass the
+    `X-Next-Cursor` response header as `cursor` to get the next page.
+    `fields` is a comma-separated list of the fields to return (`*` for all).
+    By default, `contents` and `chunks` are left out.
+
+    Responses carry an `ETag`: if it is sent back in `If-None-Match` and the
+    project's references have not changed since, the response is an empty
+    `304 Not Modified`.
     """
     user_id = "user1"
+    ndjson = NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+    # the tag is taken before reading, so a concurrent write can only make it
+    # stale (and the next poll a full response), never hide the write
+    variant = zlib.crc32(f"{request.url.query}|{ndjson}".encode())
+    etag = project_generations.etag(project_id, variant=f"{variant:08x}")
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
     try:
         store = storage.get_references_json_storage(user_id, project_id)
     except FileNotFoundError:
-        return []
-    return store.references
+        return Response("[]", media_type="application/json")
+
+    try:
+        page, next_cursor = paginate_references(store.references, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    include = parse_reference_fields(fields)
+    headers = {"ETag": etag}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+
+    if ndjson:
+
+        def stream_lines():
+            for ref in page:
+                yield serialize_reference(ref, include) + "\n"
+
+        return StreamingResponse(
+            stream_lines(), media_type=NDJSON_MEDIA_TYPE, headers=headers
+        )
+
+    content = "[" + ",".join(serialize_reference(ref, include) for ref in page) + "]"
+    return Response(content, media_type="application/json", headers=headers)
 
 
 @router.post("/{project_id}")
@@ -43,16 +134,37 @@ async def ingest_references(
 ) -> IngestResponse:
     """
     Creates references from a PDF directory or URL.
+
+    Runs on the project's ingestion worker (see `POST /{project_id}/jobs`)
+    and waits for it to finish, without blocking other requests.
+    A PDF URL is downloaded before the worker is taken.
     """
     user_id = "user1"
 
     if request.type == IngestRequestType.UPLOADS_DIRECTORY:
-        uploads_dir = get_project_uploads_path(user_id, project_id)
-        response = ingest.run_ingest(pdf_directory=uploads_dir)
+        job = ingest_jobs.submit(user_id, project_id)
+        response = await asyncio.wrap_future(ingest_jobs.future(job.job_id))
+        if response is None:
+            response = IngestResponse(
+                project_name=project_id, references=[], message=job.message
+            )
 
     elif request.type == IngestRequestType.METADATA:
-        reference, message = create_reference(
-            project_id, metadata=request.metadata, url=request.url
+        # the PDF is downloaded before taking the project's worker
+        metadata, pdf_filepath, message = request.metadata, None, ""
+        if request.url:
+            metadata, pdf_filepath, message = await fetch_pdf(
+                request.url, project_id, user_id, request.metadata
+            )
+
+        reference = await asyncio.wrap_future(
+            ingest_jobs.run_exclusive(
+                project_id,
+                create_reference,
+                project_id,
+                metadata=metadata,
+                pdf_filepath=pdf_filepath,
+            )
         )
         response = IngestResponse(
             project_name=project_id, references=[reference], message=message
@@ -61,6 +173,114 @@ async def ingest_references(
     return response
 
 
+@router.post(
+    "/{project_id}/batch",
+    responses={
+        200: {
+            "content": {NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}}},
+            "description": "The progress of each item, streamed one per line.",
+        },
+    },
+)
+async def ingest_references_batch(
+    project_id: str, request: IngestBatchRequest
+) -> IngestBatchResult:
+    """
+    Creates many references from metadata and PDF URLs, streaming the
+    progress of each item as newline-delimited JSON (`IngestBatchResult`).
+
+    PDFs are downloaded concurrently and their text extracted in parallel,
+    then all references are created and persisted at once on the project's
+    ingestion worker.
+    """
+    user_id = "user1"
+    items = [(item.metadata, item.url) for item in request.items]
+
+    async def stream_results():
+        fetched = [None] * len(items)
+        worker = None
+
+        def remove_downloads(*_):
+            # remove downloads that were not moved to the project's uploads,
+            # e.g. because the client went away
+            for item in fetched:
+                if item and item[1]:
+                    item[1].unlink(missing_ok=True)
+
+        try:
+            async for index, metadata, pdf_filepath, message in fetch_pdfs(
+                items, project_id, user_id
+            ):
+                fetched[index] = (metadata, pdf_filepath, message)
+                if items[index][1]:
+                    status = (
+                        IngestBatchItemStatus.FETCHED
+                        if pdf_filepath
+                        else IngestBatchItemStatus.FAILURE
+                    )
+                    result = IngestBatchResult(
+                        index=index, status=status, message=message
+                    )
+                    yield result.json() + "\n"
+
+            pdf_filepaths = [f for _, f, _ in fetched if f]
+            if pdf_filepaths:
+                await asyncio.to_thread(pdf.extract_pages_in_pool, pdf_filepaths)
+
+            worker = ingest_jobs.run_exclusive(
+                project_id,
+                create_references,
+                project_id,
+                [(metadata, f) for metadata, f, _ in fetched],
+            )
+            references = await asyncio.wrap_future(worker)
+        finally:
+            if worker is None:
+                remove_downloads()
+            else:
+                # the worker keeps using the downloads if the client went away
+                # while it was running, so only remove them once it is done
+                worker.add_done_callback(remove_downloads)
+
+        for index, reference in enumerate(references):
+            result = IngestBatchResult(
+                index=index,
+                status=IngestBatchItemStatus.COMPLETE,
+                reference=reference,
+                message=fetched[index][2],
+            )
+            yield result.json() + "\n"
+
+    return StreamingResponse(stream_results(), media_type=NDJSON_MEDIA_TYPE)
+
+
+@router.post("/{project_id}/jobs")
+async def submit_ingest_job(project_id: str) -> IngestJob:
+    """
+    Starts ingesting the project's uploads in the background.
+    Ingestion jobs for the same project run one at a time, in order.
+    """
+    user_id = "user1"
+    return ingest_jobs.submit(user_id, project_id)
+
+
+@router.get("/{project_id}/jobs/{job_id}")
+async def get_ingest_job(project_id: str, job_id: str) -> IngestJob | None:
+    """
+    Returns the status of an ingestion job and the progress of each file
+    """
+    return ingest_jobs.get(project_id, job_id)
+
+
+@router.delete("/{project_id}/jobs/{job_id}")
+async def cancel_ingest_job(project_id: str, job_id: str) -> IngestJob | None:
+    """
+    Cancels an ingestion job. References are only saved once ingestion has
+    finished, so a cancelled job does not modify the project's references.
+    """
+    return ingest_jobs.cancel(project_id, job_id)
+
+
 @router.get("/{project_id}/{reference_id}")
 async def http_get(project_id: str, reference_id: str) -> Reference | None:
     user_id = "user1"
@@ -73,23 +293,45 @@ async def http_get(project_id: str, reference_id: str) -> Reference | None:
 async def http_update(
     project_id: str, reference_id: str, req: ReferencePatch
 ) -> UpdateStatusResponse:
-    user_id = "user1"
-    store = storage.get_references_json_storage(user_id, project_id)
-    response = store.update(reference_id, req)
+    """
+    Updates a reference.
+
+    Runs on the project's ingestion worker, after any queued ingestion, so
+    that an ingestion in progress does not save over the update.
+    """
+    response = await asyncio.wrap_future(
+        ingest_jobs.run_exclusive(
+            project_id, update_reference, project_id, reference_id, req
+        )
+    )
     return response
 
 
 @router.delete("/{project_id}/{reference_id}")
 async def http_delete(project_id: str, reference_id: str) -> DeleteStatusResponse:
-    user_id = "user1"
-    store = storage.get_references_json_storage(user_id, project_id)
-    response = store.delete(reference_ids=[reference_id])
+    """
+    Deletes a reference, on the project's ingestion worker (see `PATCH`).
+    """
+    response = await asyncio.wrap_future(
+        ingest_jobs.run_exclusive(
+            project_id, delete_references, project_id, [reference_id]
+        )
+    )
     return response
 
 
 @router.post("/{project_id}/bulk_delete")
 async def http_bulk_delete(project_id: str, req: DeleteRequest) -> DeleteStatusResponse:
-    user_id = "user1"
-    store = storage.get_references_json_storage(user_id, project_id)
-    response = store.delete(reference_ids=req.reference_ids, all_=req.all)
+    """
+    Deletes references, on the project's ingestion worker (see `PATCH`).
+    """
+    response = await asyncio.wrap_future(
+        ingest_jobs.run_exclusive(
+            project_id,
+            delete_references,
+            project_id,
+            req.reference_ids,
+            all_=req.all,
+        )
+    )
     return response
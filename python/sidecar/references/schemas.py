@@ -35,6 +35,10 @@ class Reference(RefStudioModel):
     authors: list["Author"] = []
     chunks: list["Chunk"] = []
     metadata: dict[str, Any] = {}
+    # signature of the uploaded PDF, used to skip unchanged files on ingest
+    content_hash: str | None = None
+    file_size: int | None = None
+    file_mtime_ns: int | None = None
 
 
 class ReferenceCreate(RefStudioModel):
@@ -110,6 +114,52 @@ class IngestMetadataRequest(IngestRequest):
     url: str = None
 
 
+class IngestBatchItem(RefStudioModel):
+    metadata: ReferenceCreate
+    url: str = None
+
+
+class IngestBatchRequest(RefStudioModel):
+    items: list[IngestBatchItem]
+
+
+class IngestBatchItemStatus(StrEnum):
+    FETCHED = "fetched"
+    FAILURE = "failure"
+    COMPLETE = "complete"
+
+
+class IngestBatchResult(RefStudioModel):
+    """
+    Progress of one item of an `IngestBatchRequest`, by its index in `items`.
+    Items with a URL are reported as `fetched` or `failure` once downloaded,
+    then every item is reported as `complete` with its Reference.
+    """
+
+    index: int
+    status: IngestBatchItemStatus
+    reference: Reference | None = None
+    message: str = ""
+
+
+class IngestJobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETE = "complete"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class IngestJob(RefStudioModel):
+    """A background ingestion of a project's uploads"""
+
+    job_id: str
+    project_id: str
+    status: IngestJobStatus
+    files: list[ReferenceStatus] = []
+    message: str = ""
+
+
 class IngestStatusResponse(RefStudioModel):
     status: ResponseStatus
     reference_statuses: list[ReferenceStatus]
@@ -1,22 +1,35 @@
-import shutil
+import asyncio
+import base64
+import itertools
+import json
+import os
 from collections import defaultdict
 from pathlib import Path
-from typing import Tuple
+from typing import AsyncIterator, Optional, Tuple, Union
+from urllib.parse import urlparse
 from uuid import uuid4
 
-import requests
-from requests.exceptions import HTTPError
 from sidecar import shared
-from sidecar.config import logger
+from sidecar.config import PDF_FETCH_MAX_CONNECTIONS_PER_HOST
 from sidecar.projects import service as projects_service
 from sidecar.references import storage
-from sidecar.references.schemas import IngestStatus, Reference, ReferenceCreate
+from sidecar.references.citation_keys import CitationKeyIndex
+from sidecar.references.fetch import pdf_fetcher
+from sidecar.references.schemas import (
+    DeleteStatusResponse,
+    IngestStatus,
+    Reference,
+    ReferenceCreate,
+    ReferencePatch,
+    UpdateStatusResponse,
+)
 from sidecar.shared import chunk_reference
 
 
-def is_fetchable_pdf(url: str) -> Tuple[bool, str]:
+async def is_fetchable_pdf(url: str) -> Tuple[bool, str]:
     """
-    Determines if a URL points to a PDF that can be fetched.
+    Determines if a URL points to a PDF that can be fetched, without
+    downloading it.
 
     Parameters
     ----------
@@ -30,37 +43,18 @@ def is_fetchable_pdf(url: str) -> Tuple[bool, str]:
     str
         The reason why the PDF could not be fetched.
     """
-    try:
-        response = requests.get(url)
-
-        if not response.ok:
-            reason = f"Unable to fetch {url}, status code {response.status_code}"
-            logger.info(reason)
-            return False, reason
-
-        if response.status_code == 302:
-            location = response.headers.get("location")
-
-            if location:
-                return is_fetchable_pdf(location)
-
-        if "application/pdf" not in response.headers.get("content-type", ""):
-            reason = f"Unable to fetch {url}, content-type is not PDF"
-            logger.info(reason)
-            return False, reason
-
-        return True, ""
-    except requests.exceptions.RequestException:
-        reason = f"Unable to fetch {url}, request exception"
-        logger.info(reason)
-        return False, reason
+    return await pdf_fetcher.probe(url)
 
 
-def fetch_pdf_to_uploads(
+async def fetch_pdf(
     url: str, project_id: str, user_id: str, metadata: ReferenceCreate
-) -> Tuple[ReferenceCreate, str]:
+) -> Tuple[ReferenceCreate, Optional[Path], str]:
     """
-    Fetches a PDF from a URL and saves it to the project's uploads directory.
+    Downloads a PDF from a URL to the project's staging directory.
+    The download is streamed to disk, without blocking the event loop.
+
+    It is kept under a temporary name until `create_reference` moves it to the
+    project's uploads, so that it is not picked up by an ingestion job.
 
     Parameters
     ----------
@@ -77,44 +71,123 @@ def fetch_pdf_to_uploads(
     -------
     ReferenceCreate
         The metadata of the reference to create.
+    Path, optional
+        The downloaded PDF, if it could be fetched.
     str
         The reason why the PDF could not be fetched.
     """
-    is_pdf, reason = is_fetchable_pdf(url)
+    is_pdf, reason = await is_fetchable_pdf(url)
 
     if not is_pdf:
-        return metadata, reason
-
-    response = requests.get(url)
+        return metadata, None, reason
 
     if not metadata.source_filename:
         filename = shared.clean_filename(metadata.title[:75])
         metadata.source_filename = f"{filename}.pdf"
 
     staged_filepath = projects_service.create_project_staging_filepath(
-        user_id, project_id, metadata.source_filename
+        user_id, project_id, f".{uuid4().hex}.{metadata.source_filename}.part"
     )
-    upload_filepath = projects_service.create_project_uploads_filepath(
-        user_id, project_id, metadata.source_filename
+    # if `uploads` ingest has never been run, this directory might not exist yet
+    staged_filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    downloaded, reason = await pdf_fetcher.download(url, staged_filepath)
+    if not downloaded:
+        return metadata, None, reason
+
+    return metadata, staged_filepath, ""
+
+
+async def fetch_pdfs(
+    items: list[Tuple[ReferenceCreate, Optional[str]]], project_id: str, user_id: str
+) -> AsyncIterator[Tuple[int, ReferenceCreate, Optional[Path], str]]:
+    """
+    Downloads the PDFs of many references concurrently (see `fetch_pdf`),
+    with at most `PDF_FETCH_MAX_CONNECTIONS_PER_HOST` downloads per host.
+
+    Parameters
+    ----------
+    items : list[Tuple[ReferenceCreate, str]]
+        The metadata of each reference, and the URL of its PDF (or None).
+    project_id : str
+        The ID of the project to add the references to.
+    user_id : str
+        The ID of the user who owns the project.
+
+    Yields
+    ------
+    Tuple[int, ReferenceCreate, Path, str]
+        The index of an item, followed by what `fetch_pdf` returned for it,
+        as soon as its download finishes.
+    """
+    host_limits = defaultdict(
+        lambda: asyncio.Semaphore(PDF_FETCH_MAX_CONNECTIONS_PER_HOST)
     )
 
-    # if `uploads` ingest has never been run, these directories might not exist yet
-    staged_filepath.parent.mkdir(parents=True, exist_ok=True)
-    upload_filepath.parent.mkdir(parents=True, exist_ok=True)
+    async def fetch_one(index: int, metadata: ReferenceCreate, url: Optional[str]):
+        if not url:
+            return index, metadata, None, ""
+        async with host_limits[urlparse(url).netloc]:
+            return (index, *await fetch_pdf(url, project_id, user_id, metadata))
+
+    tasks = [
+        asyncio.ensure_future(fetch_one(index, metadata, url))
+        for index, (metadata, url) in enumerate(items)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def reserve_upload_filepath(user_id: str, project_id: str, filename: str) -> Path:
+    """
+    Returns a path in the project's uploads directory that no other upload
+    uses: `filename`, or `filename` with a `-1`, `-2`, ... suffix added to its
+    stem. The path is reserved by creating an empty file there.
+    """
+    filepath = projects_service.create_project_uploads_filepath(
+        user_id, project_id, filename
+    )
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    for i in itertools.count():
+        candidate = filepath.with_stem(f"{filepath.stem}-{i}") if i else filepath
+        try:
+            # exclusive creation, so that concurrent moves get distinct names
+            fd = os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return candidate
 
-    with open(staged_filepath, "wb") as f:
-        f.write(response.content)
 
-    shutil.copyfile(staged_filepath, upload_filepath)
-    staged_filepath.unlink()
+def move_pdf_to_uploads(
+    pdf_filepath: Path, project_id: str, user_id: str, metadata: ReferenceCreate
+) -> ReferenceCreate:
+    """
+    Moves a PDF downloaded by `fetch_pdf` to the project's uploads directory,
+    and chunks its text.
+
+    If an upload with the same name exists already, the PDF is renamed with a
+    `-1`, `-2`, ... suffix (and `metadata.source_filename` updated) rather than
+    replacing it.
+    """
+    upload_filepath = reserve_upload_filepath(
+        user_id, project_id, metadata.source_filename
+    )
+    os.replace(pdf_filepath, upload_filepath)
+    metadata.source_filename = upload_filepath.name
 
     metadata.chunks = chunk_reference(metadata, filepath=upload_filepath)
-    return metadata, ""
+    return metadata
 
 
 def create_reference(
-    project_id: str, metadata: ReferenceCreate, url: str = None
-) -> Tuple[Reference, str]:
+    project_id: str, metadata: ReferenceCreate, pdf_filepath: Path = None
+) -> Reference:
     """
     Creates a reference.
 
@@ -124,51 +197,98 @@ def create_reference(
         The ID of the project to add the reference to.
     metadata : dict
         The metadata to add to the reference.
-    url : str, optional
-        The URL of the PDF to ingest.
+    pdf_filepath : Path, optional
+        The PDF of the reference, as downloaded by `fetch_pdf`.
 
     Returns
     -------
     Reference
         The created reference.
     """
+    return create_references(project_id, [(metadata, pdf_filepath)])[0]
+
+
+def create_references(
+    project_id: str, items: list[Tuple[ReferenceCreate, Optional[Path]]]
+) -> list[Reference]:
+    """
+    Creates references, assigning their citation keys together and
+    persisting them as a single change to the project's references.
+
+    Parameters
+    ----------
+    project_id : str
+        The ID of the project to add the references to.
+    items : list[Tuple[ReferenceCreate, Path]]
+        The metadata of each reference, and its PDF as downloaded by
+        `fetch_pdf` (or None).
+
+    Returns
+    -------
+    list[Reference]
+        The created references, in the order of `items`.
+    """
     user_id = "user1"
-    filepath = None
-    message = ""
     store = storage.get_references_json_storage(user_id, project_id)
 
-    if url:
-        try:
-            metadata, message = fetch_pdf_to_uploads(url, project_id, user_id, metadata)
-        except HTTPError as e:
-            logger.error(str(e))
-
-    if metadata.source_filename:
-        filepath = str(Path("uploads") / metadata.source_filename)
-
-    if isinstance(metadata.published_date, str):
-        metadata.published_date = shared.parse_date(metadata.published_date)
-
-    ref = Reference(
-        id=str(uuid4()),
-        source_filename=metadata.source_filename,
-        filepath=filepath,
-        status=IngestStatus.COMPLETE,
-        title=metadata.title,
-        abstract=metadata.abstract,
-        contents=metadata.contents,
-        published_date=metadata.published_date,
-        authors=metadata.authors,
-        chunks=metadata.chunks,
-        metadata=metadata.metadata,
-    )
-    add_citation_keys_for_references([ref], store.references)
-    store.add_reference(ref)
-    return store.get_reference(ref.id), message
+    refs = []
+    for metadata, pdf_filepath in items:
+        filepath = None
+        if pdf_filepath:
+            metadata = move_pdf_to_uploads(pdf_filepath, project_id, user_id, metadata)
+
+        if metadata.source_filename:
+            filepath = str(Path("uploads") / metadata.source_filename)
+
+        if isinstance(metadata.published_date, str):
+            metadata.published_date = shared.parse_date(metadata.published_date)
+
+        ref = Reference(
+            id=str(uuid4()),
+            source_filename=metadata.source_filename,
+            filepath=filepath,
+            status=IngestStatus.COMPLETE,
+            title=metadata.title,
+            abstract=metadata.abstract,
+            contents=metadata.contents,
+            published_date=metadata.published_date,
+            authors=metadata.authors,
+            chunks=metadata.chunks,
+            metadata=metadata.metadata,
+        )
+        refs.append(ref)
+
+    add_citation_keys_for_references(refs, index=store.citation_key_index)
+    store.add_references(refs)
+    return [store.get_reference(ref.id) for ref in refs]
+
+
+def update_reference(
+    project_id: str, reference_id: str, patch: ReferencePatch
+) -> UpdateStatusResponse:
+    """
+    Updates a reference with the values in `patch`.
+    """
+    user_id = "user1"
+    store = storage.get_references_json_storage(user_id, project_id)
+    return store.update(reference_id, patch)
+
+
+def delete_references(
+    project_id: str, reference_ids: list[str] = [], all_: bool = False
+) -> DeleteStatusResponse:
+    """
+    Deletes references by id, or all of the project's references.
+    """
+    user_id = "user1"
+    store = storage.get_references_json_storage(user_id, project_id)
+    return store.delete(reference_ids=reference_ids, all_=all_)
 
 
 def add_citation_keys_for_references(
-    new_references: list[Reference], existing_references: list[Reference] = []
+    new_references: list[Reference],
+    existing_references: list[Reference] = [],
+    index: CitationKeyIndex = None,
 ) -> None:
     """
     Adds unique citation keys to a list of Reference objects.
@@ -179,6 +299,9 @@ def add_citation_keys_for_references(
         The list of new Reference objects to add citation keys to.
     existing_references : list[Reference], optional
         The list of existing Reference objects to compare against.
+    index : CitationKeyIndex, optional
+        The index of the citation keys already allocated, e.g. a storage's
+        `citation_key_index`. By default, it is built from `existing_references`.
 
     Returns
     -------
@@ -198,58 +321,109 @@ def add_citation_keys_for_references(
     If a Reference does not have an author surname or published date,
     then the citation key becomes "untitled" and is appended with 1, 2, 3, etc.
 
-    If a Reference already has a citation key, then it is not modified.
+    Keys are allocated by `CitationKeyIndex`, and are never reused for
+    another Reference while the index is loaded.
 
     https://quarto.org/docs/authoring/footnotes-and-citations.html#sec-citations
     """
-    # we must determine the max current "appended" index for key
-    # (e.g. 1, 2, 3, a, b, c, etc.)
-    # this will determine the starting index for new references
-    #
-    # we do this by incrementing from what the citation key would have
-    # been in its "unappended" format -- what the key would be if we did not
-    # have any other references
-    max_existing_index_by_key = {}
-    for ref in existing_references:
-        key = shared.create_citation_key(ref)
-        if key not in max_existing_index_by_key:
-            max_existing_index_by_key[key] = 1
-        else:
-            max_existing_index_by_key[key] += 1
+    if index is None:
+        index = CitationKeyIndex()
+        index.build(existing_references)
 
-    new_ref_key_groups = defaultdict(list)
     for ref in new_references:
-        key = shared.create_citation_key(ref)
-        new_ref_key_groups[key].append(ref)
-
-    for key, new_refs_for_key in new_ref_key_groups.items():
-        idx = max_existing_index_by_key.get(key, 0)
-
-        # if no existing references ...
-        if idx == 0:
-            for i, ref in enumerate(new_refs_for_key):
-                # first ref always gets the "unappended" key
-                # this is necessary to maintain consistency upon new uploads
-                if i == 0:
-                    ref.citation_key = f"{key}"
-                else:
-                    if key == "untitled":
-                        # untitled refs get numbered 1, 2, 3, etc.
-                        ref.citation_key = f"{key}{i}"
-                    else:
-                        # others get numbered a, b, c, etc.
-                        ref.citation_key = f"{key}{chr(97 + i)}"
-
-        # if existing references, append as necessary starting
-        # from existing max index for the key
-        if idx > 0:
-            for i, ref in enumerate(new_refs_for_key):
-                if key == "untitled":
-                    # untitleds start at 1
-                    ref.citation_key = f"{key}{idx + i}"
-                else:
-                    # others start at a = chr(97)
-                    # so need to subtract 1 since idx >= 1
-                    ref.citation_key = f"{key}{chr(97 + idx - 1 + i)}"
+        ref.citation_key = index.allocate(ref)
 
     return new_references
+
+
+# fields that are not returned when listing references unless requested,
+# as they make up most of the size of a serialized Reference
+LARGE_REFERENCE_FIELDS = {"contents", "chunks"}
+
+
+def parse_reference_fields(fields: str = None) -> set[str]:
+    """
+    Returns the Reference fields to include in a listing, from a
+    comma-separated `fields` query parameter. `*` selects every field.
+    By default, every field except `contents` and `chunks` is included.
+
+    The `id` field is always included. Unknown field names are ignored.
+    """
+    all_fields = set(Reference.__fields__)
+    if not fields:
+        return all_fields - LARGE_REFERENCE_FIELDS
+
+    names = {name.strip() for name in fields.split(",")}
+    if "*" in names:
+        return all_fields
+    return (names & all_fields) | {"id"}
+
+
+def encode_cursor(position: int, reference_id: str) -> str:
+    """
+    Returns an opaque cursor for the reference at `position`: the next page
+    starts right after it.
+    """
+    data = json.dumps([position, reference_id]).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str]:
+    """
+    Raises
+    ------
+    ValueError
+        If the cursor is malformed
+    """
+    try:
+        position, reference_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return int(position), str(reference_id)
+    except (TypeError, ValueError) as e:
+        # includes binascii and JSON decoding errors
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def paginate_references(
+    references: list[Reference], limit: int = None, cursor: str = None
+) -> Tuple[list[Reference], Union[str, None]]:
+    """
+    Returns a page of references and the cursor of the next page, which is
+    None for the last page.
+
+    A cursor remembers the position and id of the last reference of the
+    previous page. If references were added or deleted before it since, the
+    page resumes after that reference's new position.
+
+    Raises
+    ------
+    ValueError
+        If the cursor is malformed
+    """
+    start = 0
+    if cursor:
+        position, reference_id = decode_cursor(cursor)
+        if 0 <= position < len(references) and references[position].id == reference_id:
+            start = position + 1
+        else:
+            positions = (
+                i for i, ref in enumerate(references) if ref.id == reference_id
+            )
+            found = next(positions, None)
+            # if the reference was deleted, the next one has taken its position
+            start = position if found is None else found + 1
+        start = max(0, min(start, len(references)))
+
+    end = len(references) if limit is None else min(start + limit, len(references))
+    page = references[start:end]
+
+    next_cursor = None
+    if end < len(references) and page:
+        next_cursor = encode_cursor(end - 1, page[-1].id)
+    return page, next_cursor
+
+
+def serialize_reference(reference: Reference, fields: set[str]) -> str:
+    """
+    Serializes the `fields` of a Reference as a single line of JSON.
+    """
+    return json.dumps(reference.dict(include=fields), default=str)
@@ -0,0 +1,443 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import typing
+from datetime import date
+from pathlib import Path
+from typing import Any
+
+from pydantic import ValidationError
+from sidecar.config import logger
+from sidecar.references.index import tokenize
+from sidecar.references.schemas import (
+    Author,
+    Chunk,
+    DeleteStatusResponse,
+    Reference,
+    ReferencePatch,
+    UpdateStatusResponse,
+)
+from sidecar.references.storage import BaseStorage, JsonStorage
+from sidecar.typing import ResponseStatus
+
+logger = logger.getChild(__name__)
+
+# Reference fields stored as columns of the `refs` table.
+# `authors` and `chunks` are stored in their own tables.
+REFERENCE_COLUMNS = [
+    name for name in Reference.__fields__ if name not in ("id", "authors", "chunks")
+]
+AUTHOR_COLUMNS = list(Author.__fields__)
+CHUNK_COLUMNS = list(Chunk.__fields__)
+
+
+def _is_json_field(model: type, name: str) -> bool:
+    outer_type = model.__fields__[name].outer_type_
+    return typing.get_origin(outer_type) in (dict, list)
+
+
+def _to_column(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _from_row(model: type, row: sqlite3.Row, columns: list[str]) -> dict:
+    data = {}
+    for name in columns:
+        value = row[name]
+        if value is not None and _is_json_field(model, name):
+            value = json.loads(value)
+        data[name] = value
+    return data
+
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS refs (
+    id TEXT PRIMARY KEY,
+    {", ".join(f"{name} TEXT" for name in REFERENCE_COLUMNS)}
+);
+
+CREATE TABLE IF NOT EXISTS authors (
+    reference_id TEXT NOT NULL REFERENCES refs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    {", ".join(f"{name} TEXT" for name in AUTHOR_COLUMNS)},
+    PRIMARY KEY (reference_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    reference_id TEXT NOT NULL REFERENCES refs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    {", ".join(f"{name} TEXT" for name in CHUNK_COLUMNS)},
+    UNIQUE (reference_id, position)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    text, content='chunks', content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS chunks_after_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts(rowid, text) VALUES (new.id, new.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS chunks_after_delete AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES('delete', old.id, old.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS chunks_after_update AFTER UPDATE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES('delete', old.id, old.text);
+    INSERT INTO chunks_fts(rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+
+def get_references_sqlite_path(json_filepath: Path) -> Path:
+    """
+    Returns the path of the SQLite database that sits next to a
+    `references.json` file.
+    """
+    return Path(json_filepath).with_suffix(".db")
+
+
+def migrate_json_to_sqlite(
+    json_filepath: Path, sqlite_filepath: Path = None
+) -> SqliteStorage:
+    """
+    Copies the references stored in a `references.json` file into a SQLite
+    database. The JSON file is left untouched.
+
+    Migration is one-shot: if the database already contains references,
+    nothing is copied.
+
+    Parameters
+    ----------
+    json_filepath : Path
+        Path to the `references.json` file to migrate
+    sqlite_filepath : Path, optional
+        Path to the SQLite database, by default `references.db` next to
+        the JSON file
+
+    Returns
+    -------
+    SqliteStorage
+        The loaded SQLite storage
+    """
+    if sqlite_filepath is None:
+        sqlite_filepath = get_references_sqlite_path(json_filepath)
+
+    store = SqliteStorage(sqlite_filepath)
+    store.load()
+
+    if store.references:
+        logger.warning(f"{sqlite_filepath} already contains references, skipping")
+        return store
+
+    jstore = JsonStorage(json_filepath)
+    jstore.load()
+
+    logger.info(
+        f"Migrating {len(jstore.references)} references "
+        f"from {json_filepath} to {sqlite_filepath}"
+    )
+    with store.conn:
+        for ref in jstore.references:
+            store._insert_reference(ref)
+
+    store.load()
+    return store
+
+
+class SqliteStorage(BaseStorage):
+    """
+    Reference storage backed by a SQLite database, with references, authors
+    and chunks in normalized tables.
+
+    Unlike JsonStorage, each write only touches the rows of the affected
+    references instead of rewriting the whole library. Chunk text is also
+    indexed in an FTS5 table.
+    """
+
+    def __init__(self, filepath: str):
+        super().__init__(filepath)
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.filepath, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self.initialize()
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def initialize(self):
+        """
+        Creates the database tables, adding any columns for Reference fields
+        that were introduced after the database was created.
+        """
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+            existing = {
+                row["name"] for row in self._conn.execute("PRAGMA table_info(refs)")
+            }
+            for name in REFERENCE_COLUMNS:
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE refs ADD COLUMN {name} TEXT")
+
+    def load(self):
+        authors_by_ref = {}
+        for row in self.conn.execute(
+            "SELECT * FROM authors ORDER BY reference_id, position"
+        ):
+            author = Author(**_from_row(Author, row, AUTHOR_COLUMNS))
+            authors_by_ref.setdefault(row["reference_id"], []).append(author)
+
+        chunks_by_ref = {}
+        for row in self.conn.execute(
+            "SELECT * FROM chunks ORDER BY reference_id, position"
+        ):
+            chunk = Chunk(**_from_row(Chunk, row, CHUNK_COLUMNS))
+            chunks_by_ref.setdefault(row["reference_id"], []).append(chunk)
+
+        self.references = []
+        for row in self.conn.execute("SELECT * FROM refs ORDER BY rowid"):
+            ref = Reference(
+                id=row["id"],
+                **_from_row(Reference, row, REFERENCE_COLUMNS),
+            )
+            ref.authors = authors_by_ref.get(ref.id, [])
+            ref.chunks = chunks_by_ref.get(ref.id, [])
+            self.references.append(ref)
+        self.create_corpus()
+
+    def _insert_reference(self, reference: Reference) -> None:
+        columns = ["id", *REFERENCE_COLUMNS]
+        values = [_to_column(getattr(reference, name)) for name in columns]
+        self.conn.execute(
+            f"INSERT INTO refs ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            values,
+        )
+        self._insert_authors(reference)
+        self._insert_chunks(reference)
+
+    def _insert_authors(self, reference: Reference) -> None:
+        columns = ["reference_id", "position", *AUTHOR_COLUMNS]
+        self.conn.executemany(
+            f"INSERT INTO authors ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            [
+                [reference.id, i, *[_to_column(getattr(a, c)) for c in AUTHOR_COLUMNS]]
+                for i, a in enumerate(reference.authors)
+            ],
+        )
+
+    def _insert_chunks(self, reference: Reference) -> None:
+        columns = ["reference_id", "position", *CHUNK_COLUMNS]
+        self.conn.executemany(
+            f"INSERT INTO chunks ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            [
+                [reference.id, i, *[_to_column(getattr(c, n)) for n in CHUNK_COLUMNS]]
+                for i, c in enumerate(reference.chunks)
+            ],
+        )
+
+    def add_reference(self, reference: Reference) -> None:
+        """
+        Add a Reference to storage.
+        """
+        self.add_references([reference])
+
+    def add_references(self, references: list[Reference]) -> None:
+        """
+        Add References to storage, in a single transaction.
+        """
+        if not references:
+            return
+
+        index = self._get_index_for_update()
+        vector_index = self._get_vector_index_for_update()
+        citation_keys = self._get_citation_key_index_for_update()
+
+        with self.conn:
+            for reference in references:
+                self._insert_reference(reference)
+
+        for reference in references:
+            self.references.append(reference)
+            self._add_to_corpus(reference)
+            if index is not None:
+                index.add_reference(reference)
+            if vector_index is not None:
+                vector_index.add_reference(reference)
+            if citation_keys is not None:
+                citation_keys.add_reference(reference)
+
+        for updated in [index, vector_index, citation_keys]:
+            if updated is not None:
+                updated.save()
+
+    def delete(self, reference_ids: list[str] = [], all_: bool = False):
+        """
+        Delete one or more References from storage.
+
+        Parameters
+        ----------
+        reference_ids : list[str]
+            List of reference ids to be deleted
+        all_ : bool, default False
+            Delete all References from storage
+        """
+        if not reference_ids and not all_:
+            msg = (
+                "`delete` operation requires one of " "`ids` or `all_` input parameters"
+            )
+            raise ValueError(msg)
+
+        refs = {ref.id: ref for ref in self.references}
+
+        if all_:
+            reference_ids = list(refs.keys())
+
+        for ref_id in reference_ids:
+            if ref_id not in refs:
+                msg = f"Unable to delete {ref_id}: not found in storage"
+                logger.warning(msg)
+                response = DeleteStatusResponse(
+                    status=ResponseStatus.ERROR, message=msg
+                )
+                return response
+
+        index = self._get_index_for_update()
+        vector_index = self._get_vector_index_for_update()
+        citation_keys = self._get_citation_key_index_for_update()
+
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM refs WHERE id = ?", [(ref_id,) for ref_id in reference_ids]
+            )
+
+        deleted = [refs.pop(ref_id) for ref_id in set(reference_ids)]
+        self.references = list(refs.values())
+        self.create_corpus()
+
+        for updated in [index, vector_index, citation_keys]:
+            if updated is not None:
+                for ref in deleted:
+                    updated.remove_reference(ref)
+                updated.save()
+
+        response = DeleteStatusResponse(status=ResponseStatus.OK, message="")
+        return response
+
+    def update(self, reference_id: str, patch: ReferencePatch):
+        """
+        Update a Reference in storage with the target reference.
+        Only the rows affected by the patch are written.
+
+        Parameters
+        ----------
+        reference_id : str
+            The id of the reference to be updated
+        patch : ReferencePatch
+            The patch object containing the updated reference data
+        """
+        target = self.get_reference(reference_id)
+
+        if target is None:
+            msg = f"Unable to update {reference_id}: not found in storage"
+            logger.error(msg)
+            response = UpdateStatusResponse(status=ResponseStatus.ERROR, message=msg)
+            return response
+
+        try:
+            updated = Reference(**{**target.dict(), **patch.data, "id": reference_id})
+        except ValidationError as e:
+            msg = f"Unable to update {reference_id}: {e}"
+            logger.error(msg)
+            response = UpdateStatusResponse(status=ResponseStatus.ERROR, message=msg)
+            return response
+
+        logger.info(f"Updating {reference_id} with new values: {patch.data}")
+
+        columns = [name for name in REFERENCE_COLUMNS if name in patch.data]
+        index = None
+        vector_index = None
+        if "chunks" in patch.data:
+            index = self._get_index_for_update()
+            vector_index = self._get_vector_index_for_update()
+
+        with self.conn:
+            if columns:
+                self.conn.execute(
+                    f"UPDATE refs SET {', '.join(f'{c} = ?' for c in columns)} "
+                    "WHERE id = ?",
+                    [_to_column(getattr(updated, c)) for c in columns] + [reference_id],
+                )
+            if "authors" in patch.data:
+                self.conn.execute(
+                    "DELETE FROM authors WHERE reference_id = ?", (reference_id,)
+                )
+                self._insert_authors(updated)
+            if "chunks" in patch.data:
+                self.conn.execute(
+                    "DELETE FROM chunks WHERE reference_id = ?", (reference_id,)
+                )
+                self._insert_chunks(updated)
+
+        self.references = [
+            updated if ref.id == reference_id else ref for ref in self.references
+        ]
+
+        # citation keys are kept when authors or dates are edited, and only
+        # change when set explicitly
+        if "citation_key" in patch.data:
+            citation_keys = self._get_citation_key_index_for_update()
+            if citation_keys is not None:
+                citation_keys.add_reference(updated)
+                citation_keys.save()
+
+        if "chunks" in patch.data:
+            self.create_corpus()
+            if index is not None:
+                index.remove_reference(target)
+                index.add_reference(updated)
+                index.save()
+            if vector_index is not None:
+                vector_index.add_reference(updated)
+                vector_index.save()
+
+        response = UpdateStatusResponse(status=ResponseStatus.OK, message="")
+        return response
+
+    def search(self, query: str, limit: int = 5) -> list[Chunk]:
+        """
+        Full-text search over chunk text using the FTS5 index,
+        ranked by SQLite's built-in BM25.
+        """
+        terms = [t.replace('"', '""') for t in tokenize(query)]
+        if not terms:
+            return []
+
+        match = " OR ".join(f'"{t}"' for t in terms)
+        rows = self.conn.execute(
+            "SELECT chunks.* FROM chunks_fts "
+            "JOIN chunks ON chunks.id = chunks_fts.rowid "
+            "WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts) LIMIT ?",
+            (match, limit),
+        )
+        return [Chunk(**_from_row(Chunk, row, CHUNK_COLUMNS)) for row in rows]
@@ -1,10 +1,27 @@
 from __future__ import annotations
 
 import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from sidecar.config import logger
+from sidecar.config import (
+    REFERENCES_LOG_COMPACT_BYTES,
+    REFERENCES_LOG_COMPACT_RATIO,
+    STORAGE_CACHE_MAX_BYTES,
+    logger,
+)
+from sidecar.fileio import (
+    atomic_write,
+    atomic_write_json,
+    file_lock,
+    get_file_signature,
+)
+from sidecar.projects.generations import project_generations
 from sidecar.projects.service import get_project_path
+from sidecar.references.citation_keys import CitationKeyIndex
+from sidecar.references.index import BM25Index
 from sidecar.references.schemas import (
     Author,
     Chunk,
@@ -13,6 +30,8 @@ from sidecar.references.schemas import (
     ReferencePatch,
     UpdateStatusResponse,
 )
+from sidecar.references.vectors import VectorIndex
+from sidecar.references.wal import MutationLog
 from sidecar.typing import ResponseStatus
 
 logger = logger.getChild(__name__)
@@ -30,71 +49,553 @@ def get_references_json_path(user_id: str, project_id: str) -> Path:
 def get_references_json_storage(user_id: str, project_id: str) -> JsonStorage:
     """
     Returns the JSON storage object for a given project.
+
+    Loaded storage objects are cached in-process, so this only reads
+    `references.json` when it has changed since it was last loaded or saved.
     """
     filepath = get_references_json_path(user_id=user_id, project_id=project_id)
-    storage = JsonStorage(filepath=filepath)
-    storage.load()
-    return storage
+    return storage_cache.get(user_id, project_id, filepath)
+
+
+class StorageCache:
+    """
+    Process-wide LRU cache of loaded JsonStorage objects, keyed by
+    (user_id, project_id).
+
+    A cached storage object is reused as long as the file it was loaded from
+    has not been written by anyone else since: writes made through the cached
+    object itself update its file signature. Entries are evicted in LRU order
+    once the total size of the cached `references.json` files exceeds
+    `max_bytes`, and their unsaved index updates are saved when they are
+    evicted or the cache is flushed.
+    """
+
+    def __init__(self, max_bytes: int = STORAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], JsonStorage] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, user_id: str, project_id: str, filepath: Path) -> JsonStorage:
+        key = (user_id, project_id)
+
+        with self._lock:
+            storage = self._entries.get(key)
+            if storage is not None and storage.is_current(filepath):
+                self._entries.move_to_end(key)
+                return storage
+
+            storage = JsonStorage(filepath=filepath, project_id=project_id)
+            storage.load()
+
+            self._entries[key] = storage
+            self._entries.move_to_end(key)
+            self._evict()
+            return storage
+
+    def invalidate(self, user_id: str, project_id: str) -> None:
+        with self._lock:
+            self._entries.pop((user_id, project_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def flush(self) -> None:
+        """
+        Saves the unsaved index updates of every cached storage object,
+        e.g. on shutdown.
+        """
+        with self._lock:
+            for storage in self._entries.values():
+                storage.flush_indexes()
+
+    @property
+    def size(self) -> int:
+        return sum(storage.size for storage in self._entries.values())
+
+    def _evict(self) -> None:
+        # always keep the most recently used entry, however large
+        while len(self._entries) > 1 and self.size > self.max_bytes:
+            key, storage = self._entries.popitem(last=False)
+            logger.info(f"Evicting references storage from cache: {key}")
+            storage.flush_indexes()
+
 
+storage_cache = StorageCache()
+
+
+class BaseStorage:
+    """
+    Functionality shared by the reference storage backends: in-memory
+    references and corpus, and the indexes stored next to them.
+
+    Edits update the loaded indexes in memory and mark them as dirty, rather
+    than rewriting their files (whose size grows with the library) every
+    time: dirty indexes are saved by `flush_indexes`. An index file left
+    behind by a crash is brought back in line with the references when it
+    is next loaded.
+
+    Cached storage objects are shared between threads: writers hold `lock`
+    while they update the references, corpus and indexes in place, and so
+    must readers that use them across several calls (e.g. retrieval, which
+    searches an index and then looks up the chunks it returned).
+    """
 
-class JsonStorage:
     def __init__(self, filepath: str):
         self.filepath = Path(filepath)
+        self.lock = threading.RLock()
         self.references = []
         self.chunks = []
+        # reference_id -> (start, end) range of the reference's chunks in `chunks`
+        self.chunk_offsets: dict[str, tuple[int, int]] = {}
+        self.corpus = []
+        self.tokenized_corpus = []
+        self._bm25_index = None
+        self._vector_index = None
+        self._citation_key_index = None
+        # loaded indexes with updates that have not been saved yet
+        self._dirty_indexes: list = []
+
+    def _mark_dirty(self, index) -> None:
+        if not any(dirty is index for dirty in self._dirty_indexes):
+            self._dirty_indexes.append(index)
+
+    def flush_indexes(self) -> None:
+        """
+        Saves the indexes that have been updated since they were last saved.
+        """
+        while self._dirty_indexes:
+            self._dirty_indexes.pop(0).save()
+
+    @property
+    def index_filepath(self) -> Path:
+        """
+        The BM25 index is stored next to the references file.
+        """
+        return self.filepath.parent / "bm25_index.json"
+
+    @property
+    def bm25_index(self) -> BM25Index:
+        """
+        Returns the BM25 index for the stored references, loading it from disk
+        on first access. The index is built if it does not exist yet, and
+        brought in line with the references file if it is out of sync.
+        """
+        if self._bm25_index is not None:
+            return self._bm25_index
+
+        with self.lock:
+            if self._bm25_index is not None:
+                return self._bm25_index
+
+            index = BM25Index(self.index_filepath)
+            try:
+                index.load()
+            except (FileNotFoundError, ValueError) as e:
+                logger.info(f"Unable to load BM25 index, it will be rebuilt: {e}")
+
+            if index.sync(self.references):
+                logger.info(f"Updated BM25 index for {len(self.references)} references")
+                index.save()
+
+            self._bm25_index = index
+            return self._bm25_index
+
+    def _get_index_for_update(self) -> BM25Index | None:
+        """
+        Returns the BM25 index if it has been loaded or persisted already.
+        Otherwise, there is nothing to update incrementally: the index will be
+        built on first use.
+        """
+        if self._bm25_index is None and not self.index_filepath.exists():
+            return None
+        return self.bm25_index
+
+    @property
+    def vector_index(self) -> VectorIndex:
+        """
+        Returns the chunk embeddings for the stored references, loading them
+        from disk on first access. Chunks of references that are missing from
+        the index are embedded (and the index saved).
+        """
+        if self._vector_index is not None:
+            return self._vector_index
+
+        with self.lock:
+            if self._vector_index is not None:
+                return self._vector_index
+
+            index = VectorIndex(self.filepath.parent)
+            try:
+                index.load()
+            except (FileNotFoundError, ValueError) as e:
+                logger.info(f"Unable to load vector index, it will be rebuilt: {e}")
+                index.build([])
+
+            if index.sync(self.references) or not index.exists():
+                index.save()
+
+            self._vector_index = index
+            return self._vector_index
+
+    def _get_vector_index_for_update(self) -> VectorIndex | None:
+        """
+        Returns the vector index if it has been loaded or persisted already.
+        """
+        if self._vector_index is None and not (
+            VectorIndex(self.filepath.parent).exists()
+        ):
+            return None
+        return self.vector_index
+
+    @property
+    def citation_keys_filepath(self) -> Path:
+        return self.filepath.parent / "citation_keys.json"
+
+    @property
+    def citation_key_index(self) -> CitationKeyIndex:
+        """
+        Returns the index of allocated citation keys, loading it from disk on
+        first access. The index is (re)built if it does not exist yet or is
+        out of sync with the references file.
+        """
+        if self._citation_key_index is not None:
+            return self._citation_key_index
+
+        with self.lock:
+            if self._citation_key_index is not None:
+                return self._citation_key_index
+
+            index = CitationKeyIndex(self.citation_keys_filepath)
+            try:
+                index.load()
+            except (FileNotFoundError, ValueError) as e:
+                logger.info(
+                    f"Unable to load citation key index, it will be rebuilt: {e}"
+                )
+
+            if index.is_stale(self.references) or not index.filepath.exists():
+                index.build(self.references)
+                index.save()
+
+            self._citation_key_index = index
+            return self._citation_key_index
+
+    def _get_citation_key_index_for_update(self) -> CitationKeyIndex | None:
+        """
+        Returns the citation key index if it has been loaded or persisted
+        already.
+        """
+        if (
+            self._citation_key_index is None
+            and not self.citation_keys_filepath.exists()
+        ):
+            return None
+        return self.citation_key_index
+
+    def get_reference(self, reference_id: str) -> Reference | None:
+        """
+        Get a Reference from storage by id.
+        """
+        for ref in self.references:
+            if ref.id == reference_id:
+                return ref
+        return None
+
+    def get_chunk(self, reference_id: str, chunk_idx: int) -> Chunk:
+        """
+        Get a chunk from the corpus by its reference id and position.
+        """
+        start, _ = self.chunk_offsets[reference_id]
+        return self.chunks[start + chunk_idx]
+
+    def count_chunks(self, reference_ids: list[str] = None) -> int:
+        """
+        Returns the number of chunks in the corpus, or in the chunks of
+        `reference_ids` only. Unknown references have no chunks.
+        """
+        if reference_ids is None:
+            return len(self.chunks)
+        offsets = [self.chunk_offsets.get(r, (0, 0)) for r in set(reference_ids)]
+        return sum(end - start for start, end in offsets)
+
+    def create_corpus(self):
+        self.chunks = []
+        self.chunk_offsets = {}
         self.corpus = []
         self.tokenized_corpus = []
+        for ref in self.references:
+            self._add_to_corpus(ref)
+
+    def _add_to_corpus(self, reference: Reference) -> None:
+        start = len(self.chunks)
+        self.chunk_offsets[reference.id] = (start, start + len(reference.chunks))
+        for chunk in reference.chunks:
+            self.chunks.append(chunk)
+            self.corpus.append(chunk.text)
+            self.tokenized_corpus.append(chunk.text.lower().split())
+
+
+def parse_reference(item: dict) -> Reference:
+    """
+    Parses a Reference stored as JSON, including its authors and chunks.
+    """
+    ref = Reference(**item)
+    if "authors" in item:
+        ref.authors = [Author(**a) for a in item["authors"]]
+    if "chunks" in item:
+        ref.chunks = [Chunk(**c) for c in item["chunks"]]
+    return ref
+
+
+# folds mutation logs into their snapshots in the background, one at a time
+_compaction_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="references-compaction"
+)
+
+
+class JsonStorage(BaseStorage):
+    """
+    References stored as a JSON snapshot (`references.json`) and a log of the
+    adds, patches and deletes made since (`references.log`, see
+    `sidecar.references.wal`), so that an edit only appends a small record
+    whatever the size of the library.
+    """
+
+    def __init__(self, filepath: str, project_id: str = None):
+        super().__init__(filepath)
+
+        # if set, saves bump the project's content generation (see `ETag`s)
+        self.project_id = project_id
+        # incremented on every write made through this object
+        self.generation = 0
+        # (mtime, size) of the snapshot and the log when they were last loaded
+        # or written
+        self.file_signature = None
+
+        self._log = None
+        # incremented every time the snapshot is written
+        self._snapshots = 0
+        self._compaction = None
+
+    @property
+    def log(self) -> MutationLog:
+        """
+        The log of mutations stored next to the references file.
+        """
+        filepath = self.filepath.with_name("references.log")
+        if self._log is None or self._log.filepath != filepath:
+            self._log = MutationLog(filepath)
+        return self._log
+
+    @property
+    def size(self) -> int:
+        """
+        Size in bytes of the storage files when they were last loaded or saved.
+        """
+        if self.file_signature is None:
+            return 0
+        return sum(signature[1] for signature in self.file_signature if signature)
+
+    def _get_file_signature(self) -> tuple:
+        return get_file_signature(self.filepath), get_file_signature(self.log.filepath)
+
+    def is_current(self, filepath: Path = None) -> bool:
+        """
+        Checks whether the in-memory references are in sync with the storage
+        files, i.e. they have not been written elsewhere since they were loaded.
+        """
+        filepath = Path(filepath) if filepath else self.filepath
+        if filepath != self.filepath or self.file_signature is None:
+            return False
+        return self._get_file_signature() == self.file_signature
 
     def initialize(self):
         """
         Initialize the storage file with an empty list.
         """
         self.filepath.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.filepath, "w") as f:
-            json.dump([], f)
+        atomic_write_json(self.filepath, [])
 
     def load(self):
         if not Path(self.filepath).exists():
             self.initialize()
 
-        with open(self.filepath, "r") as f:
-            data = json.load(f)
-
-        for item in data:
-            for k, v in item.items():
-                if k == "authors":
-                    authors = [Author(**a) for a in v]
-                elif k == "chunks":
-                    chunks = [Chunk(**c) for c in v]
-            ref = Reference(**item)
-            ref.authors = authors
-            ref.chunks = chunks
-            self.references.append(ref)
-        self.create_corpus()
+        with self.lock:
+            with open(self.filepath, "r") as f:
+                data = json.load(f)
+            references = [parse_reference(item) for item in data]
+
+            records, end = self.log.read()
+            if end < self.log.size:
+                # drop a record left incomplete by a crash, so that
+                # further records are not appended to it
+                self.log.truncate(end)
+            if records:
+                references = self._replay(references, records)
+
+            self.references.extend(references)
+            self.create_corpus()
+            self.file_signature = self._get_file_signature()
+
+    def _replay(self, references: list[Reference], records: list[dict]):
+        """
+        Applies logged mutations to the references of a snapshot.
+
+        Replaying is idempotent (adds and patches overwrite a Reference, and
+        deletes skip missing ones), so records that have already been folded
+        into the snapshot can safely be replayed again.
+        """
+        refs = {ref.id: ref for ref in references}
+        for record in records:
+            if record["op"] == "add":
+                # a single Reference, or a batch of them (see `add_references`)
+                for item in record.get("references", [record.get("reference")]):
+                    ref = parse_reference(item)
+                    refs[ref.id] = ref
+            elif record["op"] == "patch":
+                if record["id"] in refs:
+                    data = {**refs[record["id"]].dict(), **record["data"]}
+                    refs[record["id"]] = parse_reference(data)
+            elif record["op"] == "delete":
+                for ref_id in record["ids"]:
+                    refs.pop(ref_id, None)
+        return list(refs.values())
 
     def save(self):
         """
         Save the references to the storage file as JSON.
+        This replaces the snapshot and clears the mutation log, and saves the
+        indexes.
+        """
+        with self.lock:
+            contents = [ref.dict() for ref in self.references]
+            self._write_snapshot(json.dumps(contents, indent=2, default=str))
+            self._on_write()
+            self.flush_indexes()
+
+    def _write_snapshot(self, data: str, log_offset: int = None) -> None:
         """
-        contents = [ref.dict() for ref in self.references]
-        with open(self.filepath, "w") as f:
-            json.dump(contents, f, indent=2, default=str)
+        Replaces the snapshot, and drops the log records before `log_offset`
+        (all of them by default).
+        Both happen under the snapshot's file lock, so that appends made
+        through other storage objects for the same file are not lost.
+        """
+        with file_lock(self.filepath):
+            atomic_write(self.filepath, data)
+            if log_offset is None:
+                self.log.remove()
+            else:
+                self.log.trim(log_offset)
+        self._snapshots += 1
+
+    def _on_write(self) -> None:
+        self.generation += 1
+        self.file_signature = self._get_file_signature()
+        if self.project_id:
+            project_generations.bump(self.project_id)
+
+    def flush_indexes(self) -> None:
+        with self.lock:
+            super().flush_indexes()
+
+    def _log_mutation(self, record: dict) -> None:
+        """
+        Appends a mutation to the log, and schedules a compaction once the
+        log is larger than both `REFERENCES_LOG_COMPACT_BYTES` and a fixed
+        share of the snapshot: the cost of rewriting the snapshot is then
+        spread over a number of edits that grows with it.
+
+        Until a snapshot exists, the references are saved in full instead.
+        """
+        with file_lock(self.filepath):
+            if not self.filepath.exists():
+                self.save()
+                return
+            self.log.append(record)
+        self._on_write()
+
+        snapshot_signature, log_signature = self.file_signature
+        snapshot_size = snapshot_signature[1] if snapshot_signature else 0
+        threshold = max(
+            REFERENCES_LOG_COMPACT_BYTES, REFERENCES_LOG_COMPACT_RATIO * snapshot_size
+        )
+        if log_signature and log_signature[1] > threshold:
+            if self._compaction is None or self._compaction.done():
+                self._compaction = _compaction_executor.submit(self.compact)
+
+    def compact(self) -> None:
+        """
+        Folds the mutation log into a new snapshot, and saves the indexes.
+
+        References are serialized without blocking further edits: only the
+        records logged before they were copied are dropped from the log.
+        A crash at any point leaves a snapshot and a log that replay to the
+        same references.
+        """
+        with self.lock, file_lock(self.filepath):
+            if not self.is_current():
+                # written through another storage object: these references
+                # are outdated
+                return
+            references = list(self.references)
+            offset = self.log.size
+            snapshots = self._snapshots
+            snapshot_signature = get_file_signature(self.filepath)
+
+        contents = [ref.dict() for ref in references]
+        data = json.dumps(contents, indent=2, default=str)
+
+        with self.lock, file_lock(self.filepath):
+            if (
+                self._snapshots != snapshots
+                or get_file_signature(self.filepath) != snapshot_signature
+            ):
+                # saved in the meantime, through this or another storage
+                # object: this snapshot is already outdated
+                return
+            self._write_snapshot(data, log_offset=offset)
+            self.file_signature = self._get_file_signature()
+            self.flush_indexes()
+        logger.info(f"Compacted references log into {self.filepath}")
 
     def add_reference(self, reference: Reference) -> None:
         """
         Add a Reference to storage.
         """
-        self.references.append(reference)
-        self.save()
+        self.add_references([reference])
 
-    def get_reference(self, reference_id: str) -> Reference | None:
+    def add_references(self, references: list[Reference]) -> None:
         """
-        Get a Reference from storage by id.
+        Add References to storage, persisting them as a single mutation.
         """
-        for ref in self.references:
-            if ref.id == reference_id:
-                return ref
-        return None
+        if not references:
+            return
+
+        with self.lock:
+            index = self._get_index_for_update()
+            vector_index = self._get_vector_index_for_update()
+            citation_keys = self._get_citation_key_index_for_update()
+
+            self.references.extend(references)
+            if len(references) == 1:
+                record = {"op": "add", "reference": references[0].dict()}
+            else:
+                record = {"op": "add", "references": [r.dict() for r in references]}
+            self._log_mutation(record)
+
+            for reference in references:
+                self._add_to_corpus(reference)
+                if index is not None:
+                    index.add_reference(reference)
+                if vector_index is not None:
+                    vector_index.add_reference(reference)
+                if citation_keys is not None:
+                    citation_keys.add_reference(reference)
+
+            for updated in [index, vector_index, citation_keys]:
+                if updated is not None:
+                    self._mark_dirty(updated)
 
     def delete(self, reference_ids: list[str] = [], all_: bool = False):
         """
@@ -113,26 +614,39 @@ class JsonStorage:
             )
             raise ValueError(msg)
 
-        # preprocess references into a dict of reference_ids: Reference
-        # so that we can simply do `del refs[ref_id]]`
-        refs = {ref.id: ref for ref in self.references}
+        with self.lock:
+            # preprocess references into a dict of reference_ids: Reference
+            # so that we can simply do `del refs[ref_id]]`
+            refs = {ref.id: ref for ref in self.references}
 
-        if all_:
-            reference_ids = list(refs.keys())
+            if all_:
+                reference_ids = list(refs.keys())
 
-        for ref_id in reference_ids:
-            try:
-                del refs[ref_id]
-            except KeyError:
-                msg = f"Unable to delete {ref_id}: not found in storage"
-                logger.warning(msg)
-                response = DeleteStatusResponse(
-                    status=ResponseStatus.ERROR, message=msg
-                )
-                return response
+            index = self._get_index_for_update()
+            vector_index = self._get_vector_index_for_update()
+            citation_keys = self._get_citation_key_index_for_update()
+
+            for ref_id in reference_ids:
+                try:
+                    del refs[ref_id]
+                except KeyError:
+                    msg = f"Unable to delete {ref_id}: not found in storage"
+                    logger.warning(msg)
+                    response = DeleteStatusResponse(
+                        status=ResponseStatus.ERROR, message=msg
+                    )
+                    return response
+
+            deleted = [ref for ref in self.references if ref.id not in refs]
+            self.references = list(refs.values())
+            self._log_mutation({"op": "delete", "ids": list(reference_ids)})
+            self.create_corpus()
 
-        self.references = list(refs.values())
-        self.save()
+            for updated in [index, vector_index, citation_keys]:
+                if updated is not None:
+                    for ref in deleted:
+                        updated.remove_reference(ref)
+                    self._mark_dirty(updated)
 
         response = DeleteStatusResponse(status=ResponseStatus.OK, message="")
         return response
@@ -149,28 +663,42 @@ class JsonStorage:
         patch : ReferencePatch
             The patch object containing the updated reference data
         """
-        refs = {ref.id: ref for ref in self.references}
+        with self.lock:
+            refs = {ref.id: ref for ref in self.references}
 
-        try:
-            target = refs[reference_id]
-        except KeyError:
-            msg = f"Unable to update {reference_id}: not found in storage"
-            logger.error(msg)
-            response = UpdateStatusResponse(status=ResponseStatus.ERROR, message=msg)
-            return response
+            try:
+                target = refs[reference_id]
+            except KeyError:
+                msg = f"Unable to update {reference_id}: not found in storage"
+                logger.error(msg)
+                response = UpdateStatusResponse(
+                    status=ResponseStatus.ERROR, message=msg
+                )
+                return response
 
-        logger.info(f"Updating {reference_id} with new values: {patch.data}")
-        refs[reference_id] = target.copy(update=patch.data)
+            logger.info(f"Updating {reference_id} with new values: {patch.data}")
+            refs[reference_id] = target.copy(update=patch.data)
 
-        self.references = list(refs.values())
-        self.save()
+            self.references = list(refs.values())
+            self._log_mutation({"op": "patch", "id": reference_id, "data": patch.data})
+
+            # citation keys are kept when authors or dates are edited, and
+            # only change when set explicitly
+            if "citation_key" in patch.data:
+                citation_keys = self._get_citation_key_index_for_update()
+                if citation_keys is not None:
+                    citation_keys.add_reference(refs[reference_id])
+                    self._mark_dirty(citation_keys)
+
+            # only changes to a Reference's chunks affect the corpus and the
+            # BM25 and vector indexes: patched chunks are raw dicts, so the
+            # references are reloaded on next use, and the indexes re-index
+            # the Reference when they are synced with them
+            if "chunks" in patch.data:
+                self.flush_indexes()
+                self._bm25_index = None
+                self._vector_index = None
+                self.file_signature = None
 
         response = UpdateStatusResponse(status=ResponseStatus.OK, message="")
         return response
-
-    def create_corpus(self):
-        for ref in self.references:
-            for chunk in ref.chunks:
-                self.chunks.append(chunk)
-                self.corpus.append(chunk.text)
-                self.tokenized_corpus.append(chunk.text.lower().split())
@@ -0,0 +1,606 @@
+"""
+Local chunk embeddings and nearest-neighbour search.
+
+The default embedder (`HashingEmbedder`) is a lexical-hashing fallback: it
+needs no model, but its vectors only capture the words (and word pairs) a
+chunk shares with the query, not their meaning. An embedding model can be
+plugged in through `VectorIndex(embedder=...)`, see `Embedder`.
+
+Chunk vectors are stored per project as a single contiguous float32 matrix
+(`.storage/vectors.npy`, one row per chunk) which is memory-mapped on load,
+rather than as lists of floats in `references.json`. Row ids are stored
+next to it in `vectors.json`.
+
+Small libraries are searched exactly (one matrix-vector product). Above
+`VECTOR_IVF_MIN_DOCS` chunks, an inverted file (IVF) index partitions the
+rows into k-means clusters and only the rows of the clusters closest to
+the query are scored.
+"""
+from __future__ import annotations
+
+import json
+import math
+import re
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+from sidecar import shared
+from sidecar.config import EMBEDDING_DIM, VECTOR_IVF_MIN_DOCS, VECTOR_IVF_NPROBE, logger
+from sidecar.fileio import atomic_open, atomic_write_json, file_lock
+from sidecar.references.index import (
+    get_reference_offsets,
+    get_reference_ranges,
+    get_reference_signature,
+    get_rows,
+    make_doc_id,
+    parse_doc_id,
+    top_n_indices,
+)
+from sidecar.references.schemas import Reference
+
+logger = logger.getChild(__name__)
+
+VECTOR_INDEX_FORMAT_VERSION = 2
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a about above after again against all am an and any are as at be because "
+    "been before being below between both but by can could did do does doing "
+    "down during each few for from further had has have having he her here "
+    "hers herself him himself his how i if in into is it its itself just me "
+    "more most my myself no nor not now of off on once only or other our ours "
+    "ourselves out over own same she should so some such than that the their "
+    "theirs them themselves then there these they this those through to too "
+    "under until up very was we were what when where which while who whom why "
+    "will with would you your yours yourself yourselves".split()
+)
+
+
+def append_rows(
+    buffer: np.ndarray | None, rows: np.ndarray, new_rows: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Appends rows to an array in amortized O(len(new_rows)) time.
+
+    `rows` is a view of the first rows of `buffer`, or any array if `buffer`
+    is None. Returns the buffer, reallocated with twice the capacity when it
+    is full, and a view of its rows.
+    """
+    num_rows = len(rows) + len(new_rows)
+    if buffer is None or len(buffer) < num_rows:
+        capacity = max(num_rows, 2 * len(rows))
+        grown = np.empty((capacity, *rows.shape[1:]), dtype=rows.dtype)
+        grown[: len(rows)] = rows
+        buffer = grown
+    buffer[len(rows) : num_rows] = new_rows
+    return buffer, buffer[:num_rows]
+
+
+def keep_rows(
+    buffer: np.ndarray | None, rows: np.ndarray, mask: np.ndarray
+) -> tuple[np.ndarray | None, np.ndarray]:
+    """
+    Keeps the rows of an array where `mask` is True, in place if the rows
+    are a view of a buffer (see `append_rows`).
+    """
+    kept = np.asarray(rows)[mask]
+    if buffer is None:
+        return None, kept
+    buffer[: len(kept)] = kept
+    return buffer, buffer[: len(kept)]
+
+
+class Embedder(Protocol):
+    """
+    Text embedder used by `VectorIndex`. The index is rebuilt when the
+    `name` or `dim` of its embedder change.
+    """
+
+    name: str
+    dim: int
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix of unit-length vectors.
+        """
+        ...
+
+
+class HashingEmbedder:
+    """
+    Lexical-hashing fallback embedder, CPU-only and without a model.
+
+    Words, word bigrams and word prefixes (a cheap stand-in for stemming) are
+    hashed into `dim` signed buckets with sublinear term frequency weights,
+    and each vector is L2-normalized, so the dot product of two vectors is
+    their cosine similarity. It embeds a chunk in well under a millisecond,
+    but two texts are only similar if they share words: synonyms and
+    paraphrases are not matched.
+    """
+
+    name = "hashing-v1"
+
+    def __init__(self, dim: int = EMBEDDING_DIM, max_cached_features: int = 500_000):
+        self.dim = dim
+        self.max_cached_features = max_cached_features
+        self._buckets: dict[str, tuple[int, float]] = {}
+
+    def _bucket(self, feature: str) -> tuple[int, float]:
+        bucket = self._buckets.get(feature)
+        if bucket is None:
+            # crc32 is stable across processes, unlike `hash`
+            digest = zlib.crc32(feature.encode())
+            bucket = (digest % self.dim, 1.0 if digest & 0x80000000 else -1.0)
+            if len(self._buckets) < self.max_cached_features:
+                self._buckets[feature] = bucket
+        return bucket
+
+    def features(self, text: str) -> Counter:
+        tokens = [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+        features = Counter(tokens)
+        features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        features.update(f"{t[:5]}*" for t in tokens if len(t) > 5)
+        return features
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix of unit-length vectors.
+        Texts without any features get a zero vector.
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            row = [0.0] * self.dim
+            for feature, count in self.features(text).items():
+                col, sign = self._bucket(feature)
+                row[col] += sign * (1.0 + math.log(count))
+            vectors[i] = row
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    """
+    Inverted file index over the rows of a vector matrix.
+
+    Rows are assigned to the nearest of `num_lists` centroids, trained with
+    spherical k-means on a sample of the rows. A query is only scored
+    against the rows of the `nprobe` centroids closest to it.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray):
+        self.centroids = centroids
+        self.assignments = assignments
+        # number of rows the centroids were trained on
+        self.trained_size = len(assignments)
+        # `assignments` is a view of the first rows of `_buffer`, if set
+        self._buffer: np.ndarray | None = None
+        self._order: np.ndarray | None = None
+        self._offsets: np.ndarray | None = None
+
+    @classmethod
+    def train(
+        cls,
+        vectors: np.ndarray,
+        num_lists: int | None = None,
+        iterations: int = 10,
+        rows_per_list: int = 64,
+        seed: int = 0,
+    ) -> IVFIndex:
+        num_rows = len(vectors)
+        num_lists = num_lists or max(1, int(math.sqrt(num_rows)))
+        num_lists = min(num_lists, num_rows)
+        rng = np.random.default_rng(seed)
+
+        # k-means only needs a few dozen rows per centroid
+        sample_size = min(num_rows, num_lists * rows_per_list)
+        sample_rows = np.sort(rng.choice(num_rows, size=sample_size, replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=num_lists, replace=False)]
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(labels, minlength=num_lists)
+
+            # sum the rows of each cluster (sorted by cluster, so that each
+            # cluster is a contiguous run of rows)
+            order = np.argsort(labels, kind="stable")
+            nonempty = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts)])[nonempty]
+            sums = np.zeros_like(centroids)
+            sums[nonempty] = np.add.reduceat(sample[order], starts, axis=0)
+
+            # re-seed empty clusters with random sample rows
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = sample[rng.choice(len(sample), size=len(empty))]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        index = cls(centroids, np.zeros(0, dtype=np.int32))
+        index.assignments = index.assign(vectors)
+        index.trained_size = num_rows
+        return index
+
+    @property
+    def num_lists(self) -> int:
+        return len(self.centroids)
+
+    def assign(self, vectors: np.ndarray, batch_size: int = 65_536) -> np.ndarray:
+        """
+        Returns the nearest centroid of each row.
+        """
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            batch = np.asarray(vectors[start : start + batch_size])
+            assignments[start : start + batch_size] = np.argmax(
+                batch @ self.centroids.T, axis=1
+            )
+        return assignments
+
+    def add(self, vectors: np.ndarray) -> None:
+        self._buffer, self.assignments = append_rows(
+            self._buffer, self.assignments, self.assign(vectors)
+        )
+        self._order = None
+
+    def keep(self, mask: np.ndarray) -> None:
+        self._buffer, self.assignments = keep_rows(self._buffer, self.assignments, mask)
+        self._order = None
+
+    def needs_training(self) -> bool:
+        """
+        Centroids are retrained once the number of rows has halved or doubled.
+        """
+        num_rows = len(self.assignments)
+        return not self.trained_size / 2 <= num_rows <= self.trained_size * 2
+
+    def search(
+        self, vectors: np.ndarray, query: np.ndarray, n: int, nprobe: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the positions and scores of the (approximately) `n` nearest
+        rows.
+        """
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind="stable")
+            counts = np.bincount(self.assignments, minlength=self.num_lists)
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        probes = top_n_indices(self.centroids @ query, nprobe)
+        rows = np.concatenate(
+            [self._order[self._offsets[c] : self._offsets[c + 1]] for c in probes]
+        )
+        # read the memory-mapped rows in file order
+        rows.sort()
+        scores = np.asarray(vectors[rows]) @ query
+        top = top_n_indices(scores, n)
+        return rows[top], scores[top]
+
+
+class VectorIndex:
+    """
+    Persistent embeddings of reference chunks, with nearest-neighbour search.
+
+    Like `BM25Index`, the index is stored next to `references.json` and is
+    updated incrementally as references are added and deleted. Rows are
+    identified by the same doc ids (`{reference_id}:{chunk_idx}`).
+    """
+
+    def __init__(
+        self,
+        dirpath: str,
+        embedder: Embedder | None = None,
+        ivf_min_docs: int = VECTOR_IVF_MIN_DOCS,
+        nprobe: int = VECTOR_IVF_NPROBE,
+    ):
+        self.dirpath = Path(dirpath)
+        self.embedder = embedder or HashingEmbedder()
+        self.ivf_min_docs = ivf_min_docs
+        self.nprobe = nprobe
+
+        self.doc_ids: list[str] = []
+        # reference_id -> signature of the chunks embedded for the reference
+        self.reference_signatures: dict[str, str] = {}
+        self.vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        # `vectors` is a view of the first rows of `_buffer`, if set
+        self._buffer: np.ndarray | None = None
+
+        self._ivf: IVFIndex | None = None
+        self._reference_offsets: dict[str, tuple[int, int]] | None = None
+
+    @property
+    def vectors_filepath(self) -> Path:
+        return self.dirpath / "vectors.npy"
+
+    @property
+    def metadata_filepath(self) -> Path:
+        return self.dirpath / "vectors.json"
+
+    @property
+    def ivf_filepath(self) -> Path:
+        return self.dirpath / "vectors_ivf.npz"
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_ids)
+
+    def exists(self) -> bool:
+        return self.metadata_filepath.exists()
+
+    def load(self) -> None:
+        """
+        Loads the index, memory-mapping the vectors.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the index has not been saved yet
+        ValueError
+            If the index was saved in another format or by another embedder
+        """
+        with open(self.metadata_filepath, "r") as f:
+            metadata = json.load(f)
+
+        if metadata.get("version") != VECTOR_INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector index version in {self.dirpath}")
+        if (metadata.get("embedder"), metadata.get("dim")) != (
+            self.embedder.name,
+            self.embedder.dim,
+        ):
+            raise ValueError(f"Vector index in {self.dirpath} uses another embedder")
+
+        vectors = np.load(self.vectors_filepath, mmap_mode="r")
+        if vectors.shape != (len(metadata["doc_ids"]), self.embedder.dim):
+            raise ValueError(f"Vector index in {self.dirpath} is inconsistent")
+
+        self.doc_ids = metadata["doc_ids"]
+        self._reference_offsets = None
+        self.reference_signatures = metadata["reference_signatures"]
+        self.vectors = vectors
+        self._buffer = None
+        self._ivf = self._load_ivf()
+
+    def _load_ivf(self) -> IVFIndex | None:
+        try:
+            with np.load(self.ivf_filepath) as data:
+                ivf = IVFIndex(data["centroids"], data["assignments"])
+                ivf.trained_size = int(data["trained_size"])
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+        if len(ivf.assignments) != self.num_docs:
+            return None
+        return ivf
+
+    def save(self) -> None:
+        """
+        Saves the vectors and doc ids, replacing the previous files atomically.
+
+        Large indexes also save their IVF clusters, training them first if
+        needed, so that the first query after a restart stays fast.
+        """
+        self.dirpath.mkdir(parents=True, exist_ok=True)
+        if self.num_docs >= self.ivf_min_docs:
+            _ = self.ivf
+
+        # the metadata file is written last, and its lock serializes saves
+        with file_lock(self.metadata_filepath):
+            try:
+                with atomic_open(self.vectors_filepath, "wb") as f:
+                    np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+                    if isinstance(self.vectors, np.memmap):
+                        # release the memory map of the previous file before
+                        # it is replaced
+                        self.vectors = None
+            except BaseException:
+                if self.vectors is None:
+                    # the previous file is left in place if saving fails
+                    self.vectors = np.load(self.vectors_filepath, mmap_mode="r")
+                raise
+            self.vectors = np.load(self.vectors_filepath, mmap_mode="r")
+            self._buffer = None
+
+            if self._ivf is None:
+                shared.remove_file(self.ivf_filepath)
+            else:
+                with atomic_open(self.ivf_filepath, "wb") as f:
+                    np.savez(
+                        f,
+                        centroids=self._ivf.centroids,
+                        assignments=self._ivf.assignments,
+                        trained_size=self._ivf.trained_size,
+                    )
+
+            metadata = {
+                "version": VECTOR_INDEX_FORMAT_VERSION,
+                "embedder": self.embedder.name,
+                "dim": self.embedder.dim,
+                "reference_signatures": self.reference_signatures,
+                "doc_ids": self.doc_ids,
+            }
+            atomic_write_json(self.metadata_filepath, metadata)
+
+    def build(self, references: list[Reference]) -> None:
+        """
+        Rebuilds the index from scratch for a list of References.
+        """
+        self.doc_ids = []
+        self._reference_offsets = None
+        self.reference_signatures = {}
+        self.vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._buffer = None
+        self._ivf = None
+        self.sync(references)
+
+    def sync(self, references: list[Reference]) -> bool:
+        """
+        Brings the index in line with a list of References: References that
+        are no longer stored, or whose chunks have changed (see
+        `get_reference_signature`), are removed, and References that are
+        missing are embedded.
+
+        Returns True if the index was modified.
+        """
+        signatures = {ref.id: get_reference_signature(ref) for ref in references}
+        removed = {
+            reference_id
+            for reference_id, signature in self.reference_signatures.items()
+            if signatures.get(reference_id) != signature
+        }
+        if removed:
+            self._remove_rows(removed)
+
+        missing = [ref for ref in references if ref.id not in self.reference_signatures]
+        if missing:
+            logger.info(f"Embedding chunks for {len(missing)} references")
+            self._add_rows(missing)
+
+        return bool(removed or missing)
+
+    def add_reference(self, reference: Reference) -> None:
+        """
+        Embeds the chunks of a Reference, replacing any previous vectors.
+        """
+        if reference.id in self.reference_signatures:
+            self._remove_rows({reference.id})
+        self._add_rows([reference])
+
+    def remove_reference(self, reference: Reference) -> None:
+        """
+        Removes the vectors of a Reference's chunks.
+        """
+        if reference.id in self.reference_signatures:
+            self._remove_rows({reference.id})
+
+    def _add_rows(self, references: list[Reference]) -> None:
+        doc_ids = []
+        texts = []
+        for ref in references:
+            for idx, chunk in enumerate(ref.chunks):
+                doc_ids.append(make_doc_id(ref.id, idx))
+                texts.append(chunk.text)
+            self.reference_signatures[ref.id] = get_reference_signature(ref)
+
+        vectors = self.embedder.embed(texts)
+        self.doc_ids.extend(doc_ids)
+        self._reference_offsets = None
+        self._buffer, self.vectors = append_rows(self._buffer, self.vectors, vectors)
+
+        if self._ivf is not None:
+            self._ivf.add(vectors)
+
+    def _remove_rows(self, reference_ids: set[str]) -> None:
+        keep = np.array(
+            [parse_doc_id(doc_id)[0] not in reference_ids for doc_id in self.doc_ids],
+            dtype=bool,
+        )
+        self.doc_ids = [doc_id for doc_id, k in zip(self.doc_ids, keep) if k]
+        self._reference_offsets = None
+        self._buffer, self.vectors = keep_rows(self._buffer, self.vectors, keep)
+        for reference_id in reference_ids:
+            self.reference_signatures.pop(reference_id, None)
+
+        if self._ivf is not None:
+            self._ivf.keep(keep)
+
+    @property
+    def ivf(self) -> IVFIndex:
+        """
+        Returns the IVF index, training it on first use and whenever the
+        number of rows has changed too much for its clusters to fit.
+        """
+        if self._ivf is None or self._ivf.needs_training():
+            logger.info(f"Training IVF index for {self.num_docs} chunk vectors")
+            self._ivf = IVFIndex.train(self.vectors)
+        return self._ivf
+
+    @property
+    def reference_offsets(self) -> dict[str, tuple[int, int]]:
+        """
+        Returns the (start, end) range of rows holding each reference's
+        chunk vectors, computed on first use after the rows change.
+        """
+        if self._reference_offsets is None:
+            self._reference_offsets = get_reference_offsets(self.doc_ids)
+        return self._reference_offsets
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embedder.embed([query])[0]
+
+    def search(
+        self,
+        query: str,
+        n: int = 5,
+        exact: bool | None = None,
+        reference_ids: list[str] = None,
+    ) -> list[str]:
+        """
+        Returns the ids of the `n` chunks most similar to a query.
+        See `search_with_scores`.
+        """
+        return [
+            doc_id
+            for doc_id, _ in self.search_with_scores(query, n, exact, reference_ids)
+        ]
+
+    def search_with_scores(
+        self,
+        query: str,
+        n: int = 5,
+        exact: bool | None = None,
+        reference_ids: list[str] = None,
+    ) -> list[tuple[str, float]]:
+        """
+        Returns the ids and cosine similarities of the `n` chunks most similar
+        to a query.
+
+        Parameters
+        ----------
+        query : str
+            Query text
+        n : int, default 5
+            Number of chunk ids to return
+        exact : bool, optional
+            Score every chunk (True) or use the IVF index (False).
+            By default, the IVF index is used once the number of chunks
+            reaches `ivf_min_docs`.
+        reference_ids : list[str], optional
+            Only search the chunks of these references. Their rows are
+            always scored exactly, and no other rows are read.
+
+        Returns
+        -------
+        list[tuple[str, float]]
+            Doc ids and scores, most similar first
+        """
+        if self.num_docs == 0:
+            return []
+
+        if exact is None:
+            exact = self.num_docs < self.ivf_min_docs
+
+        query_vector = self.embed_query(query)
+        if reference_ids is not None:
+            ranges = get_reference_ranges(self.reference_offsets, reference_ids)
+            if not ranges:
+                return []
+            vectors = np.asarray(self.vectors)
+            scores = np.concatenate(
+                [vectors[start:end] @ query_vector for start, end in ranges]
+            )
+            top = top_n_indices(scores, n)
+            rows = get_rows(ranges)
+            return [(self.doc_ids[rows[i]], float(scores[i])) for i in top]
+
+        if exact:
+            scores = np.asarray(self.vectors) @ query_vector
+            rows = top_n_indices(scores, n)
+            scores = scores[rows]
+        else:
+            rows, scores = self.ivf.search(self.vectors, query_vector, n, self.nprobe)
+        return [(self.doc_ids[i], float(score)) for i, score in zip(rows, scores)]
@@ -0,0 +1,143 @@
+"""
+Append-only log of changes made to a project's references.
+
+`JsonStorage` records each add, patch and delete as one JSON line in
+`references.log`, next to the `references.json` snapshot, instead of
+rewriting the snapshot. Loading replays the log on top of the snapshot, and
+the log is folded into a new snapshot (compacted) once it grows too large.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from sidecar.config import REFERENCES_LOG_FSYNC_INTERVAL, logger
+from sidecar.fileio import atomic_write
+
+logger = logger.getChild(__name__)
+
+
+class MutationLog:
+    """
+    Appends are written through to the OS immediately, so that they survive
+    the process crashing, but are only fsynced to disk every
+    `fsync_interval` seconds: a burst of edits shares a single fsync.
+
+    The file is opened for each append rather than kept open, so that the
+    log can be replaced (see `trim`) under other writers.
+    """
+
+    def __init__(
+        self, filepath: Path, fsync_interval: float = REFERENCES_LOG_FSYNC_INTERVAL
+    ):
+        self.filepath = Path(filepath)
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._timer = None
+        self._dirty = False
+        self._last_sync = 0.0
+
+    def exists(self) -> bool:
+        return self.filepath.exists()
+
+    @property
+    def size(self) -> int:
+        try:
+            return self.filepath.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def append(self, record: dict) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            with open(self.filepath, "a") as f:
+                f.write(line)
+                f.flush()
+                if time.monotonic() - self._last_sync >= self.fsync_interval:
+                    self._fsync(f.fileno())
+                else:
+                    self._dirty = True
+                    self._schedule_sync()
+
+    def read(self, offset: int = 0) -> tuple[list[dict], int]:
+        """
+        Returns the records logged from byte `offset` onwards, and the offset
+        of the end of the last complete record.
+        A partially written last record (e.g. after a crash) is ignored.
+        """
+        if not self.exists():
+            return [], 0
+
+        with open(self.filepath, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+
+        records = []
+        end = offset
+        for line in data.splitlines(keepends=True):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Ignoring incomplete record in {self.filepath}")
+                break
+            end += len(line)
+        return records, end
+
+    def sync(self) -> None:
+        """
+        Fsyncs any appends that are still pending.
+        """
+        with self._lock:
+            if self._dirty and self.exists():
+                with open(self.filepath, "a") as f:
+                    self._fsync(f.fileno())
+
+    def truncate(self, offset: int) -> None:
+        """
+        Drops everything after byte `offset`.
+        """
+        with self._lock:
+            os.truncate(self.filepath, offset)
+
+    def trim(self, offset: int) -> None:
+        """
+        Drops the records before byte `offset`, e.g. once they have been
+        written to a snapshot. The log is replaced atomically.
+        """
+        with self._lock:
+            if not self.exists():
+                return
+            with open(self.filepath, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+
+            if not tail:
+                self.filepath.unlink()
+                self._dirty = False
+                return
+
+            atomic_write(self.filepath, tail)
+            self._dirty = False
+
+    def remove(self) -> None:
+        with self._lock:
+            try:
+                self.filepath.unlink()
+            except FileNotFoundError:
+                pass
+            self._dirty = False
+
+    def _fsync(self, fileno: int) -> None:
+        os.fsync(fileno)
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def _schedule_sync(self) -> None:
+        if self._timer is not None and self._timer.is_alive():
+            return
+        self._timer = threading.Timer(self.fsync_interval, self.sync)
+        self._timer.daemon = True
+        self._timer.start()
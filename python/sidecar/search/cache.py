@@ -0,0 +1,110 @@
+"""
+Cache of Semantic Scholar search responses.
+
+Entries are keyed on the preprocessed query, the result limit and the
+requested fields, expire after a fixed time and are evicted least recently
+used first. The cache can be persisted to a JSON file, so that repeating a
+search after a restart neither waits on the network nor uses up the API's
+rate limit.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from sidecar.config import logger
+from sidecar.fileio import atomic_write_json
+from sidecar.search.schemas import SearchResponse
+
+logger = logger.getChild(__name__)
+
+SearchKey = tuple[str, int, tuple[str, ...]]
+
+
+class SearchCache:
+    def __init__(self, max_entries: int, ttl: float, filepath: Path | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.filepath = Path(filepath) if filepath else None
+        # key -> (expiry as a unix timestamp, response), least recently used first
+        self._entries: OrderedDict[
+            SearchKey, tuple[float, SearchResponse]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: SearchKey) -> SearchResponse | None:
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, response = entry
+            if expires <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: SearchKey, response: SearchResponse) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._load()
+            self._entries[key] = (time.time() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._loaded = True
+            self._save()
+
+    def _load(self) -> None:
+        # the file is read on first use rather than on import
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.filepath is None or not self.filepath.exists():
+            return
+
+        try:
+            with open(self.filepath, "r") as f:
+                items = json.load(f)
+            now = time.time()
+            for item in items:
+                if item["expires"] <= now:
+                    continue
+                query, limit, fields = item["key"]
+                key = (query, limit, tuple(fields))
+                response = SearchResponse.parse_obj(item["response"])
+                self._entries[key] = (item["expires"], response)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable search cache {self.filepath}: {e}")
+            self._entries.clear()
+
+    def _save(self) -> None:
+        if self.filepath is None:
+            return
+        items = [
+            {
+                "key": list(key),
+                "expires": expires,
+                "response": json.loads(response.json()),
+            }
+            for key, (expires, response) in self._entries.items()
+        ]
+        try:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(self.filepath, items)
+        except OSError as e:
+            logger.warning(f"Could not write search cache {self.filepath}: {e}")
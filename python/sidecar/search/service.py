@@ -4,21 +4,48 @@ This script performs a search on Semantic Scholar and
 retrieves information about a set of papers.
 """
 import logging
+import threading
 
-from semanticscholar import SemanticScholar
+from sidecar.config import S2_CACHE_MAX_ENTRIES, S2_CACHE_PATH, S2_CACHE_TTL
+from sidecar.search.cache import SearchCache
 from sidecar.search.constants import stopwords
 from sidecar.search.schemas import S2SearchResult, SearchResponse
 from sidecar.typing import ResponseStatus
 
 logger = logging.getLogger(__name__)
 
+search_cache = SearchCache(
+    max_entries=S2_CACHE_MAX_ENTRIES, ttl=S2_CACHE_TTL, filepath=S2_CACHE_PATH or None
+)
+
+_s2_client = None
+_s2_client_lock = threading.Lock()
+
+
+def get_s2_client():
+    """
+    Returns the SemanticScholar API client shared by all searches,
+    creating it on first use.
+    """
+    global _s2_client
+    with _s2_client_lock:
+        if _s2_client is None:
+            # imported on first use, as it is slow to load
+            from semanticscholar import SemanticScholar
+
+            _s2_client = SemanticScholar()
+        return _s2_client
+
 
 class Searcher:
-    # Initialize the SemanticScholar API client and stopwords set
+    # Initialize the stopwords set (the SemanticScholar API client is shared)
     def __init__(self):
-        self.s2 = SemanticScholar()
         self.stopwords = stopwords
 
+    @property
+    def s2(self):
+        return get_s2_client()
+
     # Method to preprocess the query
     def preprocess_query(self, query):
         # convert query to lowercase and remove stopwords
@@ -68,6 +95,13 @@ class Searcher:
         # Preprocess the query (e.g., lowercase, remove stopwords)
         query = self.preprocess_query(query)
 
+        # Repeated searches are answered from the cache
+        key = (query, limit, tuple(returned_fields))
+        cached = search_cache.get(key)
+        if cached is not None:
+            logger.info(f"Cached results for preprocessed query: {query}")
+            return cached
+
         # Perform the search using Semantic Scholar's API
         logger.info(f"Preprocessed query: {query}")
 
@@ -99,12 +133,17 @@ class Searcher:
             )
             results_list.append(result)
 
-        return SearchResponse(
+        response = SearchResponse(
             status=ResponseStatus.OK, message="", results=results_list
         )
+        # errors (e.g. rate limiting) are not cached, so that they can be retried
+        search_cache.put(key, response)
+        return response
+
+
+searcher = Searcher()
 
 
 def search_s2(query: str, limit: int = 10) -> SearchResponse:
-    searcher = Searcher()
     response = searcher.search_func(query, limit=limit)
     return response
@@ -1,7 +1,15 @@
+from __future__ import annotations
+
 import json
 from pathlib import Path
 
 from sidecar.config import WEB_STORAGE_URL
+from sidecar.fileio import (
+    ParsedFileCache,
+    atomic_write_json,
+    file_lock,
+    get_file_signature,
+)
 from sidecar.settings.schemas import (
     FlatSettingsSchema,
     FlatSettingsSchemaPatch,
@@ -9,6 +17,9 @@ from sidecar.settings.schemas import (
     RewriteMannerType,
 )
 
+# parsed `settings.json` files, by path
+settings_cache: ParsedFileCache[FlatSettingsSchema] = ParsedFileCache()
+
 
 def make_settings_json_path(user_id: str) -> Path:
     filepath = Path(WEB_STORAGE_URL / user_id / "settings.json")
@@ -33,24 +44,33 @@ def initialize_settings_for_user(user_id: str) -> None:
     filepath.parent.mkdir(parents=True, exist_ok=True)
 
     defaults = default_settings()
-
-    with open(filepath, "w") as f:
-        json.dump(defaults.dict(), f)
+    atomic_write_json(filepath, defaults.dict())
 
 
 def get_settings_for_user(user_id: str) -> FlatSettingsSchema:
     """
     Reads a user's settings.json
+
+    Settings are cached in-process until the file changes, and the returned
+    object is shared between callers: it must not be modified.
     """
     filepath = make_settings_json_path(user_id)
 
-    if not filepath.exists():
+    signature = get_file_signature(filepath)
+    if signature is None:
         initialize_settings_for_user(user_id)
+        signature = get_file_signature(filepath)
+
+    settings = settings_cache.get(filepath, signature)
+    if settings is not None:
+        return settings
 
     with open(filepath, "r") as f:
         data = json.load(f)
 
-    return FlatSettingsSchema(**data)
+    settings = FlatSettingsSchema(**data)
+    settings_cache.put(filepath, signature, settings)
+    return settings
 
 
 def update_settings_for_user(
@@ -61,15 +81,17 @@ def update_settings_for_user(
     """
     filepath = make_settings_json_path(user_id)
 
-    if not filepath.exists():
-        initialize_settings_for_user(user_id)
+    with file_lock(filepath):
+        if not filepath.exists():
+            initialize_settings_for_user(user_id)
 
-    response = get_settings_for_user(user_id)
+        response = get_settings_for_user(user_id)
 
-    existing = response.dict()
-    existing.update({k: v for k, v in update.dict().items() if v is not None})
+        existing = response.dict()
+        existing.update({k: v for k, v in update.dict().items() if v is not None})
+        atomic_write_json(filepath, existing)
 
-    with open(filepath, "w") as f:
-        json.dump(existing, f)
+        settings = FlatSettingsSchema(**existing)
+        settings_cache.put(filepath, get_file_signature(filepath), settings)
 
-    return get_settings_for_user(user_id)
+    return settings
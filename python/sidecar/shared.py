@@ -1,13 +1,14 @@
+import asyncio
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
 from pathlib import Path
 from typing import List, Union
 
-import pypdf
-
 from sidecar import config
 from sidecar.config import logger
+from sidecar.references import pdf
 from sidecar.references.schemas import Author, Chunk, Reference, ReferenceCreate
 
 logger = logger.getChild(__name__)
@@ -40,6 +41,23 @@ def remove_file(filepath: str) -> None:
         pass
 
 
+def run_sync(coro):
+    """
+    Runs a coroutine to completion from synchronous code.
+
+    If called while an event loop is already running in this thread (e.g. from
+    an `async def` request handler), the coroutine is run on a new event loop
+    in a worker thread instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
 def parse_date(date_str: str) -> datetime:
     """
     Parse a YYYY-mm-dd date string into a datetime object.
@@ -102,7 +120,8 @@ def create_citation_key(ref: Reference) -> str:
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """
-    Extract raw text from a PDF file
+    Extract raw text from a PDF file.
+    Pages are read from the PDF text cache, so the file is parsed at most once.
 
     Parameters
     ----------
@@ -114,11 +133,7 @@ def extract_text_from_pdf(pdf_path: str) -> str:
     str
         Raw text extracted from PDF
     """
-    reader = pypdf.PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-    return text
+    return "".join(pdf.extract_pages(pdf_path))
 
 
 def chunk_text(
@@ -163,7 +178,8 @@ def chunk_reference(
     chunk_overlap: int = 200,
 ) -> List[Chunk]:
     """
-    Chunks a Reference document into small pieces of overlapping text
+    Chunks a Reference document into small pieces of overlapping text.
+    Shares its per-page text with `extract_text_from_pdf` via `pdf.extract_pages`.
 
     Parameters
     ----------
@@ -182,15 +198,13 @@ def chunk_reference(
         filepath = Path(config.UPLOADS_DIR).joinpath(ref.source_filename)
 
     try:
-        reader = pypdf.PdfReader(str(filepath))
+        pages = pdf.extract_pages(filepath)
     except FileNotFoundError:
         logger.error(f"File not found: {filepath}")
         return []
 
     chunks = []
-    for page in reader.pages:
-        page_text = page.extract_text()
-
+    for page_num, page_text in enumerate(pages, start=1):
         for i in range(0, len(page_text), chunk_size - chunk_overlap):
             chunk = Chunk(
                 text=page_text[i : i + chunk_size],
@@ -198,7 +212,7 @@ def chunk_reference(
                     "source_filename": ref.source_filename,
                     "title": ref.title,
                     # 'authors': ref.authors,
-                    "page_num": page.page_number + 1,
+                    "page_num": page_num,
                 },
             )
             chunks.append(chunk)
@@ -1,8 +1,10 @@
 from typing import AsyncGenerator
 
 import pytest
+from pydantic import ValidationError
+from sidecar import config
 from sidecar.ai import chat
-from sidecar.ai.schemas import ChatRequest
+from sidecar.ai.schemas import ChatRequest, FusionMethod, RetrievalMode
 from sidecar.settings.service import default_settings
 
 
@@ -29,6 +31,87 @@ async def test_chat_ask_question_is_ok(
     assert output["choices"][0]["index"] == 0
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("retrieval_mode", list(RetrievalMode))
+async def test_chat_ask_question_retrieval_modes(
+    monkeypatch, retrieval_mode, setup_project_references_json
+):
+    monkeypatch.setattr(config, "CHAT_VECTOR_RETRIEVAL", True)
+    prompts = []
+
+    async def mock_call_model(self, messages, **kwargs):
+        prompts.append(messages[0]["content"])
+        return {"choices": [{"index": 0, "message": {"content": "Chicago"}}]}
+
+    monkeypatch.setattr(chat.Chat, "call_model", mock_call_model)
+
+    user_settings = default_settings()
+    user_settings.api_key = "1234"
+
+    response = await chat.ask_question(
+        request=ChatRequest(
+            text="What is the most populous city in Illinois?",
+            retrieval_mode=retrieval_mode,
+        ),
+        project_id="project1",
+        user_settings=user_settings,
+    )
+
+    assert response.status == "ok"
+    assert len(prompts) == 1
+    assert "Chicago" in prompts[0]
+
+
+def test_chat_request_vector_retrieval_is_disabled(monkeypatch):
+    monkeypatch.setattr(config, "CHAT_VECTOR_RETRIEVAL", False)
+
+    # test: vector and hybrid retrieval, without a semantic embedder
+    # expect: the request is rejected
+    for retrieval_mode in [RetrievalMode.VECTOR, RetrievalMode.HYBRID]:
+        with pytest.raises(ValidationError):
+            ChatRequest(text="Chicago?", retrieval_mode=retrieval_mode)
+
+    assert ChatRequest(text="Chicago?").retrieval_mode == RetrievalMode.BM25
+
+
+@pytest.mark.asyncio
+async def test_chat_ask_question_hybrid_fusion(
+    monkeypatch, amock_call_model_is_ok, setup_project_references_json
+):
+    monkeypatch.setattr(chat.Chat, "call_model", amock_call_model_is_ok)
+    monkeypatch.setattr(config, "CHAT_VECTOR_RETRIEVAL", True)
+
+    rankers = []
+    create_ranker = chat.create_ranker
+
+    def mock_create_ranker(**kwargs):
+        rankers.append(create_ranker(**kwargs))
+        return rankers[-1]
+
+    monkeypatch.setattr(chat, "create_ranker", mock_create_ranker)
+
+    user_settings = default_settings()
+    user_settings.api_key = "1234"
+
+    # test: hybrid retrieval with weighted score fusion
+    # expect: the ranker fuses the rankings as requested
+    response = await chat.ask_question(
+        request=ChatRequest(
+            text="What is the most populous city in Illinois?",
+            retrieval_mode=RetrievalMode.HYBRID,
+            fusion=FusionMethod.WEIGHTED,
+            vector_weight=0.8,
+        ),
+        project_id="project1",
+        user_settings=user_settings,
+    )
+
+    assert response.status == "ok"
+    assert isinstance(rankers[0], chat.HybridRanker)
+    assert rankers[0].fusion == FusionMethod.WEIGHTED
+    assert rankers[0].vector_weight == 0.8
+
+
 @pytest.mark.asyncio
 async def test_chat_ask_question_is_missing_references(
     monkeypatch, amock_call_model_is_ok, setup_project_references_empty
@@ -48,6 +131,45 @@ async def test_chat_ask_question_is_missing_references(
     assert len(output["choices"]) == 0
 
 
+@pytest.mark.asyncio
+async def test_chat_ask_question_with_reference_ids(
+    monkeypatch, setup_project_references_json
+):
+    prompts = []
+
+    async def mock_call_model(self, messages, **kwargs):
+        prompts.append(messages[0]["content"])
+        return {"choices": [{"index": 0, "message": {"content": "Baseball"}}]}
+
+    monkeypatch.setattr(chat.Chat, "call_model", mock_call_model)
+
+    user_settings = default_settings()
+    user_settings.api_key = "1234"
+
+    # test: only the reference about baseball is selected
+    # expect: none of the chunks about Chicago are retrieved
+    response = await chat.ask_question(
+        request=ChatRequest(
+            text="What is the most populous city in Illinois?",
+            reference_ids=["700c1692-995f-46b7-896b-f68cd7f64dc6"],
+        ),
+        project_id="project1",
+        user_settings=user_settings,
+    )
+    assert response.status == "ok"
+    assert "chicago" not in prompts[0].lower()
+
+    # test: none of the selected references are stored
+    # expect: the missing references error
+    response = await chat.ask_question(
+        request=ChatRequest(text="Baseball?", reference_ids=["unknown"]),
+        project_id="project1",
+        user_settings=user_settings,
+    )
+    assert response.status == "error"
+    assert response.message == chat.get_missing_references_message()
+
+
 @pytest.mark.asyncio
 async def test_chat_ask_question_is_unhandled_error(
     monkeypatch, amock_call_model_is_unhandled_error, setup_project_references_json
@@ -0,0 +1,95 @@
+from sidecar.ai import context
+from sidecar.ai.prompts import prepare_chunks_for_prompt
+from sidecar.references.schemas import Chunk
+
+
+def _chunk_page(text: str, page_num: int, size: int = 1000, overlap: int = 200):
+    # same chunking as `shared.chunk_reference`
+    return [
+        Chunk(
+            text=text[i : i + size],
+            metadata={"source_filename": "test.pdf", "page_num": page_num},
+        )
+        for i in range(0, len(text), size - overlap)
+    ]
+
+
+def _make_page_text(seed: int, length: int = 2_500) -> str:
+    words = [f"word{seed}x{i}" for i in range(length)]
+    return " ".join(words)[:length]
+
+
+def test_count_tokens(monkeypatch):
+    assert context.count_tokens("") == 0
+    assert 0 < context.count_tokens("The quick brown fox") < 10
+
+    # test: the tokenizer cannot be loaded
+    # expect: token counts are estimated from the number of characters
+    monkeypatch.setattr(context, "get_encoding", lambda model: None)
+    assert context.count_tokens("a" * 10) == 3
+
+
+def test_merge_chunk_texts():
+    text = _make_page_text(0)
+    first, second, third, last = [c.text for c in _chunk_page(text, page_num=1)]
+
+    assert context.merge_chunk_texts(first, second) == text[:1800]
+    assert context.merge_chunk_texts(second, first) == text[:1800]
+    assert context.merge_chunk_texts(first, third) is None
+
+    # the last chunk of the page is entirely within the one before
+    assert len(last) < 200
+    assert context.merge_chunk_texts(third, last) == third
+
+
+def test_pack_context_merges_chunks_of_a_page():
+    page_one = _make_page_text(1)
+    page_two = _make_page_text(2)
+    chunks_one = _chunk_page(page_one, page_num=1)
+    chunks_two = _chunk_page(page_two, page_num=2)
+
+    # test: chunks ranked out of order, with a gap filled in later
+    # expect: the chunks of each page are merged into one passage, in the
+    # order of their best ranked chunk
+    ranked = [chunks_one[2], chunks_two[0], chunks_one[0], chunks_one[1]]
+    passages, num_tokens = context.pack_context(ranked, max_tokens=100_000)
+
+    assert [p.text for p in passages] == [page_one, page_two[:1000]]
+    assert [p.metadata["page_num"] for p in passages] == [1, 2]
+
+    # the merged passages cost fewer tokens than the chunks
+    assert num_tokens == sum(
+        context.count_tokens(prepare_chunks_for_prompt([p])) for p in passages
+    )
+    assert num_tokens < context.count_tokens(prepare_chunks_for_prompt(ranked))
+
+
+def test_pack_context_fills_token_budget():
+    chunks = [
+        Chunk(
+            text=_make_page_text(i, length=1_000),
+            metadata={"source_filename": "test.pdf", "page_num": i},
+        )
+        for i in range(10)
+    ]
+    chunk_tokens = context.count_tokens(prepare_chunks_for_prompt(chunks[:1]))
+
+    # test: a budget for three and a half chunks
+    # expect: the three best ranked chunks
+    max_tokens = int(chunk_tokens * 3.5)
+    passages, num_tokens = context.pack_context(chunks, max_tokens=max_tokens)
+    assert passages == chunks[:3]
+    assert num_tokens == 3 * chunk_tokens
+    assert context.count_tokens(prepare_chunks_for_prompt(passages)) <= max_tokens
+
+    # test: a chunk that does not fit, followed by one that does
+    # expect: the first is skipped, and the second included
+    short = Chunk(
+        text="short", metadata={"source_filename": "test.pdf", "page_num": 99}
+    )
+    passages, _ = context.pack_context(chunks[:4] + [short], max_tokens=max_tokens)
+    assert passages == chunks[:3] + [short]
+
+    # test: a budget smaller than any chunk
+    # expect: no context
+    assert context.pack_context(chunks, max_tokens=10) == ([], 0)
@@ -1,16 +1,33 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from sidecar.ai.ranker import BM25Ranker
+from sidecar.ai.ranker import (
+    BM25Ranker,
+    HybridRanker,
+    VectorRanker,
+    reciprocal_rank_fusion,
+    weighted_score_fusion,
+)
+from sidecar.ai.schemas import FusionMethod
 from sidecar.references import storage
 
+from ..helpers import _copy_fixture_to_temp_dir
 
-def test_bm25_ranker(fixtures_dir):
+
+def test_bm25_ranker(tmp_path, fixtures_dir):
     # the corpus is made up of two references
     # one reference is about Chicago
     # one reference is about baseball
     path_from_fixtures = f"{fixtures_dir}/data/references.json"
     fp = Path(__file__).parent.joinpath(path_from_fixtures)
-    jstore = storage.JsonStorage(filepath=fp)
+
+    # the ranker writes its index next to references.json,
+    # so we copy the fixture to avoid writing to the fixtures directory
+    write_path = tmp_path.joinpath(".storage", "references.json")
+    _copy_fixture_to_temp_dir(fp, write_path)
+
+    jstore = storage.JsonStorage(filepath=write_path)
     jstore.load()
 
     ranker = BM25Ranker(storage=jstore)
@@ -30,3 +47,144 @@ def test_bm25_ranker(fixtures_dir):
     # relevant docs should not be about Chicago
     for chunk in docs:
         assert "chicago" not in chunk.text.lower()
+
+    # the index should be persisted next to references.json
+    assert jstore.index_filepath.exists()
+
+
+def test_vector_ranker(tmp_path, fixtures_dir):
+    path_from_fixtures = f"{fixtures_dir}/data/references.json"
+    write_path = tmp_path.joinpath(".storage", "references.json")
+    _copy_fixture_to_temp_dir(Path(path_from_fixtures), write_path)
+
+    jstore = storage.JsonStorage(filepath=write_path)
+    jstore.load()
+
+    for exact in [True, False]:
+        ranker = VectorRanker(storage=jstore, exact=exact)
+
+        docs = ranker.get_top_n(query="Chicago", limit=2)
+        assert len(docs) == 2
+        for chunk in docs:
+            assert "chicago" in chunk.text.lower()
+
+    # the vectors should be persisted next to references.json
+    assert jstore.vector_index.vectors_filepath.exists()
+
+
+def test_rank_fusion():
+    bm25 = [("a", 12.0), ("b", 6.0), ("c", 1.0)]
+    vector = [("d", 0.9), ("b", 0.8), ("c", 0.7)]
+
+    # docs in both rankings come first
+    assert reciprocal_rank_fusion(
+        [[d for d, _ in bm25], [d for d, _ in vector]], weights=[0.5, 0.5]
+    ) == ["b", "c", "a", "d"]
+
+    # scores are normalized per ranking: a and d are the best match of one each
+    assert weighted_score_fusion([bm25, vector], weights=[0.5, 0.5])[:2] == ["a", "d"]
+    assert weighted_score_fusion([bm25, vector], weights=[0.2, 0.8])[0] == "d"
+
+
+def test_hybrid_ranker(tmp_path, fixtures_dir):
+    path_from_fixtures = f"{fixtures_dir}/data/references.json"
+    write_path = tmp_path.joinpath(".storage", "references.json")
+    _copy_fixture_to_temp_dir(Path(path_from_fixtures), write_path)
+
+    jstore = storage.JsonStorage(filepath=write_path)
+    jstore.load()
+
+    for fusion in FusionMethod:
+        ranker = HybridRanker(storage=jstore, fusion=fusion)
+
+        docs = ranker.get_top_n(query="Chicago", limit=2)
+        assert len(docs) == 2
+        for chunk in docs:
+            assert "chicago" in chunk.text.lower()
+
+        docs = ranker.get_top_n(query="baseball", limit=2)
+        assert len(docs) == 2
+        for chunk in docs:
+            assert "chicago" not in chunk.text.lower()
+
+
+def test_rankers_restricted_to_references(tmp_path, fixtures_dir):
+    path_from_fixtures = f"{fixtures_dir}/data/references.json"
+    write_path = tmp_path.joinpath(".storage", "references.json")
+    _copy_fixture_to_temp_dir(Path(path_from_fixtures), write_path)
+
+    jstore = storage.JsonStorage(filepath=write_path)
+    jstore.load()
+
+    # the second reference is about baseball, and never mentions Chicago
+    reference_id = jstore.references[1].id
+    selected = jstore.references[1].chunks
+
+    for ranker in [
+        BM25Ranker(storage=jstore, reference_ids=[reference_id]),
+        VectorRanker(storage=jstore, reference_ids=[reference_id]),
+        HybridRanker(storage=jstore, reference_ids=[reference_id]),
+    ]:
+        docs = ranker.get_top_n(query="Chicago", limit=3)
+        assert len(docs) == 3
+        for chunk in docs:
+            assert chunk in selected
+
+    # test: none of the selected references are stored
+    # expect: nothing is ranked
+    ranker = BM25Ranker(storage=jstore, reference_ids=["unknown"])
+    assert ranker.get_top_n(query="Chicago", limit=3) == []
+
+
+def test_rankers_while_references_change(tmp_path, fixtures_dir):
+    path_from_fixtures = f"{fixtures_dir}/data/references.json"
+    write_path = tmp_path.joinpath(".storage", "references.json")
+    _copy_fixture_to_temp_dir(Path(path_from_fixtures), write_path)
+
+    jstore = storage.JsonStorage(filepath=write_path)
+    jstore.load()
+    extra = jstore.references[0].copy(update={"id": "extra", "citation_key": None})
+
+    # test: references are added and deleted on another thread while ranking
+    # expect: every ranking sees a consistent corpus, and none of them fail
+    stop = threading.Event()
+
+    def churn():
+        while not stop.is_set():
+            jstore.add_references([extra])
+            jstore.delete(reference_ids=["extra"])
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    try:
+        for _ in range(20):
+            for ranker in [
+                BM25Ranker(storage=jstore),
+                VectorRanker(storage=jstore),
+                HybridRanker(storage=jstore),
+            ]:
+                docs = ranker.get_top_n(query="Chicago", limit=2)
+                assert len(docs) == 2
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_hybrid_ranker_under_storage_lock(tmp_path, fixtures_dir):
+    path_from_fixtures = f"{fixtures_dir}/data/references.json"
+    write_path = tmp_path.joinpath(".storage", "references.json")
+    _copy_fixture_to_temp_dir(Path(path_from_fixtures), write_path)
+
+    jstore = storage.JsonStorage(filepath=write_path)
+    jstore.load()
+
+    # test: the caller holds the storage lock before the vector index is loaded
+    # expect: the vector search on the executor thread does not deadlock
+    ranker = HybridRanker(storage=jstore)
+
+    def rank():
+        with jstore.lock:
+            return ranker.get_top_n(query="Chicago", limit=2)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert len(executor.submit(rank).result(timeout=30)) == 2
@@ -129,6 +129,19 @@ def test_ai_chat_missing_required_request_params(
     }
 
 
+def test_ai_chat_invalid_vector_weight(
+    monkeypatch, amock_call_model_is_ok, setup_project_references_json
+):
+    monkeypatch.setattr(Chat, "call_model", amock_call_model_is_ok)
+
+    project_id = "project1"
+    request = {"text": "This is a test", "vector_weight": 1.5}
+    response = client.post(f"/api/ai/{project_id}/chat", json=request)
+
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "vector_weight"]
+
+
 def test_ai_chat_is_streaming(
     monkeypatch,
     amock_call_model_is_stream,
@@ -7,7 +7,7 @@ from fastapi.testclient import TestClient
 from sidecar import config
 from sidecar.api import api
 from sidecar.projects import service as projects_service
-from sidecar.references import storage
+from sidecar.references import pdf, storage
 from sidecar.settings import service as settings_service
 from sidecar.settings.schemas import ModelProvider
 
@@ -19,6 +19,14 @@ def fixtures_dir():
     return Path(__file__).parent / "fixtures"
 
 
+@pytest.fixture(autouse=True)
+def isolate_pdf_text_cache(monkeypatch, tmp_path):
+    # keeps tests from reading or writing artifacts in the real cache directory
+    monkeypatch.setattr(
+        pdf, "pdf_text_cache", pdf.PdfTextCache(cache_dir=tmp_path / "pdf-text-cache")
+    )
+
+
 @pytest.fixture
 def setup_project_storage(monkeypatch, tmp_path):
     user_id = "user1"
@@ -110,52 +118,32 @@ def setup_uploaded_reference_pdfs(monkeypatch, tmp_path, fixtures_dir):
 
 @pytest.fixture
 def mock_url_pdf_response(fixtures_dir):
-    def mock_url_pdf_response(*args, **kwargs):
-        class MockResponse:
-            @property
-            def content(self):
-                with open(f"{fixtures_dir}/pdf/test.pdf", "rb") as f:
-                    return f.read()
-
-            @property
-            def status_code(self):
-                return 200
-
-            @property
-            def ok(self):
-                return True
-
-            @property
-            def headers(self):
-                return {"content-type": "application/pdf"}
-
-        return MockResponse()
+    import httpx
+
+    def mock_url_pdf_response(request: httpx.Request) -> httpx.Response:
+        with open(f"{fixtures_dir}/pdf/test.pdf", "rb") as f:
+            content = f.read()
+        if request.method == "HEAD":
+            return httpx.Response(
+                200,
+                headers={
+                    "content-type": "application/pdf",
+                    "content-length": str(len(content)),
+                },
+            )
+        return httpx.Response(
+            200, content=content, headers={"content-type": "application/pdf"}
+        )
 
     return mock_url_pdf_response
 
 
 @pytest.fixture
 def mock_url_pdf_response_error(fixtures_dir):
-    def mock_url_pdf_response(*args, **kwargs):
-        class MockResponse:
-            @property
-            def content(self):
-                with open(f"{fixtures_dir}/pdf/test.pdf", "rb") as f:
-                    return f.read()
-
-            @property
-            def status_code(self):
-                return 403
+    import httpx
 
-            @property
-            def ok(self):
-                return False
-
-            @property
-            def headers(self):
-                return {"content-type": "application/pdf"}
-
-        return MockResponse()
+    def mock_url_pdf_response(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(403, headers={"content-type": "application/pdf"})
 
     return mock_url_pdf_response
 
@@ -1,4 +1,5 @@
 from pathlib import Path
+from unittest.mock import patch
 from uuid import UUID
 
 from fastapi.testclient import TestClient
@@ -92,3 +93,45 @@ def test_delete_project(monkeypatch, tmp_path):
 
     storage = service.read_project_storage(user_id)
     assert project_id not in storage
+
+
+def test_get_project_files_not_modified(monkeypatch, tmp_path):
+    monkeypatch.setattr(service, "WEB_STORAGE_URL", tmp_path)
+
+    project_id = "project1"
+    service.create_project("user1", project_id, "project1name")
+
+    response = client.get(f"/api/projects/{project_id}/files")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # test: poll with the current tag
+    # expect: 304 without reading the project
+    with patch.object(service, "get_project_files") as mocked:
+        response = client.get(
+            f"/api/projects/{project_id}/files", headers={"If-None-Match": etag}
+        )
+    assert response.status_code == 304
+    mocked.assert_not_called()
+
+    # test: poll after a file is written
+    # expect: the new file tree, with a new tag
+    client.put(
+        f"/api/fs/{project_id}/notes.md", files={"file": ("notes.md", b"# Notes")}
+    )
+    response = client.get(
+        f"/api/projects/{project_id}/files", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert [f["name"] for f in response.json()["contents"]] == ["notes.md"]
+
+    # test: poll after the file is deleted
+    # expect: the new file tree, with a new tag
+    etag = response.headers["ETag"]
+    client.delete(f"/api/fs/{project_id}/notes.md")
+    response = client.get(
+        f"/api/projects/{project_id}/files", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["contents"] == []
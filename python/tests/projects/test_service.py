@@ -1,4 +1,7 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from unittest.mock import patch
 
 from sidecar.projects import service
 from sidecar.projects.schemas import ProjectFileTreeResponse
@@ -49,6 +52,26 @@ def test_update_project_storage_should_be_created(monkeypatch, tmp_path):
     assert stored_projects.dict()["projects"] == expected
 
 
+def test_update_project_storage_concurrent_writes(monkeypatch, tmp_path):
+    monkeypatch.setattr(service, "WEB_STORAGE_URL", tmp_path)
+
+    # test: create projects from several threads at once
+    # expect: every project is stored, none overwrites another
+    project_ids = [f"project{i}" for i in range(20)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for project_id in project_ids:
+            executor.submit(
+                service.update_project_storage,
+                "user1",
+                project_id,
+                project_id,
+                tmp_path / project_id,
+            )
+
+    stored_projects = service.read_project_storage("user1")
+    assert sorted(stored_projects.projects) == sorted(project_ids)
+
+
 def test_update_project_storage_should_be_appended_to(
     monkeypatch, tmp_path, setup_project_storage
 ):
@@ -255,3 +278,33 @@ def test_get_project_files(monkeypatch, tmp_path, setup_project_storage):
 
     assert isinstance(response, ProjectFileTreeResponse)
     assert sorted(response.dict()) == sorted(expected)
+
+
+def test_read_project_storage_is_cached(monkeypatch, tmp_path):
+    monkeypatch.setattr(service, "WEB_STORAGE_URL", tmp_path)
+
+    user_id = "user1"
+    project = service.create_project(user_id, "project1", "project1name")
+
+    # test: resolve project paths after creating a project
+    # expect: projects.json is not read again
+    with patch.object(service.json, "load") as mocked:
+        assert service.get_project_path(user_id, "project1") == Path(project.path)
+        assert service.get_project_uploads_path(user_id, "project1").parent == Path(
+            project.path
+        )
+    mocked.assert_not_called()
+
+    # test: projects.json is written by something else
+    # expect: it is read again
+    filepath = service.make_projects_json_path(user_id)
+    data = json.loads(filepath.read_text())
+    data["project2"] = {"id": "project2", "name": "other", "path": str(tmp_path)}
+    filepath.write_text(json.dumps(data))
+
+    assert "project2" in service.read_project_storage(user_id).projects
+
+    # test: delete a project
+    # expect: the registry is refreshed
+    service.delete_project(user_id, "project1")
+    assert "project1" not in service.read_project_storage(user_id).projects
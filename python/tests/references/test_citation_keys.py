@@ -0,0 +1,65 @@
+from datetime import date
+
+from sidecar.references.citation_keys import (
+    CitationKeyIndex,
+    format_citation_key,
+    parse_citation_key,
+)
+from sidecar.references.schemas import Author, IngestStatus, Reference
+
+
+def _make_reference(id: str, surname: str = None, year: int = None, key=None):
+    return Reference(
+        id=id,
+        status=IngestStatus.COMPLETE,
+        authors=[Author(full_name=f"Ann {surname}")] if surname else [],
+        published_date=date(year, 1, 1) if year else None,
+        citation_key=key,
+    )
+
+
+def test_format_and_parse_citation_key():
+    assert format_citation_key("smith2021", 0) == "smith2021"
+    assert format_citation_key("smith2021", 1) == "smith2021a"
+    assert format_citation_key("smith2021", 26) == "smith2021z"
+    assert format_citation_key("smith2021", 27) == "smith2021aa"
+    assert format_citation_key("untitled", 3) == "untitled3"
+
+    for ordinal in [0, 1, 25, 26, 27, 700]:
+        key = format_citation_key("smith", ordinal)
+        assert parse_citation_key(key, "smith") == ordinal
+
+    assert parse_citation_key("untitled12", "untitled") == 12
+    assert parse_citation_key("jones2021", "smith") is None
+    assert parse_citation_key("smith-2021", "smith") is None
+
+
+def test_citation_key_index_allocates_unique_keys(tmp_path):
+    filepath = tmp_path.joinpath("citation_keys.json")
+    existing = [
+        _make_reference("1", "Smith", 2021, key="smith2021"),
+        # set by hand: reserved, although it does not match its base key
+        _make_reference("2", "Jones", 2021, key="smith2021a"),
+    ]
+    index = CitationKeyIndex(filepath)
+    index.build(existing)
+
+    # test: allocate keys for References with the same base key
+    # expect: keys in use are skipped
+    new = [_make_reference(str(i), "Smith", 2021) for i in range(3, 6)]
+    keys = [index.allocate(ref) for ref in new]
+    assert keys == ["smith2021b", "smith2021c", "smith2021d"]
+
+    # test: free a key
+    # expect: it is not allocated again while the index is loaded
+    index.remove_reference(new[2])
+    assert index.allocate(_make_reference("6", "Smith", 2021)) == "smith2021e"
+
+    # test: reload the index
+    # expect: the allocations are persisted
+    index.save()
+    reloaded = CitationKeyIndex(filepath)
+    reloaded.load()
+    assert reloaded.keys == index.keys
+    assert reloaded.allocations["smith2021"] == {0: "1", 2: "3", 3: "4", 5: "6"}
+    assert reloaded.allocations["smith2021a"] == {0: "2"}
@@ -0,0 +1,107 @@
+import asyncio
+
+import httpx
+import pytest
+from sidecar.references.grobid import AsyncGrobidClient
+
+
+def _create_pdfs(tmp_path, names: list[str]):
+    staging_dir = tmp_path.joinpath(".staging")
+    staging_dir.mkdir()
+
+    paths = []
+    for name in names:
+        path = staging_dir.joinpath(name)
+        path.write_bytes(b"%PDF-1.4 fake")
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.asyncio
+async def test_grobid_client_writes_output_per_file(tmp_path):
+    pdfs = _create_pdfs(tmp_path, ["good.pdf", "bad.pdf"])
+    output_dir = tmp_path.joinpath(".grobid")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if b"good.pdf" in request.content:
+            return httpx.Response(200, text="<TEI></TEI>")
+        return httpx.Response(500, text="[BAD_INPUT_DATA]")
+
+    completed = []
+    client = AsyncGrobidClient(
+        "http://grobid", transport=httpx.MockTransport(handler), backoff=0
+    )
+    statuses = await client.process(
+        "processHeaderDocument",
+        pdfs,
+        output_dir=output_dir,
+        on_complete=lambda path, status: completed.append((path.name, status)),
+    )
+
+    assert statuses == {"good.pdf": 200, "bad.pdf": 500}
+    assert sorted(completed) == [("bad.pdf", 500), ("good.pdf", 200)]
+    assert output_dir.joinpath("good.tei.xml").read_text() == "<TEI></TEI>"
+    assert output_dir.joinpath("bad_500.txt").read_text() == "[BAD_INPUT_DATA]"
+
+
+@pytest.mark.asyncio
+async def test_grobid_client_retries_busy_and_timeouts(tmp_path):
+    pdfs = _create_pdfs(tmp_path, ["busy.pdf", "slow.pdf"])
+    output_dir = tmp_path.joinpath(".grobid")
+
+    attempts = {"busy.pdf": 0, "slow.pdf": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        name = "busy.pdf" if b"busy.pdf" in request.content else "slow.pdf"
+        attempts[name] += 1
+
+        # busy: succeed on the third attempt
+        if name == "busy.pdf":
+            if attempts[name] < 3:
+                return httpx.Response(503)
+            return httpx.Response(200, text="<TEI></TEI>")
+
+        # slow: always time out
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    client = AsyncGrobidClient(
+        "http://grobid",
+        max_attempts=3,
+        backoff=0,
+        transport=httpx.MockTransport(handler),
+    )
+    statuses = await client.process(
+        "processHeaderDocument", pdfs, output_dir=output_dir
+    )
+
+    assert attempts == {"busy.pdf": 3, "slow.pdf": 3}
+    assert statuses == {"busy.pdf": 200, "slow.pdf": 408}
+    assert output_dir.joinpath("busy.tei.xml").exists()
+    assert output_dir.joinpath("slow_408.txt").exists()
+
+
+@pytest.mark.asyncio
+async def test_grobid_client_bounds_concurrency(tmp_path):
+    pdfs = _create_pdfs(tmp_path, [f"{i}.pdf" for i in range(10)])
+
+    in_flight = 0
+    max_in_flight = 0
+
+    client = AsyncGrobidClient("http://grobid", concurrency=3)
+
+    async def mock_post_pdf(client, service, pdf_path):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return 200, "<TEI></TEI>"
+
+    client._post_pdf = mock_post_pdf
+
+    statuses = await client.process(
+        "processHeaderDocument", pdfs, output_dir=tmp_path.joinpath(".grobid")
+    )
+
+    assert len(statuses) == 10
+    assert max_in_flight == 3
@@ -0,0 +1,231 @@
+import numpy as np
+from rank_bm25 import BM25Plus
+from sidecar.references import storage
+from sidecar.references.index import BM25Index, make_doc_id, parse_doc_id, tokenize
+from sidecar.references.schemas import Chunk, IngestStatus, Reference, ReferencePatch
+
+from ..helpers import _copy_fixture_to_temp_dir
+
+
+def _load_storage_copy(fixtures_dir, tmp_path) -> storage.JsonStorage:
+    write_path = tmp_path.joinpath(".storage", "references.json")
+    _copy_fixture_to_temp_dir(f"{fixtures_dir}/data/references.json", write_path)
+
+    jstore = storage.JsonStorage(filepath=write_path)
+    jstore.load()
+    return jstore
+
+
+def test_bm25_index_ranks_like_bm25plus(tmp_path, fixtures_dir):
+    jstore = _load_storage_copy(fixtures_dir, tmp_path)
+
+    index = BM25Index(tmp_path.joinpath("bm25_index.json"))
+    index.build(jstore.references)
+
+    doc_ids = [
+        make_doc_id(ref.id, idx)
+        for ref in jstore.references
+        for idx in range(len(ref.chunks))
+    ]
+    bm25 = BM25Plus(jstore.tokenized_corpus)
+
+    for query in ["chicago", "baseball team", "the most populous city"]:
+        tokens = tokenize(query)
+        expected = bm25.get_scores(tokens)
+
+        # BM25+ adds the same `delta * idf` constant to every document
+        baseline = sum(bm25.idf.get(t, 0) * bm25.delta for t in tokens)
+        scores = index.get_scores(tokens)
+        actual = np.array([scores.get(doc_id, 0.0) for doc_id in doc_ids])
+
+        np.testing.assert_allclose(actual + baseline, expected)
+
+
+def test_bm25_index_save_and_load(tmp_path, fixtures_dir):
+    jstore = _load_storage_copy(fixtures_dir, tmp_path)
+
+    index = BM25Index(tmp_path.joinpath("bm25_index.json"))
+    index.build(jstore.references)
+    index.save()
+
+    loaded = BM25Index(tmp_path.joinpath("bm25_index.json"))
+    loaded.load()
+
+    assert loaded.postings == index.postings
+    assert loaded.doc_lengths == index.doc_lengths
+    assert loaded.total_length == index.total_length
+    assert not loaded.is_stale(jstore.references)
+    assert loaded.get_top_n(["chicago"], n=3) == index.get_top_n(["chicago"], n=3)
+
+
+def test_bm25_index_is_built_lazily_and_rebuilt_when_stale(tmp_path, fixtures_dir):
+    jstore = _load_storage_copy(fixtures_dir, tmp_path)
+    assert not jstore.index_filepath.exists()
+
+    index = jstore.bm25_index
+    assert jstore.index_filepath.exists()
+    assert index.num_docs == len(jstore.chunks)
+
+    # simulate `references.json` being written without updating the index
+    stale = BM25Index(jstore.index_filepath)
+    stale.build(jstore.references[:1])
+    stale.save()
+
+    jstore = storage.JsonStorage(filepath=jstore.filepath)
+    jstore.load()
+    assert jstore.bm25_index.num_docs == len(jstore.chunks)
+
+
+def test_bm25_index_is_stale_when_chunk_text_changes(tmp_path):
+    ref = Reference(
+        id="ref-x",
+        status=IngestStatus.COMPLETE,
+        chunks=[Chunk(text="apple pie recipe")],
+    )
+    index = BM25Index(tmp_path.joinpath("bm25_index.json"))
+    index.build([ref])
+    index.save()
+
+    # test: the chunk text changes, but not the number of chunks
+    # expect: the index is stale
+    changed = ref.copy(update={"chunks": [Chunk(text="banana bread")]})
+    loaded = BM25Index(tmp_path.joinpath("bm25_index.json"))
+    loaded.load()
+    assert loaded.is_stale([changed])
+
+    # test: re-adding the changed Reference
+    # expect: the old postings are removed, even though the index is given
+    # the new chunks
+    loaded.add_reference(changed)
+    assert not loaded.is_stale([changed])
+    assert "apple" not in loaded.postings
+    assert loaded.get_scores(["apple"]) == {}
+    assert list(loaded.get_scores(["banana"])) == ["ref-x:0"]
+
+
+def test_bm25_index_is_updated_incrementally(tmp_path, fixtures_dir):
+    jstore = _load_storage_copy(fixtures_dir, tmp_path)
+    _ = jstore.bm25_index
+
+    # test: add a reference
+    # expect: its chunks are searchable in memory, and on disk once the
+    # indexes are flushed
+    ref = Reference(
+        id="new-ref",
+        status=IngestStatus.COMPLETE,
+        chunks=[Chunk(text="Zebras are striped"), Chunk(text="Lions eat zebras")],
+    )
+    jstore.add_reference(ref)
+
+    assert jstore.bm25_index.get_top_n(["zebras"], n=1) == ["new-ref:0"]
+
+    reloaded = BM25Index(jstore.index_filepath)
+    reloaded.load()
+    assert "zebras" not in reloaded.postings
+    assert reloaded.is_stale(jstore.references)
+
+    jstore.flush_indexes()
+    reloaded.load()
+    assert set(reloaded.get_scores(["zebras"])) == {"new-ref:0", "new-ref:1"}
+
+    # test: update a reference's metadata
+    # expect: the index is unchanged
+    postings = dict(jstore.bm25_index.postings)
+    jstore.update("new-ref", ReferencePatch(data={"title": "Zebras"}))
+    assert jstore.bm25_index.postings == postings
+
+    # test: delete a reference
+    # expect: its chunks are removed from the index, both in memory and on disk
+    jstore.delete(reference_ids=["new-ref"])
+    jstore.compact()
+
+    assert "zebras" not in jstore.bm25_index.postings
+    assert "new-ref" not in jstore.bm25_index.reference_chunk_counts
+
+    reloaded = BM25Index(jstore.index_filepath)
+    reloaded.load()
+    assert "zebras" not in reloaded.postings
+    assert reloaded.num_docs == len(jstore.chunks)
+    assert not reloaded.is_stale(jstore.references)
+
+
+def test_bm25_matrix_top_n_matches_bm25plus(tmp_path):
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(200)]
+
+    # zipf-like term distribution, so that some terms are very common
+    probs = 1 / np.arange(1, len(vocabulary) + 1)
+    probs /= probs.sum()
+    corpus = [
+        list(rng.choice(vocabulary, size=rng.integers(5, 50), p=probs))
+        for _ in range(500)
+    ]
+    references = [
+        Reference(
+            id=f"ref{i}",
+            status=IngestStatus.COMPLETE,
+            chunks=[Chunk(text=" ".join(tokens))],
+        )
+        for i, tokens in enumerate(corpus)
+    ]
+
+    index = BM25Index(tmp_path.joinpath("bm25_index.json"))
+    index.build(references)
+    bm25 = BM25Plus(corpus)
+
+    for query in [["term0"], ["term3", "term150"], ["term7", "term7", "term42"]]:
+        expected = np.sort(bm25.get_scores(query))[::-1][:10]
+
+        top = index.get_top_n(query, n=10)
+        scores = bm25.get_scores(query)
+        actual = [scores[int(parse_doc_id(doc_id)[0][3:])] for doc_id in top]
+
+        np.testing.assert_allclose(actual, expected)
+
+    # test: query with no matching terms
+    # expect: `n` non-matching chunks, in index order
+    assert index.get_top_n(["unknown"], n=3) == ["ref0:0", "ref1:0", "ref2:0"]
+
+
+def test_bm25_matrix_top_n_for_references(tmp_path):
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(100)]
+    references = [
+        Reference(
+            id=f"ref{i}",
+            status=IngestStatus.COMPLETE,
+            chunks=[
+                Chunk(text=" ".join(rng.choice(vocabulary, size=20)))
+                for _ in range(rng.integers(1, 6))
+            ],
+        )
+        for i in range(100)
+    ]
+
+    index = BM25Index(tmp_path.joinpath("bm25_index.json"))
+    index.build(references)
+    index.remove_reference(references[3])
+    index.add_reference(references[3])
+
+    reference_ids = ["ref3", "ref10", "ref42", "ref77", "unknown"]
+    for query in [["term0"], ["term3", "term50", "term50"], ["unknown"]]:
+        # test: restricting the query to a subset of references
+        # expect: the full ranking, without the chunks of other references
+        scores = index.get_scores(query)
+        expected = sorted(
+            (
+                doc_id
+                for doc_id in index.matrix.doc_ids
+                if parse_doc_id(doc_id)[0] in reference_ids
+            ),
+            key=lambda doc_id: -scores.get(doc_id, 0.0),
+        )[:5]
+        actual = index.get_top_n_with_scores(query, n=5, reference_ids=reference_ids)
+
+        assert [doc_id for doc_id, _ in actual] == expected
+        np.testing.assert_allclose(
+            [score for _, score in actual],
+            [scores.get(doc_id, 0.0) for doc_id in expected],
+        )
+
+    assert index.get_top_n(["term0"], n=5, reference_ids=[]) == []
@@ -1,11 +1,14 @@
 import json
 import os
+import threading
 from pathlib import Path
 from uuid import uuid4
 
+import pytest
 from sidecar import config
 from sidecar.references import ingest, storage
-from sidecar.references.schemas import IngestStatus, Reference
+from sidecar.references.index import BM25Index
+from sidecar.references.schemas import Chunk, IngestStatus, Reference, ReferencePatch
 
 
 def _copy_fixture_to_temp_dir(source_path: Path, write_path: Path) -> None:
@@ -37,17 +40,18 @@ def test_run_ingest(monkeypatch, tmp_path, fixtures_dir):
 
     monkeypatch.setattr(config, "UPLOADS_DIR", tmp_path.joinpath("uploads"))
 
-    # grobid server takes an input directory of PDFs
-    # if grobid successfully parses the file, it creates a {pdfname}.tei.xml file
-    # if grobid fails to parse the file, it creates a {pdfname}_{errorcode}.txt file
-    # mock this by copying the test xml to the output directory
-    def mock_grobid_client_process(*args, **kwargs):
-        path = Path(f"{fixtures_dir}/xml/")
-        for file_ in path.glob("*"):
-            write_path = grobid_output_dir.joinpath(file_.name)
-            _copy_fixture_to_temp_dir(file_, write_path)
+    # grobid parses each PDF in the staging directory
+    # if grobid successfully parses the file, it responds with TEI XML
+    # and we write a {pdfname}.tei.xml file
+    # if grobid fails to parse the file, we write a {pdfname}_{errorcode}.txt file
+    # mock this by responding with the test xml for `test.pdf` only
+    async def mock_process_pdf(self, client, service, pdf_path):
+        if pdf_path.name == "test.pdf":
+            with open(f"{fixtures_dir}/xml/test.tei.xml", "r") as f:
+                return 200, f.read()
+        return 500, ""
 
-    monkeypatch.setattr(ingest.GrobidClient, "process", mock_grobid_client_process)
+    monkeypatch.setattr(ingest.AsyncGrobidClient, "process_pdf", mock_process_pdf)
 
     pdf_directory = tmp_path.joinpath("uploads")
     response = ingest.run_ingest(pdf_directory=pdf_directory)
@@ -79,9 +83,12 @@ def test_run_ingest(monkeypatch, tmp_path, fixtures_dir):
     # check that all temporary files were cleaned up ...
     assert len(os.listdir(staging_dir)) == 0
     assert len(os.listdir(grobid_output_dir)) == 0
-    assert len(os.listdir(json_storage_dir)) == 1
-
-    # ... except for the references.json file
+    # ... except for the references.json file and the chunk vectors
+    assert sorted(os.listdir(json_storage_dir)) == [
+        "references.json",
+        "vectors.json",
+        "vectors.npy",
+    ]
     references_json_path = json_storage_dir.joinpath("references.json")
     assert references_json_path.exists()
 
@@ -90,6 +97,123 @@ def test_run_ingest(monkeypatch, tmp_path, fixtures_dir):
         assert json.load(f) == response.dict()["references"]
 
 
+def test_run_ingest_is_incremental(monkeypatch, tmp_path, fixtures_dir):
+    uploads_dir = tmp_path.joinpath("uploads")
+    for pdf in Path(f"{fixtures_dir}/pdf/").glob("*.pdf"):
+        _copy_fixture_to_temp_dir(pdf, uploads_dir.joinpath(pdf.name))
+
+    grobid_calls = []
+
+    async def mock_process_pdf(self, client, service, pdf_path):
+        grobid_calls.append(pdf_path.name)
+        if pdf_path.name == "test.pdf":
+            with open(f"{fixtures_dir}/xml/test.tei.xml", "r") as f:
+                return 200, f.read()
+        return 500, ""
+
+    monkeypatch.setattr(ingest.AsyncGrobidClient, "process_pdf", mock_process_pdf)
+
+    response = ingest.run_ingest(pdf_directory=uploads_dir)
+    refs = {ref.source_filename: ref for ref in response.references}
+    assert sorted(grobid_calls) == ["grobid-fails.pdf", "test.pdf"]
+    assert all(ref.content_hash for ref in refs.values())
+
+    def load_references():
+        jstore = storage.JsonStorage(tmp_path.joinpath(".storage", "references.json"))
+        jstore.load()
+        return {ref.source_filename: ref for ref in jstore.references}
+
+    # test: ingest again without changes
+    # expect: nothing is sent to Grobid
+    grobid_calls.clear()
+    response = ingest.run_ingest(pdf_directory=uploads_dir)
+    assert grobid_calls == []
+    assert response.message == "All uploaded PDFs have already been processed"
+    assert len(response.references) == 2
+
+    # test: upload a renamed copy of an ingested PDF
+    # expect: it gets its own Reference without being parsed again
+    _copy_fixture_to_temp_dir(
+        fixtures_dir.joinpath("pdf", "test.pdf"), uploads_dir.joinpath("copy.pdf")
+    )
+    response = ingest.run_ingest(pdf_directory=uploads_dir)
+    assert grobid_calls == []
+
+    stored = load_references()
+    assert len(stored) == 3
+    assert stored["copy.pdf"].id != refs["test.pdf"].id
+    assert stored["copy.pdf"].title == refs["test.pdf"].title
+    assert stored["copy.pdf"].citation_key == "domingosa"
+    assert stored["copy.pdf"].chunks[0].metadata["source_filename"] == "copy.pdf"
+
+    # test: modify an ingested PDF, whose citation key was edited
+    # expect: only that PDF is re-ingested, keeping its Reference id and key
+    jstore = storage.JsonStorage(tmp_path.joinpath(".storage", "references.json"))
+    jstore.load()
+    jstore.update(
+        refs["grobid-fails.pdf"].id,
+        ReferencePatch(data={"citation_key": "custom2023"}),
+    )
+
+    with open(uploads_dir.joinpath("grobid-fails.pdf"), "ab") as f:
+        f.write(b"\n% modified\n")
+
+    response = ingest.run_ingest(pdf_directory=uploads_dir)
+    assert grobid_calls == ["grobid-fails.pdf"]
+
+    stored = load_references()
+    assert len(stored) == 3
+    assert stored["grobid-fails.pdf"].id == refs["grobid-fails.pdf"].id
+    assert stored["grobid-fails.pdf"].citation_key == "custom2023"
+    assert stored["grobid-fails.pdf"].content_hash != (
+        refs["grobid-fails.pdf"].content_hash
+    )
+
+
+def test_run_ingest_updates_bm25_index_for_changed_pdf(
+    monkeypatch, tmp_path, fixtures_dir
+):
+    uploads_dir = tmp_path.joinpath("uploads")
+    upload = uploads_dir.joinpath("grobid-fails.pdf")
+    _copy_fixture_to_temp_dir(fixtures_dir.joinpath("pdf", "grobid-fails.pdf"), upload)
+
+    async def mock_process_pdf(self, client, service, pdf_path):
+        return 500, ""
+
+    monkeypatch.setattr(ingest.AsyncGrobidClient, "process_pdf", mock_process_pdf)
+
+    text = "apple pie recipe"
+
+    def mock_chunk_reference(ref, filepath=None):
+        return [Chunk(text=text, metadata={"source_filename": ref.source_filename})]
+
+    monkeypatch.setattr(ingest.shared, "chunk_reference", mock_chunk_reference)
+
+    ingest.run_ingest(pdf_directory=uploads_dir)
+    references_path = tmp_path.joinpath(".storage", "references.json")
+    jstore = storage.JsonStorage(references_path)
+    jstore.load()
+    reference_id = jstore.references[0].id
+    assert list(jstore.bm25_index.get_scores(["apple"])) == [f"{reference_id}:0"]
+
+    # test: re-ingest the PDF with different text, but the same number of chunks
+    # expect: the saved BM25 index only matches the new text
+    text = "banana bread"
+    with open(upload, "ab") as f:
+        f.write(b"\n% modified\n")
+    ingest.run_ingest(pdf_directory=uploads_dir)
+
+    jstore = storage.JsonStorage(references_path)
+    jstore.load()
+    assert jstore.references[0].id == reference_id
+
+    index = BM25Index(jstore.index_filepath)
+    index.load()
+    assert not index.is_stale(jstore.references)
+    assert index.get_scores(["apple"]) == {}
+    assert list(index.get_scores(["banana"])) == [f"{reference_id}:0"]
+
+
 def test_ingest_get_statuses(monkeypatch, tmp_path, fixtures_dir):
     monkeypatch.setattr(ingest, "UPLOADS_DIR", Path(f"{fixtures_dir}/pdf"))
 
@@ -166,3 +290,68 @@ def test_ingest_get_statuses(monkeypatch, tmp_path, fixtures_dir):
 
     assert response.status == "error"
     assert len(statuses) == 0
+
+
+def test_run_ingest_resumes_after_interruption(monkeypatch, tmp_path, fixtures_dir):
+    uploads_dir = tmp_path.joinpath("uploads")
+    for pdf in Path(f"{fixtures_dir}/pdf/").glob("*.pdf"):
+        _copy_fixture_to_temp_dir(pdf, uploads_dir.joinpath(pdf.name))
+
+    grobid_calls = []
+
+    async def mock_process_pdf(self, client, service, pdf_path):
+        grobid_calls.append(pdf_path.name)
+        if pdf_path.name == "test.pdf":
+            with open(f"{fixtures_dir}/xml/test.tei.xml", "r") as f:
+                return 200, f.read()
+        return 500, ""
+
+    monkeypatch.setattr(ingest.AsyncGrobidClient, "process_pdf", mock_process_pdf)
+
+    # test: ingestion crashes while saving references
+    # expect: the manifest records the completed stages
+    def mock_save_references(self):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(ingest.PDFIngestion, "_save_references", mock_save_references)
+        with pytest.raises(OSError):
+            ingest.run_ingest(pdf_directory=uploads_dir)
+
+    manifest = ingest.IngestManifest(tmp_path.joinpath(".grobid", "manifest.json"))
+    assert manifest.load()
+    assert manifest.stage == ingest.IngestStage.CHUNK
+    assert not tmp_path.joinpath(".storage", "references.json").exists()
+    assert sorted(grobid_calls) == ["grobid-fails.pdf", "test.pdf"]
+
+    # test: run ingestion again
+    # expect: it resumes from the persist stage without calling Grobid again
+    grobid_calls.clear()
+    response = ingest.run_ingest(pdf_directory=uploads_dir)
+
+    assert grobid_calls == []
+    assert sorted(ref.source_filename for ref in response.references) == [
+        "grobid-fails.pdf",
+        "test.pdf",
+    ]
+    assert all(len(ref.chunks) > 0 for ref in response.references)
+    assert not manifest.filepath.exists()
+    assert len(os.listdir(tmp_path.joinpath(".staging"))) == 0
+
+
+def test_run_ingest_cancelled(tmp_path, fixtures_dir):
+    uploads_dir = tmp_path.joinpath("uploads")
+    for pdf in Path(f"{fixtures_dir}/pdf/").glob("*.pdf"):
+        _copy_fixture_to_temp_dir(pdf, uploads_dir.joinpath(pdf.name))
+
+    # test: ingestion cancelled before it starts calling Grobid
+    # expect: staged files are removed and no references are saved
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    ingestion = ingest.PDFIngestion(input_dir=uploads_dir, cancel_event=cancel_event)
+    with pytest.raises(ingest.IngestCancelled):
+        ingestion.run()
+
+    assert len(os.listdir(tmp_path.joinpath(".staging"))) == 0
+    assert not tmp_path.joinpath(".storage", "references.json").exists()
@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import Future
+from unittest.mock import patch
+
+import pytest
+from sidecar.references.jobs import IngestJobQueue
+from sidecar.references.schemas import IngestJobStatus, IngestResponse
+
+
+def wait_for_callbacks(future: Future) -> None:
+    # callbacks run in order, after `result()` returns to other threads
+    done = threading.Event()
+    future.add_done_callback(lambda _: done.set())
+    assert done.wait(timeout=10)
+
+
+def test_ingest_job_fails_if_project_is_missing():
+    queue = IngestJobQueue()
+
+    # test: the project's uploads directory cannot be resolved
+    # expect: the job is marked as failed
+    with patch(
+        "sidecar.references.jobs.get_project_uploads_path",
+        side_effect=KeyError("project1"),
+    ):
+        job = queue.submit("user1", "project1")
+        with pytest.raises(KeyError):
+            queue.future(job.job_id).result(timeout=10)
+
+    assert queue.get("project1", job.job_id).status == IngestJobStatus.FAILED
+
+
+def test_ingest_jobs_are_forgotten_after_retention(tmp_path):
+    queue = IngestJobQueue(retention=2)
+
+    # test: more jobs finish than are retained
+    # expect: only the most recent finished jobs can still be looked up
+    job_ids = []
+    with patch(
+        "sidecar.references.jobs.get_project_uploads_path", return_value=tmp_path
+    ), patch(
+        "sidecar.references.ingest.PDFIngestion.run",
+        return_value=IngestResponse(project_name="project1", references=[]),
+    ):
+        for _ in range(3):
+            job = queue.submit("user1", "project1")
+            wait_for_callbacks(queue.future(job.job_id))
+            job_ids.append(job.job_id)
+
+    assert queue.get("project1", job_ids[0]) is None
+    for job_id in job_ids[1:]:
+        assert queue.get("project1", job_id).status == IngestJobStatus.COMPLETE
+    assert set(queue._futures) == set(queue._cancel_events) == set(job_ids[1:])
+
+
+def test_idle_project_executors_are_shut_down():
+    queue = IngestJobQueue()
+
+    # test: run tasks for a project, one of them queued behind another
+    # expect: they run in order, and the executor is only shut down once idle
+    release = threading.Event()
+    order = []
+    queue.run_exclusive("project1", lambda: release.wait(10))
+    second = queue.run_exclusive("project1", order.append, "second")
+    assert "project1" in queue._executors
+
+    release.set()
+    wait_for_callbacks(second)
+    assert order == ["second"]
+    assert "project1" not in queue._executors
+
+    # test: submit more work for the project
+    # expect: a new executor runs it
+    assert queue.run_exclusive("project1", lambda: "done").result(timeout=10) == "done"
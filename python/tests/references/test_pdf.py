@@ -0,0 +1,143 @@
+import os
+import time
+
+from sidecar import shared
+from sidecar.references import pdf
+from sidecar.references.pdf import PdfTextCache
+
+from ..helpers import _copy_fixture_to_temp_dir
+
+
+def test_pdf_text_cache_parses_each_file_once(monkeypatch, tmp_path, fixtures_dir):
+    calls = []
+    parse_pages = pdf.parse_pages
+
+    def mock_parse_pages(filepath):
+        calls.append(filepath)
+        return parse_pages(filepath)
+
+    monkeypatch.setattr(pdf, "parse_pages", mock_parse_pages)
+
+    # two copies of the same PDF share an artifact, since it is keyed by hash
+    first = tmp_path.joinpath("a", "test.pdf")
+    second = tmp_path.joinpath("b", "copy.pdf")
+    _copy_fixture_to_temp_dir(fixtures_dir.joinpath("pdf", "test.pdf"), first)
+    _copy_fixture_to_temp_dir(fixtures_dir.joinpath("pdf", "test.pdf"), second)
+
+    cache = PdfTextCache(cache_dir=tmp_path.joinpath("cache"))
+    pages = cache.get_pages(first)
+
+    assert len(pages) > 0
+    assert cache.get_pages(second) == pages
+    assert len(calls) == 1
+
+    # test: new process (empty in-memory cache)
+    # expect: pages are read from the on-disk artifact
+    cache = PdfTextCache(cache_dir=tmp_path.joinpath("cache"))
+    assert cache.get_pages(first) == pages
+    assert len(calls) == 1
+    assert cache.artifact_path(pdf.hash_file(first)).exists()
+
+
+def test_pdf_text_cache_evicts_least_recently_used(tmp_path):
+    cache = PdfTextCache(cache_dir=tmp_path.joinpath("cache"), max_bytes=10_000)
+    pages = ["x" * 3_000]
+
+    for i, content_hash in enumerate(["a", "b", "c"]):
+        cache.store(content_hash, pages)
+        # distinct modification times, oldest first
+        os.utime(cache.artifact_path(content_hash), (i, i))
+
+    # test: reading an artifact from disk, then exceeding `max_bytes`
+    # expect: the least recently used artifact is deleted
+    cache.clear()
+    assert cache.lookup("a") == pages
+    cache.store("d", pages)
+
+    assert not cache.artifact_path("b").exists()
+    for content_hash in ["a", "c", "d"]:
+        assert cache.artifact_path(content_hash).exists()
+
+    total = sum(f.stat().st_size for f in cache.cache_dir.glob("*.json"))
+    assert total <= cache.max_bytes
+
+
+def test_extract_text_and_chunks_share_pages(monkeypatch, tmp_path, fixtures_dir):
+    calls = []
+    parse_pages = pdf.parse_pages
+
+    def mock_parse_pages(filepath):
+        calls.append(filepath)
+        return parse_pages(filepath)
+
+    monkeypatch.setattr(pdf, "parse_pages", mock_parse_pages)
+    monkeypatch.setattr(
+        pdf, "pdf_text_cache", PdfTextCache(cache_dir=tmp_path.joinpath("cache"))
+    )
+
+    filepath = fixtures_dir.joinpath("pdf", "grobid-fails.pdf")
+    text = shared.extract_text_from_pdf(filepath)
+    ref = shared.ReferenceCreate(title="Fails", source_filename="grobid-fails.pdf")
+    chunks = shared.chunk_reference(ref, filepath=filepath)
+
+    assert len(calls) == 1
+    assert len(chunks) > 0
+    assert all(chunk.text in text for chunk in chunks)
+
+
+def _slow_parse_pages(filepath):
+    # module-level so that it can be pickled for worker processes
+    if "slow" in filepath.name:
+        time.sleep(60)
+    return pdf.parse_pages(filepath)
+
+
+def test_extract_pages_in_pool_kills_slow_pdfs(tmp_path, fixtures_dir):
+    fast = tmp_path.joinpath("pdfs", "test.pdf")
+    slow = tmp_path.joinpath("pdfs", "slow.pdf")
+    _copy_fixture_to_temp_dir(fixtures_dir.joinpath("pdf", "test.pdf"), fast)
+    _copy_fixture_to_temp_dir(fixtures_dir.joinpath("pdf", "grobid-fails.pdf"), slow)
+
+    cache = PdfTextCache(cache_dir=tmp_path.joinpath("cache"))
+
+    start = time.monotonic()
+    results = pdf.extract_pages_in_pool(
+        [fast, slow], max_workers=2, timeout=5, cache=cache, parse=_slow_parse_pages
+    )
+
+    assert time.monotonic() - start < 30
+    assert results == {fast: True, slow: False}
+    assert len(cache.get_pages(fast)) > 0
+
+    # unparseable PDFs are cached without text, but not persisted
+    assert cache.get_pages(slow) == []
+    assert not cache.artifact_path(pdf.hash_file(slow)).exists()
+
+
+def _crashing_parse_pages(filepath):
+    # module-level so that it can be pickled for worker processes
+    if "crash" in filepath.name:
+        os._exit(1)
+    time.sleep(0.5)
+    return [filepath.read_text()]
+
+
+def test_extract_pages_in_pool_only_charges_crashes_to_the_crashing_pdf(tmp_path):
+    filepaths = []
+    for name in ["a.pdf", "crash.pdf", "b.pdf", "c.pdf"]:
+        filepath = tmp_path.joinpath("pdfs", name)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath.write_text(f"text of {name}")
+        filepaths.append(filepath)
+
+    cache = PdfTextCache(cache_dir=tmp_path.joinpath("cache"))
+
+    # test: a PDF crashes its worker while others are being parsed
+    # expect: the PDFs in flight with it are retried, and only the PDF that
+    # crashed on its own is unparseable
+    results = pdf.extract_pages_in_pool(
+        filepaths, max_workers=4, timeout=30, cache=cache, parse=_crashing_parse_pages
+    )
+
+    assert results == {filepath: filepath.name != "crash.pdf" for filepath in filepaths}
+    assert cache.get_pages(filepaths[0]) == ["text of a.pdf"]
@@ -1,11 +1,26 @@
+import asyncio
+import json
+import threading
 from pathlib import Path
 from unittest.mock import patch
 
+import httpx
+import pytest
 from fastapi.testclient import TestClient
 from sidecar.api import api
 from sidecar.projects import service as projects_service
 from sidecar.projects.service import create_project
-from sidecar.references.schemas import IngestStatus, Reference, ReferenceCreate
+from sidecar.references import router
+from sidecar.references import service as references_service
+from sidecar.references.fetch import AsyncPdfFetcher
+from sidecar.references.jobs import ingest_jobs
+from sidecar.references.schemas import (
+    IngestBatchRequest,
+    IngestResponse,
+    IngestStatus,
+    Reference,
+    ReferenceCreate,
+)
 from sidecar.references.storage import JsonStorage
 
 from ..helpers import _copy_fixture_to_temp_dir
@@ -15,25 +30,72 @@ client = TestClient(api)
 
 def test_ingest_references_for_uploads_directory(setup_project_with_uploads):
     project_id = "project1"
-    uploads_dir = projects_service.get_project_uploads_path("user1", project_id)
 
     request = {"type": "uploads"}
     with patch(
-        "sidecar.references.ingest.run_ingest",
-        return_value={"project_name": project_id, "references": []},
-    ) as mock_run_ingest:
+        "sidecar.references.ingest.PDFIngestion.run",
+        return_value=IngestResponse(project_name=project_id, references=[]),
+    ) as mock_run:
         response = client.post(f"/api/references/{project_id}", json=request)
 
-    mock_run_ingest.assert_called_once_with(pdf_directory=uploads_dir)
+    mock_run.assert_called_once()
     assert response.status_code == 200
     assert len(response.json()["references"]) == 0
 
 
+def test_ingest_job_lifecycle(setup_project_with_uploads):
+    project_id = "project1"
+
+    # test: submit a job
+    # expect: it runs in the background and reports per-file statuses
+    def mock_run(self):
+        self.ingested_filenames = ["test.pdf"]
+        self.references = [
+            Reference(id="1", source_filename="test.pdf", status=IngestStatus.COMPLETE)
+        ]
+        return self.create_ingest_response()
+
+    with patch("sidecar.references.ingest.PDFIngestion.run", mock_run):
+        response = client.post(f"/api/references/{project_id}/jobs")
+        assert response.status_code == 200
+        job_id = response.json()["job_id"]
+        ingest_jobs.future(job_id).result(timeout=10)
+
+    response = client.get(f"/api/references/{project_id}/jobs/{job_id}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "complete"
+    assert response.json()["files"] == [
+        {"source_filename": "test.pdf", "status": "complete"}
+    ]
+
+    # test: get a job for another project
+    # expect: nothing is returned
+    response = client.get(f"/api/references/other-project/jobs/{job_id}")
+    assert response.json() is None
+
+    # test: cancel a job that is queued behind another
+    # expect: it is cancelled without running
+    release = threading.Event()
+    blocker = ingest_jobs.run_exclusive(project_id, release.wait, 10)
+
+    with patch("sidecar.references.ingest.PDFIngestion.run") as mock_run:
+        response = client.post(f"/api/references/{project_id}/jobs")
+        job_id = response.json()["job_id"]
+        assert response.json()["status"] == "queued"
+
+        response = client.delete(f"/api/references/{project_id}/jobs/{job_id}")
+        assert response.json()["status"] == "cancelled"
+
+        release.set()
+        blocker.result(timeout=10)
+
+    mock_run.assert_not_called()
+
+
 def test_ingest_references_for_metadata_with_pdf(setup_project_with_uploads):
     project_id = "project1"
-    return_value = (
-        Reference(id="123", source_filename="fake.pdf", status=IngestStatus.COMPLETE),
-        "",
+    return_value = Reference(
+        id="123", source_filename="fake.pdf", status=IngestStatus.COMPLETE
     )
 
     request = {
@@ -44,22 +106,139 @@ def test_ingest_references_for_metadata_with_pdf(setup_project_with_uploads):
             "title": "fake title",
         },
     }
+    metadata = ReferenceCreate(**request["metadata"])
+    pdf_filepath = Path("/tmp/.fake.pdf.part")
 
-    # since we import `create_reference` from `service.py` into `router.py`
-    # we need to patch at the `router` level
+    # since we import `create_reference` and `fetch_pdf` from `service.py`
+    # into `router.py` we need to patch at the `router` level
     with patch(
+        "sidecar.references.router.fetch_pdf",
+        return_value=(metadata, pdf_filepath, ""),
+    ) as mock_fetch_pdf, patch(
         "sidecar.references.router.create_reference",
         return_value=return_value,
     ) as mock_create_reference:
         response = client.post(f"/api/references/{project_id}", json=request)
 
+    mock_fetch_pdf.assert_called_once_with(
+        request["url"], project_id, "user1", metadata
+    )
     mock_create_reference.assert_called_once_with(
-        project_id, metadata=ReferenceCreate(**request["metadata"]), url=request["url"]
+        project_id, metadata=metadata, pdf_filepath=pdf_filepath
     )
     assert response.status_code == 200
     assert len(response.json()["references"]) == 1
 
 
+def test_ingest_references_batch(
+    monkeypatch, mock_url_pdf_response, setup_project_references_json
+):
+    project_id = "project1"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/missing.pdf":
+            return httpx.Response(404)
+        return mock_url_pdf_response(request)
+
+    fetcher = AsyncPdfFetcher(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(references_service, "pdf_fetcher", fetcher)
+
+    request = {
+        "items": [
+            {
+                "url": "http://somefakeurl.com/first.pdf",
+                "metadata": {"title": "First", "authors": [{"full_name": "Ann Lee"}]},
+            },
+            {
+                "url": "http://otherfakeurl.com/second.pdf",
+                "metadata": {"title": "Second", "authors": [{"full_name": "Bo Lee"}]},
+            },
+            {
+                "url": "http://somefakeurl.com/missing.pdf",
+                "metadata": {"title": "Missing"},
+            },
+            {"metadata": {"title": "No PDF"}},
+        ]
+    }
+    response = client.post(f"/api/references/{project_id}/batch", json=request)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = [json.loads(line) for line in response.text.splitlines()]
+
+    # expect: one progress line per URL, then one result per item, in order
+    fetched = {r["index"]: r["status"] for r in results[:3]}
+    assert fetched == {0: "fetched", 1: "fetched", 2: "failure"}
+    completed = results[3:]
+    assert [r["index"] for r in completed] == [0, 1, 2, 3]
+    assert all(r["status"] == "complete" for r in completed)
+    assert completed[2]["message"].endswith("status code 404")
+
+    references = [r["reference"] for r in completed]
+    assert [r["citation_key"] for r in references[:2]] == ["lee", "leea"]
+    assert len(references[0]["chunks"]) > 0
+    assert references[3]["chunks"] == []
+
+    # expect: the references were persisted as a single change
+    store = JsonStorage(setup_project_references_json)
+    assert len(store.log.read()[0]) == 1
+    store.load()
+    assert [ref.title for ref in store.references[-4:]] == [
+        "First",
+        "Second",
+        "Missing",
+        "No PDF",
+    ]
+
+    uploads = projects_service.get_project_uploads_path("user1", project_id)
+    assert sorted(p.name for p in uploads.iterdir()) == ["First.pdf", "Second.pdf"]
+
+
+@pytest.mark.asyncio
+async def test_ingest_references_batch_client_disconnects(
+    monkeypatch, mock_url_pdf_response, setup_project_references_json
+):
+    project_id = "project1"
+    fetcher = AsyncPdfFetcher(transport=httpx.MockTransport(mock_url_pdf_response))
+    monkeypatch.setattr(references_service, "pdf_fetcher", fetcher)
+
+    started = threading.Event()
+    release = threading.Event()
+    downloads = []
+
+    def mock_create_references(project_id, items):
+        downloads.extend(f for _, f in items if f)
+        started.set()
+        release.wait(10)
+        # the downloads are still in use, e.g. being moved to the uploads
+        return [f.exists() for f in downloads]
+
+    monkeypatch.setattr(router, "create_references", mock_create_references)
+
+    request = IngestBatchRequest(
+        items=[
+            {"url": "http://somefakeurl.com/first.pdf", "metadata": {"title": "First"}}
+        ]
+    )
+    response = await router.ingest_references_batch(project_id, request)
+    results = response.body_iterator
+
+    # test: the client goes away while the references are being created
+    # expect: the downloads are only removed once the worker is done with them
+    await results.__anext__()
+    pending = asyncio.ensure_future(results.__anext__())
+    await asyncio.to_thread(started.wait, 10)
+    pending.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await pending
+    await results.aclose()
+    assert all(f.exists() for f in downloads)
+
+    release.set()
+    await asyncio.to_thread(ingest_jobs.run_exclusive(project_id, bool).result, 10)
+    assert downloads and not any(f.exists() for f in downloads)
+
+
 def test_list_references_should_return_empty_list(monkeypatch, tmp_path):
     user_id = "user1"
     project_id = "project1"
@@ -97,6 +276,119 @@ def test_list_references_should_return_references(monkeypatch, tmp_path, fixture
     assert len(response.json()) != 0
 
 
+def test_list_references_pagination_and_fields(monkeypatch, tmp_path, fixtures_dir):
+    user_id = "user1"
+    project_id = "project1"
+
+    monkeypatch.setattr(projects_service, "WEB_STORAGE_URL", tmp_path)
+    project = create_project(user_id, project_id, project_name="foo")
+    mocked_path = Path(project.path) / ".storage" / "references.json"
+    _copy_fixture_to_temp_dir(f"{fixtures_dir}/data/references.json", mocked_path)
+
+    jstore = JsonStorage(filepath=mocked_path)
+    jstore.load()
+    expected_ids = [ref.id for ref in jstore.references]
+
+    # test: list without a projection
+    # expect: contents and chunks are left out
+    response = client.get(f"/api/references/{project_id}")
+    assert "X-Next-Cursor" not in response.headers
+    for item in response.json():
+        assert "chunks" not in item
+        assert "contents" not in item
+        assert "title" in item
+
+    # test: page through the references one at a time
+    # expect: every reference is returned once, in order
+    ids = []
+    cursor = None
+    while True:
+        params = {"limit": 1, "fields": "title"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/api/references/{project_id}", params=params)
+        assert response.status_code == 200
+
+        page = response.json()
+        assert len(page) == 1
+        assert set(page[0]) == {"id", "title"}
+        ids.extend(item["id"] for item in page)
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert ids == expected_ids
+
+    # test: request every field
+    # expect: references are returned in full
+    response = client.get(f"/api/references/{project_id}", params={"fields": "*"})
+    assert response.json() == [json.loads(ref.json()) for ref in jstore.references]
+
+    # test: stream the references as NDJSON
+    # expect: one reference per line
+    response = client.get(
+        f"/api/references/{project_id}",
+        params={"fields": "id,chunks"},
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == expected_ids
+    assert len(lines[0]["chunks"]) == len(jstore.references[0].chunks)
+
+    # test: malformed cursor
+    # expect: bad request
+    response = client.get(f"/api/references/{project_id}", params={"cursor": "nope"})
+    assert response.status_code == 400
+
+
+def test_list_references_not_modified(monkeypatch, tmp_path, fixtures_dir):
+    user_id = "user1"
+    project_id = "project1"
+
+    monkeypatch.setattr(projects_service, "WEB_STORAGE_URL", tmp_path)
+    project = create_project(user_id, project_id, project_name="foo")
+    mocked_path = Path(project.path) / ".storage" / "references.json"
+    _copy_fixture_to_temp_dir(f"{fixtures_dir}/data/references.json", mocked_path)
+
+    response = client.get(f"/api/references/{project_id}")
+    etag = response.headers["ETag"]
+    reference_id = response.json()[0]["id"]
+
+    # test: poll with the current tag
+    # expect: 304 without loading the references
+    with patch("sidecar.references.storage.get_references_json_storage") as mocked:
+        response = client.get(
+            f"/api/references/{project_id}", headers={"If-None-Match": etag}
+        )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert not response.content
+    mocked.assert_not_called()
+
+    # test: poll a different representation with the same tag
+    # expect: full response, with its own tag
+    response = client.get(
+        f"/api/references/{project_id}",
+        params={"fields": "*"},
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    # test: poll after a reference is updated
+    # expect: full response, with a new tag
+    patch_ = {"data": {"citation_key": "reda2023"}}
+    client.patch(f"/api/references/{project_id}/{reference_id}", json=patch_)
+
+    response = client.get(
+        f"/api/references/{project_id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()[0]["citation_key"] == "reda2023"
+
+
 def test_get_reference(monkeypatch, tmp_path, fixtures_dir):
     user_id = "user1"
     project_id = "project1"
@@ -158,6 +450,61 @@ def test_references_update(monkeypatch, tmp_path, fixtures_dir):
     assert jstore.references[0].citation_key == "reda2023"
 
 
+def test_references_update_waits_for_ingestion(monkeypatch, tmp_path, fixtures_dir):
+    project_id = "project1"
+
+    monkeypatch.setattr(projects_service, "WEB_STORAGE_URL", tmp_path)
+    project = create_project("user1", project_id, project_name="foo")
+    mocked_path = Path(project.path) / ".storage" / "references.json"
+    _copy_fixture_to_temp_dir(f"{fixtures_dir}/data/references.json", mocked_path)
+
+    # ingestion saves a full snapshot of the references it loaded when it started
+    started = threading.Event()
+    release = threading.Event()
+
+    def mock_run(self):
+        started.set()
+        release.wait(10)
+        self.references.append(
+            Reference(id="new", source_filename="new.pdf", status=IngestStatus.COMPLETE)
+        )
+        self._save_references()
+        return self.create_ingest_response()
+
+    jstore = JsonStorage(filepath=mocked_path)
+    jstore.load()
+    ref = jstore.references[0]
+
+    # test: update a reference while an ingestion is running
+    # expect: the update is applied after the ingestion has saved
+    with patch("sidecar.references.ingest.PDFIngestion.run", mock_run):
+        job_id = client.post(f"/api/references/{project_id}/jobs").json()["job_id"]
+        assert started.wait(10)
+
+        patch_ = {"data": {"citation_key": "reda2023"}}
+        responses = []
+        update = threading.Thread(
+            target=lambda: responses.append(
+                client.patch(f"/api/references/{project_id}/{ref.id}", json=patch_)
+            )
+        )
+        update.start()
+        update.join(0.5)
+        assert not responses
+
+        release.set()
+        ingest_jobs.future(job_id).result(timeout=10)
+        update.join(10)
+
+    assert responses[0].json()["status"] == "ok"
+
+    jstore = JsonStorage(filepath=mocked_path)
+    jstore.load()
+    references = {r.id: r for r in jstore.references}
+    assert references[ref.id].citation_key == "reda2023"
+    assert "new" in references
+
+
 def test_references_bulk_delete(monkeypatch, tmp_path, fixtures_dir):
     user_id = "user1"
     project_id = "project1"
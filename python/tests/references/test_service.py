@@ -1,20 +1,41 @@
+import asyncio
+from collections import defaultdict
 from datetime import date
 from uuid import uuid4
 
-from sidecar.projects.service import get_project_uploads_path
+import httpx
+import pytest
+from sidecar.projects.service import get_project_staging_path, get_project_uploads_path
+from sidecar.references import service
+from sidecar.references.fetch import AsyncPdfFetcher
 from sidecar.references.schemas import Author, IngestStatus, Reference, ReferenceCreate
 from sidecar.references.service import (
     add_citation_keys_for_references,
     create_reference,
-    requests,
+    fetch_pdf,
+    fetch_pdfs,
+    paginate_references,
 )
 from sidecar.references.storage import JsonStorage
 
 
-def test_create_reference_with_url(
+def _mock_pdf_fetcher(monkeypatch, handler, **kwargs) -> list[httpx.Request]:
+    requests = []
+
+    def record(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return handler(request)
+
+    fetcher = AsyncPdfFetcher(transport=httpx.MockTransport(record), **kwargs)
+    monkeypatch.setattr(service, "pdf_fetcher", fetcher)
+    return requests
+
+
+@pytest.mark.asyncio
+async def test_create_reference_with_url(
     monkeypatch, tmp_path, mock_url_pdf_response, setup_project_references_json
 ):
-    monkeypatch.setattr(requests, "get", mock_url_pdf_response)
+    requests = _mock_pdf_fetcher(monkeypatch, mock_url_pdf_response)
 
     project_id = "project1"
     url = "http://somefakeurl.com"
@@ -25,12 +46,23 @@ def test_create_reference_with_url(
         published_date="2021-01-01",
     )
 
-    ref, _ = create_reference(project_id=project_id, metadata=metadata, url=url)
+    metadata, pdf_filepath, message = await fetch_pdf(
+        url, project_id, "user1", metadata
+    )
+    ref = create_reference(
+        project_id=project_id, metadata=metadata, pdf_filepath=pdf_filepath
+    )
 
+    assert message == ""
     assert isinstance(ref, Reference)
+    assert len(ref.chunks) > 0
+
+    # expect: a probe and a single download
+    assert [r.method for r in requests] == ["HEAD", "GET"]
 
     uploads = get_project_uploads_path("user1", project_id)
     assert (uploads / metadata.source_filename).exists()
+    assert not pdf_filepath.exists()
 
     store = JsonStorage(setup_project_references_json)
     store.load()
@@ -38,10 +70,40 @@ def test_create_reference_with_url(
     assert store.references[-1].published_date == metadata.published_date
 
 
-def test_create_reference_with_url_error(
+def test_create_reference_keeps_existing_upload(
+    fixtures_dir, setup_project_references_json
+):
+    project_id = "project1"
+    uploads = get_project_uploads_path("user1", project_id)
+    uploads.mkdir(parents=True, exist_ok=True)
+    (uploads / "paper.pdf").write_bytes(b"existing")
+    (uploads / "paper-1.pdf").write_bytes(b"existing")
+
+    staging = get_project_staging_path("user1", project_id)
+    staging.mkdir(parents=True, exist_ok=True)
+    pdf_filepath = staging / ".download.part"
+    pdf_filepath.write_bytes((fixtures_dir / "pdf" / "test.pdf").read_bytes())
+
+    # test: a downloaded PDF has the name of existing uploads
+    # expect: it is stored under a new name, and the uploads are kept
+    metadata = ReferenceCreate(source_filename="paper.pdf", title="Some new title")
+    ref = create_reference(
+        project_id=project_id, metadata=metadata, pdf_filepath=pdf_filepath
+    )
+
+    assert ref.source_filename == "paper-2.pdf"
+    assert ref.filepath == "uploads/paper-2.pdf"
+    assert (uploads / "paper.pdf").read_bytes() == b"existing"
+    assert (uploads / "paper-1.pdf").read_bytes() == b"existing"
+    assert (uploads / "paper-2.pdf").read_bytes().startswith(b"%PDF")
+    assert len(ref.chunks) > 0
+
+
+@pytest.mark.asyncio
+async def test_create_reference_with_url_error(
     monkeypatch, tmp_path, mock_url_pdf_response_error, setup_project_references_json
 ):
-    monkeypatch.setattr(requests, "get", mock_url_pdf_response_error)
+    _mock_pdf_fetcher(monkeypatch, mock_url_pdf_response_error)
 
     project_id = "project1"
     url = "http://somefakeurl.com"
@@ -51,8 +113,15 @@ def test_create_reference_with_url_error(
         published_date="2021-01-01",
     )
 
-    ref, _ = create_reference(project_id=project_id, metadata=metadata, url=url)
+    metadata, pdf_filepath, message = await fetch_pdf(
+        url, project_id, "user1", metadata
+    )
+    ref = create_reference(
+        project_id=project_id, metadata=metadata, pdf_filepath=pdf_filepath
+    )
 
+    assert pdf_filepath is None
+    assert message == f"Unable to fetch {url}, status code 403"
     assert isinstance(ref, Reference)
 
     store = JsonStorage(setup_project_references_json)
@@ -61,6 +130,80 @@ def test_create_reference_with_url_error(
     assert store.references[-1].published_date == metadata.published_date
 
 
+@pytest.mark.asyncio
+async def test_fetch_pdf_probes_with_ranged_get_and_caps_size(
+    monkeypatch, tmp_path, setup_project_references_json
+):
+    project_id = "project1"
+    url = "http://somefakeurl.com/large.pdf"
+    content = b"%PDF-1.4" + b"0" * 2048
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        # test: a server that does not answer HEAD, nor sends a content-length
+        if request.method == "HEAD":
+            return httpx.Response(405)
+        if "range" in request.headers:
+            return httpx.Response(
+                206,
+                content=content[:1],
+                headers={"content-type": "application/pdf"},
+            )
+        return httpx.Response(
+            200, content=content, headers={"content-type": "application/pdf"}
+        )
+
+    requests = _mock_pdf_fetcher(monkeypatch, handler, max_bytes=1024)
+    metadata = ReferenceCreate(title="Large paper")
+
+    metadata, pdf_filepath, message = await fetch_pdf(
+        url, project_id, "user1", metadata
+    )
+
+    # expect: the download is abandoned once it exceeds the size limit
+    assert [r.method for r in requests] == ["HEAD", "GET", "GET"]
+    assert pdf_filepath is None
+    assert message == f"Unable to fetch {url}, PDF is larger than the size limit"
+    assert list(get_project_staging_path("user1", project_id).glob("*")) == []
+
+
+@pytest.mark.asyncio
+async def test_fetch_pdfs_limits_downloads_per_host(
+    monkeypatch, tmp_path, fixtures_dir, setup_project_references_json
+):
+    monkeypatch.setattr(service, "PDF_FETCH_MAX_CONNECTIONS_PER_HOST", 2)
+    content = fixtures_dir.joinpath("pdf", "test.pdf").read_bytes()
+
+    in_flight = defaultdict(int)
+    max_in_flight = defaultdict(int)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        in_flight[host] += 1
+        max_in_flight[host] = max(max_in_flight[host], in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+        return httpx.Response(
+            200, content=content, headers={"content-type": "application/pdf"}
+        )
+
+    _mock_pdf_fetcher(monkeypatch, handler)
+    items = [
+        (ReferenceCreate(title=f"Paper {i}"), f"http://host{i % 2}.com/{i}.pdf")
+        for i in range(6)
+    ] + [(ReferenceCreate(title="No PDF"), None)]
+
+    results = [r async for r in fetch_pdfs(items, "project1", "user1")]
+
+    results = {index: result for index, *result in results}
+    assert sorted(results) == list(range(7))
+    assert all(results[i][1].exists() for i in range(6))
+    assert dict(max_in_flight) == {"host0.com": 2, "host1.com": 2}
+
+    # expect: items without a URL have nothing to download
+    metadata, pdf_filepath, message = results[6]
+    assert (metadata.title, pdf_filepath, message) == ("No PDF", None, "")
+
+
 def test_create_reference_with_only_metadata(
     monkeypatch, tmp_path, setup_project_references_json
 ):
@@ -72,7 +215,7 @@ def test_create_reference_with_only_metadata(
         authors=[Author(full_name="Frank Fakerson")],
     )
 
-    ref, _ = create_reference(project_id=project_id, metadata=metadata)
+    ref = create_reference(project_id=project_id, metadata=metadata)
 
     assert isinstance(ref, Reference)
     assert ref.citation_key == "fakerson"
@@ -167,7 +310,7 @@ def test_ingest_add_citation_keys():
         if i == 0:
             expected = f"untitled{ref.published_date.year}"
         else:
-            expected = f"untitled{ref.published_date.year}{chr(97 + i)}"
+            expected = f"untitled{ref.published_date.year}{chr(96 + i)}"
         assert ref.citation_key == expected
 
     # test: references with same author last name and no published year
@@ -184,7 +327,7 @@ def test_ingest_add_citation_keys():
         if i == 0:
             assert ref.citation_key == "smith"
         else:
-            assert ref.citation_key == f"smith{chr(97 + i)}"
+            assert ref.citation_key == f"smith{chr(96 + i)}"
 
     # test: references with same author and same published years
     # expect: should have citation key of author's last name + year + letter
@@ -197,12 +340,12 @@ def test_ingest_add_citation_keys():
 
     tested = add_citation_keys_for_references(refs, existing_references=[])
 
-    ## should be smith2021a, smith2021b, smith2021c
+    ## should be smith2021, smith2021a, smith2021b
     for i, ref in enumerate(tested):
         if i == 0:
             assert ref.citation_key == "smith2021"
         else:
-            assert ref.citation_key == f"smith2021{chr(97 + i)}"
+            assert ref.citation_key == f"smith2021{chr(96 + i)}"
 
     # test: ingesting new references should not modify existing citation keys
     # expect: previously created citation keys should be unchanged ...
@@ -271,3 +414,23 @@ def test_ingest_add_citation_keys():
     new_keys = sorted([ref.citation_key for ref in tested])
 
     assert new_keys == sorted(["jones2021b", "smitha", "untitled2"])
+
+
+def test_paginate_references_survives_deletes():
+    refs = [Reference(id=str(i), status=IngestStatus.COMPLETE) for i in range(5)]
+
+    page, cursor = paginate_references(refs, limit=2)
+    assert [ref.id for ref in page] == ["0", "1"]
+
+    # test: a reference before the cursor is deleted
+    # expect: the next page starts right after the cursor's reference
+    del refs[0]
+    page, cursor = paginate_references(refs, limit=2, cursor=cursor)
+    assert [ref.id for ref in page] == ["2", "3"]
+
+    # test: the cursor's reference is deleted
+    # expect: the next page starts at the reference that followed it
+    refs = [ref for ref in refs if ref.id != "3"]
+    page, cursor = paginate_references(refs, limit=2, cursor=cursor)
+    assert [ref.id for ref in page] == ["4"]
+    assert cursor is None
@@ -0,0 +1,230 @@
+import sqlite3
+from datetime import date
+
+import pytest
+from sidecar.references import storage
+from sidecar.references.citation_keys import CitationKeyIndex
+from sidecar.references.schemas import (
+    Author,
+    Chunk,
+    IngestStatus,
+    Reference,
+    ReferencePatch,
+)
+from sidecar.references.service import add_citation_keys_for_references
+from sidecar.references.sqlite_storage import SqliteStorage, migrate_json_to_sqlite
+
+from ..helpers import _copy_fixture_to_temp_dir
+
+
+def _migrate_fixture(fixtures_dir, tmp_path) -> SqliteStorage:
+    json_path = tmp_path.joinpath(".storage", "references.json")
+    _copy_fixture_to_temp_dir(f"{fixtures_dir}/data/references.json", json_path)
+    return migrate_json_to_sqlite(json_path)
+
+
+def test_migrate_json_to_sqlite(tmp_path, fixtures_dir):
+    sstore = _migrate_fixture(fixtures_dir, tmp_path)
+
+    jstore = storage.JsonStorage(tmp_path.joinpath(".storage", "references.json"))
+    jstore.load()
+
+    assert sstore.filepath == tmp_path.joinpath(".storage", "references.db")
+    assert [ref.dict() for ref in sstore.references] == [
+        ref.dict() for ref in jstore.references
+    ]
+    assert sstore.corpus == jstore.corpus
+    assert sstore.tokenized_corpus == jstore.tokenized_corpus
+
+    # test: migrating again
+    # expect: references are not duplicated
+    sstore = migrate_json_to_sqlite(jstore.filepath)
+    assert len(sstore.references) == len(jstore.references)
+
+
+def test_sqlite_storage_add_and_get_reference(tmp_path):
+    sstore = SqliteStorage(tmp_path.joinpath("references.db"))
+    sstore.load()
+    assert sstore.references == []
+
+    ref = Reference(
+        id="12345",
+        status=IngestStatus.COMPLETE,
+        title="A title",
+        published_date=date(2021, 1, 1),
+        authors=[Author(full_name="John Doe", surname="Doe")],
+        chunks=[Chunk(text="some text", metadata={"page_num": 1})],
+        metadata={"key": "value"},
+    )
+    sstore.add_reference(ref)
+
+    assert sstore.get_reference("12345") == ref
+    assert sstore.chunks == ref.chunks
+
+    # reload from disk
+    sstore = SqliteStorage(tmp_path.joinpath("references.db"))
+    sstore.load()
+    assert sstore.references == [ref]
+
+
+def test_sqlite_storage_add_references(tmp_path, fixtures_dir):
+    sstore = _migrate_fixture(fixtures_dir, tmp_path)
+    _ = sstore.bm25_index
+
+    # test: add a batch of references
+    # expect: they are stored and indexed, and persisted together
+    refs = [
+        Reference(
+            id=f"batch-ref-{i}",
+            status=IngestStatus.COMPLETE,
+            chunks=[Chunk(text=f"Zebras of batch {i}")],
+        )
+        for i in range(3)
+    ]
+    sstore.add_references(refs)
+
+    assert sstore.references[-3:] == refs
+    assert sstore.count_chunks([ref.id for ref in refs]) == 3
+    assert set(sstore.bm25_index.get_scores(["zebras"])) == {
+        f"{ref.id}:0" for ref in refs
+    }
+
+    reloaded = SqliteStorage(sstore.filepath)
+    reloaded.load()
+    assert reloaded.references[-3:] == refs
+
+    # test: a batch with a reference that is already stored
+    # expect: the transaction is rolled back, and no reference is added
+    duplicate = [
+        Reference(id="batch-ref-3", status=IngestStatus.COMPLETE),
+        Reference(id="batch-ref-0", status=IngestStatus.COMPLETE),
+    ]
+    with pytest.raises(sqlite3.IntegrityError):
+        sstore.add_references(duplicate)
+
+    reloaded = SqliteStorage(sstore.filepath)
+    reloaded.load()
+    assert reloaded.get_reference("batch-ref-3") is None
+    assert sstore.get_reference("batch-ref-3") is None
+
+
+def test_sqlite_storage_maintains_citation_keys(tmp_path, fixtures_dir):
+    sstore = _migrate_fixture(fixtures_dir, tmp_path)
+    _ = sstore.citation_key_index
+
+    def saved_keys() -> dict[str, str]:
+        index = CitationKeyIndex(sstore.citation_keys_filepath)
+        index.load()
+        return index.keys
+
+    smiths = [
+        Reference(
+            id=f"smith-{i}",
+            status=IngestStatus.COMPLETE,
+            authors=[Author(full_name="John Smith")],
+        )
+        for i in range(2)
+    ]
+
+    # test: add references with new citation keys
+    # expect: the keys are recorded in the index
+    add_citation_keys_for_references(smiths, index=sstore.citation_key_index)
+    sstore.add_references(smiths)
+    assert [ref.citation_key for ref in smiths] == ["smith", "smitha"]
+    assert saved_keys()["smitha"] == "smith-1"
+
+    # test: set a citation key by hand
+    # expect: the previous key is freed, and the new key recorded
+    sstore.update("smith-1", ReferencePatch(data={"citation_key": "jsmith"}))
+    assert "smitha" not in saved_keys()
+    assert saved_keys()["jsmith"] == "smith-1"
+
+    # test: delete a reference
+    # expect: its key is freed
+    sstore.delete(reference_ids=["smith-0"])
+    assert "smith" not in saved_keys()
+    assert not sstore.citation_key_index.is_stale(sstore.references)
+
+
+def test_sqlite_storage_update(tmp_path, fixtures_dir):
+    sstore = _migrate_fixture(fixtures_dir, tmp_path)
+    ref = sstore.references[0]
+
+    # test: update for id that does not exist
+    # expect: error response
+    response = sstore.update("id-does-not-exist", ReferencePatch(data={"title": "x"}))
+    assert response.status == "error"
+    assert response.message != ""
+
+    # test: update metadata and authors
+    # expect: only the patched fields change, including after reload
+    patch = ReferencePatch(
+        data={
+            "citation_key": "reda2023",
+            "published_date": "2023-01-01",
+            "authors": [{"full_name": "Jane Reda"}],
+        }
+    )
+    response = sstore.update(ref.id, patch)
+    assert response.status == "ok"
+
+    sstore = SqliteStorage(sstore.filepath)
+    sstore.load()
+    updated = sstore.get_reference(ref.id)
+
+    assert updated.citation_key == "reda2023"
+    assert updated.published_date == date(2023, 1, 1)
+    assert [a.full_name for a in updated.authors] == ["Jane Reda"]
+    assert updated.title == ref.title
+    assert updated.chunks == ref.chunks
+
+    # test: update chunks
+    # expect: corpus and full-text index reflect the new chunks
+    response = sstore.update(
+        ref.id, ReferencePatch(data={"chunks": [{"text": "Zebras are striped"}]})
+    )
+    assert response.status == "ok"
+    assert "Zebras are striped" in sstore.corpus
+    assert [c.text for c in sstore.search("zebras")] == ["Zebras are striped"]
+
+
+def test_sqlite_storage_delete(tmp_path, fixtures_dir):
+    sstore = _migrate_fixture(fixtures_dir, tmp_path)
+    to_be_deleted = sstore.references[0]
+
+    # test: delete id that is not in storage
+    # expect: error response and nothing is deleted
+    response = sstore.delete(reference_ids=[to_be_deleted.id, "does-not-exist"])
+    assert response.status == "error"
+    assert len(sstore.references) == 2
+
+    # test: delete one reference
+    # expect: its rows are removed, including authors and chunks
+    response = sstore.delete(reference_ids=[to_be_deleted.id])
+    assert response.status == "ok"
+
+    sstore = SqliteStorage(sstore.filepath)
+    sstore.load()
+    assert to_be_deleted.id not in [ref.id for ref in sstore.references]
+    assert len(sstore.references) == 1
+    assert len(sstore.chunks) == len(sstore.references[0].chunks)
+    (count,) = sstore.conn.execute("SELECT COUNT(*) FROM authors").fetchone()
+    assert count == len(sstore.references[0].authors)
+
+    # test: delete all
+    # expect: storage is empty
+    response = sstore.delete(all_=True)
+    assert response.status == "ok"
+    assert sstore.references == []
+    assert sstore.search("chicago") == []
+
+
+def test_sqlite_storage_search(tmp_path, fixtures_dir):
+    sstore = _migrate_fixture(fixtures_dir, tmp_path)
+
+    docs = sstore.search("Chicago", limit=2)
+    assert len(docs) == 2
+    for chunk in docs:
+        assert "chicago" in chunk.text.lower()
+
+    assert sstore.search("") == []
@@ -1,3 +1,5 @@
+import json
+
 from sidecar.references import storage
 from sidecar.references.schemas import (
     Author,
@@ -6,6 +8,9 @@ from sidecar.references.schemas import (
     Reference,
     ReferencePatch,
 )
+from sidecar.references.service import add_citation_keys_for_references
+
+from ..helpers import _copy_fixture_to_temp_dir
 
 
 def test_json_storage_load(fixtures_dir):
@@ -176,3 +181,315 @@ def test_storage_add_reference_to_initialize_storage(setup_project_storage):
     assert len(store.references) == 1
     assert store.references[0].id == "12345"
     assert store.filepath.exists()
+
+
+def test_get_references_json_storage_is_cached(setup_project_references_json):
+    user_id, project_id = "user1", "project1"
+
+    # test: repeated reads of an unchanged project
+    # expect: the same storage object is returned without reloading
+    store = storage.get_references_json_storage(user_id, project_id)
+    assert storage.get_references_json_storage(user_id, project_id) is store
+
+    # test: writes made through the cached storage object
+    # expect: the cached object stays valid and reflects the write
+    generation = store.generation
+    ref = Reference(
+        id="cached-ref",
+        status=IngestStatus.COMPLETE,
+        chunks=[Chunk(text="some new chunk")],
+    )
+    store.add_reference(ref)
+
+    assert store.generation == generation + 1
+    assert storage.get_references_json_storage(user_id, project_id) is store
+    assert store.chunks[-1].text == "some new chunk"
+
+    store.delete(reference_ids=["cached-ref"])
+    assert storage.get_references_json_storage(user_id, project_id) is store
+    assert "some new chunk" not in store.corpus
+
+    # test: references.json is written by something else (e.g. ingestion)
+    # expect: the storage is reloaded from disk
+    with open(setup_project_references_json, "w") as f:
+        f.write("[]")
+
+    reloaded = storage.get_references_json_storage(user_id, project_id)
+    assert reloaded is not store
+    assert len(reloaded.references) == 0
+
+
+def test_storage_cache_evicts_least_recently_used(tmp_path, fixtures_dir):
+    size = (fixtures_dir / "data" / "references.json").stat().st_size
+    cache = storage.StorageCache(max_bytes=2 * size)
+
+    paths = {}
+    for project_id in ["a", "b", "c"]:
+        paths[project_id] = tmp_path / project_id / "references.json"
+        _copy_fixture_to_temp_dir(
+            fixtures_dir / "data" / "references.json", paths[project_id]
+        )
+
+    store_a = cache.get("user1", "a", paths["a"])
+    store_b = cache.get("user1", "b", paths["b"])
+
+    # touch `a` so that `b` becomes the least recently used entry
+    assert cache.get("user1", "a", paths["a"]) is store_a
+
+    _ = cache.get("user1", "c", paths["c"])
+
+    assert cache.size <= cache.max_bytes
+    assert cache.get("user1", "a", paths["a"]) is store_a
+    assert cache.get("user1", "b", paths["b"]) is not store_b
+
+
+def test_json_storage_logs_mutations(tmp_path, fixtures_dir):
+    savepath = tmp_path.joinpath("references.json")
+    _copy_fixture_to_temp_dir(fixtures_dir / "data" / "references.json", savepath)
+    snapshot = savepath.read_bytes()
+
+    jstore = storage.JsonStorage(filepath=savepath)
+    jstore.load()
+    first, second = [ref.id for ref in jstore.references]
+
+    # test: add, patch and delete references
+    # expect: the mutations are appended to the log, leaving the snapshot as is
+    jstore.add_reference(Reference(id="new-ref", status=IngestStatus.COMPLETE))
+    jstore.add_references(
+        [
+            Reference(id="batch-ref-1", status=IngestStatus.COMPLETE),
+            Reference(id="batch-ref-2", status=IngestStatus.COMPLETE),
+        ]
+    )
+    jstore.update(first, ReferencePatch(data={"citation_key": "reda2023"}))
+    jstore.delete(reference_ids=[second])
+
+    assert savepath.read_bytes() == snapshot
+    assert len(jstore.log.read()[0]) == 4
+
+    # test: reload the storage
+    # expect: the log is replayed on top of the snapshot
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    assert [ref.id for ref in reloaded.references] == [
+        first,
+        "new-ref",
+        "batch-ref-1",
+        "batch-ref-2",
+    ]
+    assert reloaded.references[0].citation_key == "reda2023"
+    assert len(reloaded.references[0].chunks) == 8
+
+    # test: a crash left a partially written record at the end of the log
+    # expect: the record is dropped and further records are still replayed
+    with open(jstore.log.filepath, "a") as f:
+        f.write('{"op": "delete", "ids": ["new-')
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    reloaded.update("new-ref", ReferencePatch(data={"title": "New title"}))
+
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    assert reloaded.get_reference("new-ref").title == "New title"
+
+    # test: save the storage
+    # expect: the snapshot holds every reference and the log is cleared
+    reloaded.save()
+    assert not reloaded.log.exists()
+    jstore = storage.JsonStorage(filepath=savepath)
+    jstore.load()
+    assert [ref.id for ref in jstore.references] == [
+        first,
+        "new-ref",
+        "batch-ref-1",
+        "batch-ref-2",
+    ]
+
+
+def test_json_storage_citation_keys_are_stable(tmp_path, fixtures_dir):
+    savepath = tmp_path.joinpath("references.json")
+    _copy_fixture_to_temp_dir(fixtures_dir / "data" / "references.json", savepath)
+
+    jstore = storage.JsonStorage(filepath=savepath)
+    jstore.load()
+
+    smiths = [
+        Reference(
+            id=f"smith-{i}",
+            status=IngestStatus.COMPLETE,
+            authors=[Author(full_name="John Smith")],
+        )
+        for i in range(2)
+    ]
+    add_citation_keys_for_references(smiths, index=jstore.citation_key_index)
+    jstore.add_references(smiths)
+    assert [ref.citation_key for ref in smiths] == ["smith", "smitha"]
+
+    # test: edit the author of the first Reference
+    # expect: its key is unchanged and is not allocated again
+    jstore.update("smith-0", ReferencePatch(data={"authors": [{"full_name": "Jo Li"}]}))
+    assert jstore.get_reference("smith-0").citation_key == "smith"
+
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    another = Reference(
+        id="smith-2",
+        status=IngestStatus.COMPLETE,
+        authors=[Author(full_name="John Smith")],
+    )
+    add_citation_keys_for_references([another], index=reloaded.citation_key_index)
+    assert another.citation_key == "smithb"
+
+    # test: the index is out of sync with the references (e.g. it was deleted)
+    # expect: it is rebuilt from the references' keys
+    reloaded.add_reference(another)
+    reloaded.citation_keys_filepath.unlink()
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    assert set(reloaded.citation_key_index.keys) >= {"smith", "smitha", "smithb"}
+
+
+def test_json_storage_compacts_log(monkeypatch, tmp_path, fixtures_dir):
+    savepath = tmp_path.joinpath("references.json")
+    _copy_fixture_to_temp_dir(fixtures_dir / "data" / "references.json", savepath)
+    monkeypatch.setattr(storage, "REFERENCES_LOG_COMPACT_BYTES", 0)
+    monkeypatch.setattr(storage, "REFERENCES_LOG_COMPACT_RATIO", 0)
+
+    jstore = storage.JsonStorage(filepath=savepath)
+    jstore.load()
+    ref_id = jstore.references[0].id
+
+    # test: the log grows larger than the compaction threshold
+    # expect: it is folded into the snapshot in the background
+    jstore.update(ref_id, ReferencePatch(data={"citation_key": "reda2023"}))
+    jstore._compaction.result()
+
+    assert not jstore.log.exists()
+    assert jstore.is_current()
+
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    assert reloaded.references[0].citation_key == "reda2023"
+
+    # test: a crash after the snapshot was written but before the log was
+    # trimmed, i.e. the log replays records that are already in the snapshot
+    # expect: the references are unchanged
+    jstore.delete(reference_ids=[ref_id])
+    jstore._compaction.result()
+
+    records = [
+        {"op": "patch", "id": ref_id, "data": {"citation_key": "reda2023"}},
+        {"op": "delete", "ids": [ref_id]},
+    ]
+    with open(jstore.log.filepath, "w") as f:
+        f.writelines(json.dumps(record) + "\n" for record in records)
+
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    assert [ref.id for ref in reloaded.references] == [
+        ref.id for ref in jstore.references
+    ]
+
+
+def test_json_storage_compaction_keeps_newer_snapshot(
+    monkeypatch, tmp_path, fixtures_dir
+):
+    savepath = tmp_path.joinpath("references.json")
+    _copy_fixture_to_temp_dir(fixtures_dir / "data" / "references.json", savepath)
+
+    jstore = storage.JsonStorage(filepath=savepath)
+    jstore.load()
+    jstore.update(jstore.references[0].id, ReferencePatch(data={"title": "Old"}))
+
+    # test: the snapshot is saved through another storage object (e.g. by
+    # ingestion) while the references are being serialized for compaction
+    # expect: the newer snapshot is not overwritten
+    other = storage.JsonStorage(filepath=savepath)
+    other.load()
+    other.references[0].title = "New"
+
+    dumps = json.dumps
+
+    def save_while_serializing(*args, **kwargs):
+        monkeypatch.setattr(storage.json, "dumps", dumps)
+        other.save()
+        return dumps(*args, **kwargs)
+
+    monkeypatch.setattr(storage.json, "dumps", save_while_serializing)
+    jstore.compact()
+
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    assert reloaded.references[0].title == "New"
+
+    # test: compact the outdated storage object again
+    # expect: nothing is written, as it is no longer current
+    jstore.compact()
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    assert reloaded.references[0].title == "New"
+
+
+def test_json_storage_saves_indexes_lazily(tmp_path, fixtures_dir):
+    savepath = tmp_path.joinpath("references.json")
+    _copy_fixture_to_temp_dir(fixtures_dir / "data" / "references.json", savepath)
+
+    cache = storage.StorageCache()
+    jstore = cache.get("user1", "project1", savepath)
+    _ = jstore.bm25_index, jstore.vector_index, jstore.citation_key_index
+    index_files = {
+        path: path.read_bytes()
+        for path in [
+            jstore.index_filepath,
+            jstore.vector_index.metadata_filepath,
+            jstore.citation_keys_filepath,
+        ]
+    }
+
+    # test: add a reference
+    # expect: the indexes are updated in memory, and their files left as is
+    ref = Reference(
+        id="new-ref",
+        status=IngestStatus.COMPLETE,
+        citation_key="zebra2023",
+        chunks=[Chunk(text="Zebras are striped")],
+    )
+    jstore.add_reference(ref)
+
+    assert jstore.vector_index.search("striped zebras", n=1) == ["new-ref:0"]
+    for path, contents in index_files.items():
+        assert path.read_bytes() == contents
+
+    # test: the process stops before the indexes are saved
+    # expect: the indexes are brought in line with the references on load
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    assert reloaded.bm25_index.get_top_n(["zebras"], n=1) == ["new-ref:0"]
+    assert reloaded.vector_index.search("striped zebras", n=1) == ["new-ref:0"]
+    assert reloaded.citation_key_index.keys["zebra2023"] == "new-ref"
+
+    # test: flush the cache, e.g. on shutdown
+    # expect: the updated indexes are saved
+    cache.flush()
+    for path, contents in index_files.items():
+        assert path.read_bytes() != contents
+
+
+def test_vector_index_detects_changed_chunk_text(tmp_path, fixtures_dir):
+    savepath = tmp_path.joinpath("references.json")
+    _copy_fixture_to_temp_dir(fixtures_dir / "data" / "references.json", savepath)
+
+    jstore = storage.JsonStorage(filepath=savepath)
+    jstore.load()
+    jstore.vector_index.save()
+
+    # test: a reference's chunk texts change, keeping the number of chunks,
+    # and the storage is reloaded without the vector index being saved
+    # expect: the reference is re-embedded when the index is loaded
+    ref = jstore.references[0]
+    chunks = [Chunk(text="Giraffes are tall")] + ref.chunks[1:]
+    jstore.add_reference(ref.copy(update={"chunks": chunks}))
+
+    reloaded = storage.JsonStorage(filepath=savepath)
+    reloaded.load()
+    assert reloaded.vector_index.search("tall giraffes", n=1) == [f"{ref.id}:0"]
@@ -0,0 +1,208 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from sidecar.references import storage
+from sidecar.references.schemas import Chunk, IngestStatus, Reference, ReferencePatch
+from sidecar.references.vectors import HashingEmbedder, VectorIndex
+
+from ..helpers import _copy_fixture_to_temp_dir
+
+
+def _load_storage_copy(fixtures_dir, tmp_path) -> storage.JsonStorage:
+    write_path = tmp_path.joinpath(".storage", "references.json")
+    _copy_fixture_to_temp_dir(f"{fixtures_dir}/data/references.json", write_path)
+
+    jstore = storage.JsonStorage(filepath=write_path)
+    jstore.load()
+    return jstore
+
+
+def test_hashing_embedder_is_normalized_and_deterministic():
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(["Chicago is a city", "Chicago is a city", "the of"])
+
+    assert vectors.shape == (3, 64)
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors[0]), 1.0, rtol=1e-6)
+    np.testing.assert_array_equal(vectors[0], vectors[1])
+
+    # stopwords only: no features
+    assert not vectors[2].any()
+
+
+def test_vector_index_save_and_load(tmp_path, fixtures_dir):
+    jstore = _load_storage_copy(fixtures_dir, tmp_path)
+
+    index = VectorIndex(tmp_path)
+    index.build(jstore.references)
+    index.save()
+
+    loaded = VectorIndex(tmp_path)
+    loaded.load()
+
+    # vectors are memory-mapped from a single float32 matrix
+    assert isinstance(loaded.vectors, np.memmap)
+    assert loaded.vectors.shape == (len(jstore.chunks), loaded.embedder.dim)
+    assert loaded.doc_ids == index.doc_ids
+    assert not loaded.sync(jstore.references)
+    assert loaded.search("Chicago", n=3) == index.search("Chicago", n=3)
+
+
+def test_vector_index_keeps_vectors_if_save_fails(tmp_path, fixtures_dir):
+    jstore = _load_storage_copy(fixtures_dir, tmp_path)
+
+    index = VectorIndex(tmp_path)
+    index.build(jstore.references)
+    index.save()
+    expected = index.search("Chicago", n=3)
+
+    # test: replacing the memory-mapped vectors file fails
+    # expect: the error is raised, and the index still maps the previous file
+    with patch("sidecar.fileio.os.replace", side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            index.save()
+
+    assert isinstance(index.vectors, np.memmap)
+    assert index.search("Chicago", n=3) == expected
+
+
+def test_vector_index_appends_rows_in_place(tmp_path):
+    index = VectorIndex(tmp_path, embedder=HashingEmbedder(dim=16))
+
+    # test: add references one at a time
+    # expect: rows are appended to a buffer that grows by doubling, rather
+    # than copying the whole matrix on every add
+    buffers = set()
+    for i in range(100):
+        chunk = Chunk(text=f"reference {i} chunk")
+        index.add_reference(
+            Reference(id=f"ref{i}", status=IngestStatus.COMPLETE, chunks=[chunk])
+        )
+        buffers.add(id(index._buffer))
+        assert np.shares_memory(index.vectors, index._buffer)
+
+    assert index.vectors.shape == (100, 16)
+    assert len(buffers) <= 8
+    assert index.search("reference 42 chunk", n=1) == ["ref42:0"]
+
+    # test: remove a reference, then save
+    # expect: the rows are kept in place, and saved without temporary files
+    index.remove_reference(Reference(id="ref42", status=IngestStatus.COMPLETE))
+    assert np.shares_memory(index.vectors, index._buffer)
+    index.save()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "vectors.json",
+        "vectors.npy",
+    ]
+    loaded = VectorIndex(tmp_path, embedder=HashingEmbedder(dim=16))
+    loaded.load()
+    np.testing.assert_array_equal(loaded.vectors, index.vectors)
+    assert "ref42:0" not in loaded.doc_ids
+
+
+def test_vector_index_is_updated_incrementally(tmp_path, fixtures_dir):
+    jstore = _load_storage_copy(fixtures_dir, tmp_path)
+    assert jstore.vector_index.num_docs == len(jstore.chunks)
+
+    # test: add a reference
+    # expect: its chunks are the nearest neighbours, both in memory and on disk
+    # once the indexes are flushed
+    ref = Reference(
+        id="new-ref",
+        status=IngestStatus.COMPLETE,
+        chunks=[Chunk(text="Zebras are striped"), Chunk(text="Lions eat zebras")],
+    )
+    jstore.add_reference(ref)
+
+    assert jstore.vector_index.search("striped zebras", n=1) == ["new-ref:0"]
+
+    jstore.flush_indexes()
+    reloaded = VectorIndex(tmp_path.joinpath(".storage"))
+    reloaded.load()
+    assert reloaded.search("striped zebras", n=1) == ["new-ref:0"]
+
+    # test: update a reference's chunks
+    # expect: the reference is re-embedded when the index is next used
+    jstore.update(
+        "new-ref", ReferencePatch(data={"chunks": [{"text": "Giraffes are tall"}]})
+    )
+    jstore = storage.JsonStorage(filepath=jstore.filepath)
+    jstore.load()
+    assert jstore.vector_index.search("tall giraffes", n=1) == ["new-ref:0"]
+    assert jstore.vector_index.num_docs == len(jstore.chunks)
+
+    # test: delete a reference
+    # expect: its vectors are removed
+    jstore.delete(reference_ids=["new-ref"])
+    jstore.compact()
+
+    reloaded = VectorIndex(tmp_path.joinpath(".storage"))
+    reloaded.load()
+    assert "new-ref" not in reloaded.reference_signatures
+    assert reloaded.num_docs == len(jstore.chunks)
+
+
+def test_vector_index_ivf_search(tmp_path):
+    rng = np.random.default_rng(0)
+
+    # topics with mostly disjoint vocabularies, so that chunks form clusters
+    topics = [[f"topic{t}word{i}" for i in range(30)] for t in range(20)]
+    references = [
+        Reference(
+            id=f"ref{i}",
+            status=IngestStatus.COMPLETE,
+            chunks=[Chunk(text=" ".join(rng.choice(topics[i % len(topics)], size=20)))],
+        )
+        for i in range(2_000)
+    ]
+
+    index = VectorIndex(tmp_path, ivf_min_docs=1_000)
+    index.build(references)
+    index.save()
+
+    queries = [" ".join(rng.choice(topic, size=5)) for topic in topics]
+
+    # probing every cluster is exact search
+    index.nprobe = index.ivf.num_lists
+    for query in queries:
+        assert index.search(query, n=10) == index.search(query, n=10, exact=True)
+
+    # probing a few clusters finds most of the exact nearest neighbours
+    index.nprobe = 4
+    recall = np.mean(
+        [
+            len(set(index.search(q, n=10)) & set(index.search(q, n=10, exact=True)))
+            / 10
+            for q in queries
+        ]
+    )
+    assert recall >= 0.9
+
+    # the trained clusters are persisted with the vectors
+    loaded = VectorIndex(tmp_path, ivf_min_docs=1_000, nprobe=4)
+    loaded.load()
+    assert loaded._ivf is not None
+    assert all(loaded.search(q, n=10) == index.search(q, n=10) for q in queries)
+
+
+def test_vector_index_search_for_references(tmp_path, fixtures_dir):
+    jstore = _load_storage_copy(fixtures_dir, tmp_path)
+    index = jstore.vector_index
+    reference_id = jstore.references[1].id
+
+    # test: restricting the search to a subset of references
+    # expect: the exact ranking, without the chunks of other references
+    expected = [
+        (doc_id, score)
+        for doc_id, score in index.search_with_scores("Chicago", n=100, exact=True)
+        if doc_id.startswith(reference_id)
+    ][:3]
+    actual = index.search_with_scores("Chicago", n=3, reference_ids=[reference_id])
+    assert [doc_id for doc_id, _ in actual] == [doc_id for doc_id, _ in expected]
+    np.testing.assert_allclose(
+        [score for _, score in actual], [score for _, score in expected], rtol=1e-6
+    )
+
+    assert index.search("Chicago", reference_ids=["unknown"]) == []
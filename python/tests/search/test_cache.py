@@ -0,0 +1,45 @@
+from sidecar.search.cache import SearchCache
+from sidecar.search.schemas import S2SearchResult, SearchResponse
+from sidecar.typing import ResponseStatus
+
+
+def make_response(title: str) -> SearchResponse:
+    return SearchResponse(
+        status=ResponseStatus.OK,
+        message="",
+        results=[S2SearchResult(title=title, authors=["author1"])],
+    )
+
+
+def test_search_cache_evicts_least_recently_used():
+    cache = SearchCache(max_entries=2, ttl=60)
+    cache.put(("a", 10, ("title",)), make_response("a"))
+    cache.put(("b", 10, ("title",)), make_response("b"))
+
+    # test: using "a" makes "b" the least recently used entry
+    assert cache.get(("a", 10, ("title",))) is not None
+    cache.put(("c", 10, ("title",)), make_response("c"))
+
+    assert len(cache) == 2
+    assert cache.get(("b", 10, ("title",))) is None
+    assert cache.get(("a", 10, ("title",))).results[0].title == "a"
+
+
+def test_search_cache_expires_entries():
+    cache = SearchCache(max_entries=2, ttl=0)
+    cache.put(("a", 10, ("title",)), make_response("a"))
+
+    assert cache.get(("a", 10, ("title",))) is None
+    assert len(cache) == 0
+
+
+def test_search_cache_persists_to_disk(tmp_path):
+    filepath = tmp_path.joinpath("s2-cache.json")
+    cache = SearchCache(max_entries=2, ttl=60, filepath=filepath)
+    cache.put(("a", 10, ("title", "authors")), make_response("a"))
+
+    # test: a new cache (e.g. after a restart) reads the entries from disk
+    reloaded = SearchCache(max_entries=2, ttl=60, filepath=filepath)
+    response = reloaded.get(("a", 10, ("title", "authors")))
+
+    assert response == make_response("a")
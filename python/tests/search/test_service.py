@@ -1,5 +1,10 @@
 from datetime import datetime
+from types import SimpleNamespace
+
+from sidecar.search import service
+from sidecar.search.cache import SearchCache
 from sidecar.search.service import Searcher, search_s2
+from sidecar.typing import ResponseStatus
 
 
 def test_search(monkeypatch, mock_search_paper):
@@ -18,3 +23,58 @@ def test_search(monkeypatch, mock_search_paper):
     assert output["results"][1]["authors"][0] == "author1"
     assert output["results"][1]["authors"][1] == "author2"
     assert output["results"][1]["publicationDate"] == datetime(2022, 1, 1, 0, 0)
+
+
+class FakeS2Client:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def search_paper(self, query, limit, fields):
+        self.calls.append((query, limit, fields))
+        if self.fail:
+            raise RuntimeError("Too Many Requests")
+        return [
+            SimpleNamespace(
+                title=f"Paper {i}",
+                openAccessPdf={"url": f"https://paper{i}.pdf"},
+                authors=[{"name": "author1"}],
+            )
+            for i in range(limit)
+        ]
+
+
+def test_search_s2_reuses_client_and_caches_results(monkeypatch):
+    client = FakeS2Client()
+    monkeypatch.setattr(service, "_s2_client", client)
+    monkeypatch.setattr(service, "search_cache", SearchCache(max_entries=10, ttl=60))
+
+    # test: the same search, differing only in case and stopwords, twice
+    first = search_s2(query="Attention is all you need", limit=2)
+    second = search_s2(query="attention all you NEED", limit=2)
+
+    # expect: a single request to the API, with the normalized query
+    assert len(client.calls) == 1
+    assert client.calls[0][0] == "attention+need"
+    assert first == second
+    assert [r.title for r in second.results] == ["Paper 0", "Paper 1"]
+
+    # test: a different limit is a different search
+    third = search_s2(query="Attention is all you need", limit=3)
+    assert len(client.calls) == 2
+    assert len(third.results) == 3
+
+
+def test_search_s2_does_not_cache_errors(monkeypatch):
+    client = FakeS2Client(fail=True)
+    monkeypatch.setattr(service, "_s2_client", client)
+    monkeypatch.setattr(service, "search_cache", SearchCache(max_entries=10, ttl=60))
+
+    response = search_s2(query="attention")
+    assert response.status == ResponseStatus.ERROR
+
+    # expect: the failed search is retried
+    client.fail = False
+    response = search_s2(query="attention")
+    assert response.status == ResponseStatus.OK
+    assert len(client.calls) == 2
@@ -1,5 +1,8 @@
+import json
+from unittest.mock import patch
+
 from sidecar import config
-from sidecar.settings import schemas
+from sidecar.settings import schemas, service
 from sidecar.settings.service import (
     default_settings,
     get_settings_for_user,
@@ -67,3 +70,33 @@ def test_update_settings_for_user(monkeypatch, tmp_path, create_settings_json):
 
     # should be updated settings
     assert response.dict() == {**init_settings, "temperature": 100.0}
+
+
+def test_get_settings_for_user_is_cached(monkeypatch, tmp_path, create_settings_json):
+    monkeypatch.setattr(config, "WEB_STORAGE_URL", tmp_path)
+    user_id = "user1"
+
+    settings = get_settings_for_user(user_id)
+
+    # test: read unchanged settings again
+    # expect: settings.json is not read again
+    with patch.object(service.json, "load") as mocked:
+        assert get_settings_for_user(user_id) is settings
+    mocked.assert_not_called()
+
+    # test: update the settings
+    # expect: the update is returned without reading settings.json again
+    patch_ = schemas.FlatSettingsSchemaPatch(temperature=0.2)
+    with patch.object(service.json, "load") as mocked:
+        updated = update_settings_for_user(user_id, patch_)
+        assert get_settings_for_user(user_id) is updated
+    mocked.assert_not_called()
+    assert updated.temperature == 0.2
+
+    # test: settings.json is written by something else
+    # expect: it is read again
+    filepath = make_settings_json_path(user_id)
+    data = json.loads(filepath.read_text())
+    filepath.write_text(json.dumps({**data, "model": "another-model"}))
+
+    assert get_settings_for_user(user_id).model == "another-model"
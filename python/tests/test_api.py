@@ -0,0 +1,22 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from sidecar.api import LAZY_MODULES
+
+
+def test_api_import_does_not_load_lazy_modules():
+    # test: import the API as `main.py serve` does, in a fresh interpreter
+    # expect: slow-to-load dependencies are left for first use
+    code = (
+        "import sys, sidecar.api; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == ""
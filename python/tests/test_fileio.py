@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+
+import pytest
+from sidecar import fileio
+
+
+def test_atomic_write_json(tmp_path):
+    filepath = tmp_path / "settings.json"
+
+    fileio.atomic_write_json(filepath, {"a": 1})
+    assert json.loads(filepath.read_text()) == {"a": 1}
+
+    fileio.atomic_write(filepath, b'{"a": 2}')
+    assert json.loads(filepath.read_text()) == {"a": 2}
+
+
+def test_atomic_write_keeps_original_on_failure(monkeypatch, tmp_path):
+    filepath = tmp_path / "projects.json"
+    fileio.atomic_write_json(filepath, {"a": 1})
+
+    # test: the process fails before the new contents are in place
+    # expect: the original file is untouched and no temporary file is left
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        fileio.atomic_write_json(filepath, {"a": 2})
+
+    assert json.loads(filepath.read_text()) == {"a": 1}
+    assert os.listdir(tmp_path) == ["projects.json"]
+
+
+def test_atomic_open(tmp_path):
+    filepath = tmp_path / "vectors.npy"
+    filepath.write_bytes(b"old")
+
+    with fileio.atomic_open(filepath, "wb") as f:
+        f.write(b"new")
+    assert filepath.read_bytes() == b"new"
+
+    # test: the block fails while writing
+    # expect: the original file is untouched and no temporary file is left
+    with pytest.raises(ValueError):
+        with fileio.atomic_open(filepath, "wb") as f:
+            f.write(b"partial")
+            raise ValueError("not serializable")
+
+    assert filepath.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["vectors.npy"]
+
+
+def test_file_lock_serializes_writers(tmp_path):
+    filepath = tmp_path / "counter.json"
+    fileio.atomic_write_json(filepath, {"count": 0})
+
+    def increment():
+        for _ in range(20):
+            with fileio.file_lock(filepath):
+                count = json.loads(filepath.read_text())["count"]
+                fileio.atomic_write_json(filepath, {"count": count + 1})
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert json.loads(filepath.read_text()) == {"count": 80}
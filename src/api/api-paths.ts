@@ -13,7 +13,14 @@ import {
   FlatSettingsSchema,
   FlatSettingsSchemaPatch,
   FolderEntry,
+  FusionMethod,
   HTTPValidationError,
+  IngestBatchItem,
+  IngestBatchItemStatus,
+  IngestBatchRequest,
+  IngestBatchResult,
+  IngestJob,
+  IngestJobStatus,
   IngestMetadataRequest,
   IngestRequestType,
   IngestResponse,
@@ -28,7 +35,9 @@ import {
   Reference,
   ReferenceCreate,
   ReferencePatch,
+  ReferenceStatus,
   ResponseStatus,
+  RetrievalMode,
   RewriteChoice,
   RewriteMannerType,
   RewriteRequest,
@@ -108,21 +117,74 @@ export interface paths {
     delete: operations['delete_project_api_projects__project_id__delete'];
   };
   '/api/projects/{project_id}/files': {
-    /** Get Project Files */
+    /**
+     * Get Project Files
+     * @description Returns the project's files as a tree.
+     *
+     * Responses carry an `ETag`: if it is sent back in `If-None-Match` and the
+     * project's files have not changed since, the response is an empty
+     * `304 Not Modified`.
+     */
     get: operations['get_project_files_api_projects__project_id__files_get'];
   };
   '/api/references/{project_id}': {
     /**
      * List References
-     * @description Returns a list of references for the current user
+     * @description Returns a list of references for the current user.
+     *
+     * References are returned in pages of up to `limit` references: pass the
+     * `X-Next-Cursor` response header as `cursor` to get the next page.
+     * `fields` is a comma-separated list of the fields to return (`*` for all).
+     * By default, `contents` and `chunks` are left out.
+     *
+     * Responses carry an `ETag`: if it is sent back in `If-None-Match` and the
+     * project's references have not changed since, the response is an empty
+     * `304 Not Modified`.
      */
     get: operations['list_references_api_references__project_id__get'];
     /**
      * Ingest References
      * @description Creates references from a PDF directory or URL.
+     *
+     * Runs on the project's ingestion worker (see `POST /{project_id}/jobs`)
+     * and waits for it to finish, without blocking other requests.
+     * A PDF URL is downloaded before the worker is taken.
      */
     post: operations['ingest_references_api_references__project_id__post'];
   };
+  '/api/references/{project_id}/batch': {
+    /**
+     * Ingest References Batch
+     * @description Creates many references from metadata and PDF URLs, streaming the
+     * progress of each item as newline-delimited JSON (`IngestBatchResult`).
+     *
+     * PDFs are downloaded concurrently and their text extracted in parallel,
+     * then all references are created and persisted at once on the project's
+     * ingestion worker.
+     */
+    post: operations['ingest_references_batch_api_references__project_id__batch_post'];
+  };
+  '/api/references/{project_id}/jobs': {
+    /**
+     * Submit Ingest Job
+     * @description Starts ingesting the project's uploads in the background.
+     * Ingestion jobs for the same project run one at a time, in order.
+     */
+    post: operations['submit_ingest_job_api_references__project_id__jobs_post'];
+  };
+  '/api/references/{project_id}/jobs/{job_id}': {
+    /**
+     * Get Ingest Job
+     * @description Returns the status of an ingestion job and the progress of each file
+     */
+    get: operations['get_ingest_job_api_references__project_id__jobs__job_id__get'];
+    /**
+     * Cancel Ingest Job
+     * @description Cancels an ingestion job. References are only saved once ingestion has
+     * finished, so a cancelled job does not modify the project's references.
+     */
+    delete: operations['cancel_ingest_job_api_references__project_id__jobs__job_id__delete'];
+  };
   '/api/references/{project_id}/{reference_id}': {
     /** Http Get */
     get: operations['http_get_api_references__project_id___reference_id__get'];
@@ -168,11 +230,18 @@ export interface components {
     };
     /** ChatRequest */
     ChatRequest: {
+      /** @default rrf */
+      fusion?: FusionMethod;
       /** @default 1 */
       n_choices?: number;
+      reference_ids?: string[];
+      /** @default bm25 */
+      retrieval_mode?: RetrievalMode;
       /** @default 0.7 */
       temperature?: number;
       text: string;
+      /** @default 0.5 */
+      vector_weight?: number;
     };
     /** ChatResponse */
     ChatResponse: {
@@ -239,11 +308,64 @@ export interface components {
       name: string;
       path: string;
     };
+    /**
+     * FusionMethod
+     * @description An enumeration.
+     * @enum {string}
+     */
+    FusionMethod: 'rrf' | 'weighted';
     /** HTTPValidationError */
     HTTPValidationError: {
       /** Detail */
       detail?: ValidationError[];
     };
+    /** IngestBatchItem */
+    IngestBatchItem: {
+      metadata: ReferenceCreate;
+      url?: string;
+    };
+    /**
+     * IngestBatchItemStatus
+     * @description An enumeration.
+     * @enum {string}
+     */
+    IngestBatchItemStatus: 'fetched' | 'failure' | 'complete';
+    /** IngestBatchRequest */
+    IngestBatchRequest: {
+      items: IngestBatchItem[];
+    };
+    /**
+     * IngestBatchResult
+     * @description Progress of one item of an `IngestBatchRequest`, by its index in `items`.
+     * Items with a URL are reported as `fetched` or `failure` once downloaded,
+     * then every item is reported as `complete` with its Reference.
+     */
+    IngestBatchResult: {
+      index: number;
+      /** @default */
+      message?: string;
+      reference?: Reference;
+      status: IngestBatchItemStatus;
+    };
+    /**
+     * IngestJob
+     * @description A background ingestion of a project's uploads
+     */
+    IngestJob: {
+      /** @default [] */
+      files?: ReferenceStatus[];
+      job_id: string;
+      /** @default */
+      message?: string;
+      project_id: string;
+      status: IngestJobStatus;
+    };
+    /**
+     * IngestJobStatus
+     * @description An enumeration.
+     * @enum {string}
+     */
+    IngestJobStatus: 'queued' | 'running' | 'complete' | 'failed' | 'cancelled';
     /** IngestMetadataRequest */
     IngestMetadataRequest: {
       metadata: ReferenceCreate;
@@ -315,8 +437,11 @@ export interface components {
       /** @default [] */
       chunks?: Chunk[];
       citation_key?: string;
+      content_hash?: string;
       contents?: string;
       doi?: string;
+      file_mtime_ns?: number;
+      file_size?: number;
       filepath?: string;
       id: string;
       /** @default {} */
@@ -351,12 +476,23 @@ export interface components {
     ReferencePatch: {
       data: Record<string, never>;
     };
+    /** ReferenceStatus */
+    ReferenceStatus: {
+      source_filename: string;
+      status: IngestStatus;
+    };
     /**
      * ResponseStatus
      * @description An enumeration.
      * @enum {string}
      */
     ResponseStatus: 'ok' | 'error';
+    /**
+     * RetrievalMode
+     * @description An enumeration.
+     * @enum {string}
+     */
+    RetrievalMode: 'bm25' | 'vector' | 'hybrid';
     /** RewriteChoice */
     RewriteChoice: {
       index: number;
@@ -766,7 +902,14 @@ export interface operations {
       };
     };
   };
-  /** Get Project Files */
+  /**
+   * Get Project Files
+   * @description Returns the project's files as a tree.
+   *
+   * Responses carry an `ETag`: if it is sent back in `If-None-Match` and the
+   * project's files have not changed since, the response is an empty
+   * `304 Not Modified`.
+   */
   get_project_files_api_projects__project_id__files_get: {
     parameters: {
       path: {
@@ -780,6 +923,10 @@ export interface operations {
           'application/json': ProjectFileTreeResponse;
         };
       };
+      /** @description The files have not changed (see `ETag`). */
+      304: {
+        content: never;
+      };
       /** @description Validation Error */
       422: {
         content: {
@@ -790,21 +937,40 @@ export interface operations {
   };
   /**
    * List References
-   * @description Returns a list of references for the current user
+   * @description Returns a list of references for the current user.
+   *
+   * References are returned in pages of up to `limit` references: pass the
+   * `X-Next-Cursor` response header as `cursor` to get the next page.
+   * `fields` is a comma-separated list of the fields to return (`*` for all).
+   * By default, `contents` and `chunks` are left out.
+   *
+   * Responses carry an `ETag`: if it is sent back in `If-None-Match` and the
+   * project's references have not changed since, the response is an empty
+   * `304 Not Modified`.
    */
   list_references_api_references__project_id__get: {
     parameters: {
+      query?: {
+        limit?: number;
+        cursor?: string;
+        fields?: string;
+      };
       path: {
         project_id: string;
       };
     };
     responses: {
-      /** @description Successful Response */
+      /** @description References, as a JSON array or, if requested with `Accept: application/x-ndjson`, streamed one per line. Only the requested `fields` of each reference are included. The `X-Next-Cursor` header is set if there are more pages. */
       200: {
         content: {
           'application/json': Reference[];
+          'application/x-ndjson': string;
         };
       };
+      /** @description The references have not changed (see `ETag`). */
+      304: {
+        content: never;
+      };
       /** @description Validation Error */
       422: {
         content: {
@@ -816,6 +982,10 @@ export interface operations {
   /**
    * Ingest References
    * @description Creates references from a PDF directory or URL.
+   *
+   * Runs on the project's ingestion worker (see `POST /{project_id}/jobs`)
+   * and waits for it to finish, without blocking other requests.
+   * A PDF URL is downloaded before the worker is taken.
    */
   ingest_references_api_references__project_id__post: {
     parameters: {
@@ -843,6 +1013,121 @@ export interface operations {
       };
     };
   };
+  /**
+   * Ingest References Batch
+   * @description Creates many references from metadata and PDF URLs, streaming the
+   * progress of each item as newline-delimited JSON (`IngestBatchResult`).
+   *
+   * PDFs are downloaded concurrently and their text extracted in parallel,
+   * then all references are created and persisted at once on the project's
+   * ingestion worker.
+   */
+  ingest_references_batch_api_references__project_id__batch_post: {
+    parameters: {
+      path: {
+        project_id: string;
+      };
+    };
+    requestBody: {
+      content: {
+        'application/json': IngestBatchRequest;
+      };
+    };
+    responses: {
+      /** @description The progress of each item, streamed one per line. */
+      200: {
+        content: {
+          'application/json': IngestBatchResult;
+          'application/x-ndjson': string;
+        };
+      };
+      /** @description Validation Error */
+      422: {
+        content: {
+          'application/json': HTTPValidationError;
+        };
+      };
+    };
+  };
+  /**
+   * Submit Ingest Job
+   * @description Starts ingesting the project's uploads in the background.
+   * Ingestion jobs for the same project run one at a time, in order.
+   */
+  submit_ingest_job_api_references__project_id__jobs_post: {
+    parameters: {
+      path: {
+        project_id: string;
+      };
+    };
+    responses: {
+      /** @description Successful Response */
+      200: {
+        content: {
+          'application/json': IngestJob;
+        };
+      };
+      /** @description Validation Error */
+      422: {
+        content: {
+          'application/json': HTTPValidationError;
+        };
+      };
+    };
+  };
+  /**
+   * Get Ingest Job
+   * @description Returns the status of an ingestion job and the progress of each file
+   */
+  get_ingest_job_api_references__project_id__jobs__job_id__get: {
+    parameters: {
+      path: {
+        project_id: string;
+        job_id: string;
+      };
+    };
+    responses: {
+      /** @description Successful Response */
+      200: {
+        content: {
+          'application/json': IngestJob;
+        };
+      };
+      /** @description Validation Error */
+      422: {
+        content: {
+          'application/json': HTTPValidationError;
+        };
+      };
+    };
+  };
+  /**
+   * Cancel Ingest Job
+   * @description Cancels an ingestion job. References are only saved once ingestion has
+   * finished, so a cancelled job does not modify the project's references.
+   */
+  cancel_ingest_job_api_references__project_id__jobs__job_id__delete: {
+    parameters: {
+      path: {
+        project_id: string;
+        job_id: string;
+      };
+    };
+    responses: {
+      /** @description Successful Response */
+      200: {
+        content: {
+          'application/json': IngestJob;
+        };
+      };
+      /** @description Validation Error */
+      422: {
+        content: {
+          'application/json': HTTPValidationError;
+        };
+      };
+    };
+  };
   /** Http Get */
   http_get_api_references__project_id___reference_id__get: {
     parameters: {
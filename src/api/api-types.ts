@@ -6,6 +6,20 @@
  */
 
 export type File = string;
+/**
+ * An enumeration.
+ *
+ * This interface was referenced by `ApiSchema`'s JSON-Schema
+ * via the `definition` "RetrievalMode".
+ */
+export type RetrievalMode = 'bm25' | 'vector' | 'hybrid';
+/**
+ * An enumeration.
+ *
+ * This interface was referenced by `ApiSchema`'s JSON-Schema
+ * via the `definition` "FusionMethod".
+ */
+export type FusionMethod = 'rrf' | 'weighted';
 /**
  * An enumeration.
  *
@@ -31,6 +45,20 @@ export type Location = (string | number)[];
 export type Message = string;
 export type ErrorType = string;
 export type Detail = ValidationError[];
+/**
+ * An enumeration.
+ *
+ * This interface was referenced by `ApiSchema`'s JSON-Schema
+ * via the `definition` "IngestBatchItemStatus".
+ */
+export type IngestBatchItemStatus = 'fetched' | 'failure' | 'complete';
+/**
+ * An enumeration.
+ *
+ * This interface was referenced by `ApiSchema`'s JSON-Schema
+ * via the `definition` "IngestJobStatus".
+ */
+export type IngestJobStatus = 'queued' | 'running' | 'complete' | 'failed' | 'cancelled';
 /**
  * An enumeration.
  *
@@ -74,6 +102,10 @@ export interface ChatRequest {
   text: string;
   n_choices?: number;
   temperature?: number;
+  retrieval_mode?: RetrievalMode & string;
+  fusion?: FusionMethod & string;
+  vector_weight?: number;
+  reference_ids?: string[];
 }
 /**
  * This interface was referenced by `ApiSchema`'s JSON-Schema
@@ -181,10 +213,9 @@ export interface ValidationError {
 }
 /**
  * This interface was referenced by `ApiSchema`'s JSON-Schema
- * via the `definition` "IngestMetadataRequest".
+ * via the `definition` "IngestBatchItem".
  */
-export interface IngestMetadataRequest {
-  type?: IngestRequestType & string;
+export interface IngestBatchItem {
   metadata: ReferenceCreate;
   url?: string;
 }
@@ -206,11 +237,23 @@ export interface ReferenceCreate {
 }
 /**
  * This interface was referenced by `ApiSchema`'s JSON-Schema
- * via the `definition` "IngestResponse".
+ * via the `definition` "IngestBatchRequest".
  */
-export interface IngestResponse {
-  project_name: string;
-  references: Reference[];
+export interface IngestBatchRequest {
+  items: IngestBatchItem[];
+}
+/**
+ * Progress of one item of an `IngestBatchRequest`, by its index in `items`.
+ * Items with a URL are reported as `fetched` or `failure` once downloaded,
+ * then every item is reported as `complete` with its Reference.
+ *
+ * This interface was referenced by `ApiSchema`'s JSON-Schema
+ * via the `definition` "IngestBatchResult".
+ */
+export interface IngestBatchResult {
+  index: number;
+  status: IngestBatchItemStatus;
+  reference?: Reference;
   message?: string;
 }
 /**
@@ -233,6 +276,48 @@ export interface Reference {
   authors?: Author[];
   chunks?: Chunk[];
   metadata?: {};
+  content_hash?: string;
+  file_size?: number;
+  file_mtime_ns?: number;
+}
+/**
+ * A background ingestion of a project's uploads
+ *
+ * This interface was referenced by `ApiSchema`'s JSON-Schema
+ * via the `definition` "IngestJob".
+ */
+export interface IngestJob {
+  job_id: string;
+  project_id: string;
+  status: IngestJobStatus;
+  files?: ReferenceStatus[];
+  message?: string;
+}
+/**
+ * This interface was referenced by `ApiSchema`'s JSON-Schema
+ * via the `definition` "ReferenceStatus".
+ */
+export interface ReferenceStatus {
+  source_filename: string;
+  status: IngestStatus;
+}
+/**
+ * This interface was referenced by `ApiSchema`'s JSON-Schema
+ * via the `definition` "IngestMetadataRequest".
+ */
+export interface IngestMetadataRequest {
+  type?: IngestRequestType & string;
+  metadata: ReferenceCreate;
+  url?: string;
+}
+/**
+ * This interface was referenced by `ApiSchema`'s JSON-Schema
+ * via the `definition` "IngestResponse".
+ */
+export interface IngestResponse {
+  project_name: string;
+  references: Reference[];
+  message?: string;
 }
 /**
  * This interface was referenced by `ApiSchema`'s JSON-Schema